@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
-import os, dj_database_url
+import os, sys, dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,8 +58,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'pages.middleware.RequestMetricsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'pages.middleware.CurrentUserMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -66,11 +69,31 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Sessions are read from the cache and only go to the database on a miss or a write
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+# Request metrics (pages.middleware.RequestMetricsMiddleware)
+# Fraction of requests to measure, 1.0 = all of them, 0 = off
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get("REQUEST_METRICS_SAMPLE_RATE", "1.0"))
+# Log requests slower than this many ms or with at least this many queries
+REQUEST_METRICS_SLOW_MS = float(os.environ.get("REQUEST_METRICS_SLOW_MS", "500"))
+REQUEST_METRICS_SLOW_QUERIES = int(os.environ.get("REQUEST_METRICS_SLOW_QUERIES", "50"))
+# Login and register hash a password on purpose (~500ms with the default PBKDF2 cost), they get their own limit
+REQUEST_METRICS_LOGIN_SLOW_MS = float(os.environ.get("REQUEST_METRICS_LOGIN_SLOW_MS", "2000"))
+# Send the Server-Timing header (shows up in the browser dev tools network tab)
+REQUEST_METRICS_HEADER = os.environ.get("REQUEST_METRICS_HEADER", "True").lower() == "true"
+
+# Route the dashboard, manage homes and JSON API to the async views in pages/async_views.py.
+# They only pay off under ASGI, so they're off unless gunicorn.conf.py serves the app with uvicorn workers.
+# Under WSGI (runserver, gthread) every async view gets its own event loop and its queries still run one at a time
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False").lower() == "true"
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Stock DjangoTemplates plus render timing for RequestMetricsMiddleware
+        'BACKEND': 'pages.template_backends.TimedDjangoTemplates',
         "DIRS": [BASE_DIR / "pages" / "templates"],  
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,13 +116,94 @@ TAILWIND_APP_NAME = "theme"
 
 
 
+# Persistent connections don't work under ASGI (every request runs its queries on a fresh thread and
+# leaves a connection behind), gunicorn.conf.py sets DB_CONN_MAX_AGE=0 when it serves ASGI
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get("DATABASE_URL"),
-        conn_max_age=600
+        conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", "600"))
     )
 }
 
+# Cache
+# Sessions (cached_db), the current user and home (pages/current.py) and the summary versions (pages/summary.py)
+# all live here, so every worker has to see the same cache: a logout or a bump in one worker's local memory
+# never reaches the others. Set REDIS_URL (redis://cache:6379/0 with the compose cache service).
+# Local memory is only for a single process: DEBUG, tests, or LOCAL_CACHE=True for one worker on purpose.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ["REDIS_URL"],
+        }
+    }
+else:
+    if not (DEBUG or sys.argv[1:2] == ["test"] or os.environ.get("LOCAL_CACHE", "False").lower() == "true"):
+        raise ImproperlyConfigured(
+            "REDIS_URL is not set. Every worker needs the same cache for sessions and cached pages, "
+            "set LOCAL_CACHE=True only when a single process serves the site."
+        )
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Email (reminder digests). Prints to the console unless an SMTP server is configured
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", "25"))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "False").lower() == "true"
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "Upkeep <reminders@upkeep.local>")
+
+# Delta sync (pages/sync.py). Deletes are remembered this long, older sync tokens need a full sync
+SYNC_TOMBSTONE_DAYS = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "90"))
+
+# Analytics (pages/analytics.py). Read spend from the MonthlySpend rollup instead of summing every log.
+# Turn on after running refresh_analytics once, saved logs keep it current from then on
+ANALYTICS_ROLLUP = os.environ.get("ANALYTICS_ROLLUP", "False").lower() == "true"
+
+# Password hashing (pages/hashers.py). New hashes use the first hasher, the other one can still check
+# older hashes and they're upgraded on the next login (pages/logins.py). Raising the cost upgrades too.
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASHERS = sorted(
+    ["pages.hashers.PBKDF2PasswordHasher", "pages.hashers.ScryptPasswordHasher"],
+    key=lambda path: PASSWORD_HASHER not in path.lower(),
+)
+# Unset means Django's defaults (1,000,000+ PBKDF2 iterations, scrypt n=2**14)
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", "0")) or None
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get("PASSWORD_SCRYPT_WORK_FACTOR", "0")) or None
+
+# Login throttling (pages/logins.py): attempts per client IP and failed attempts per username per window
+LOGIN_RATE_WINDOW = int(os.environ.get("LOGIN_RATE_WINDOW", "300"))
+LOGIN_IP_LIMIT = int(os.environ.get("LOGIN_IP_LIMIT", "50"))
+LOGIN_USERNAME_LIMIT = int(os.environ.get("LOGIN_USERNAME_LIMIT", "5"))
+# Only behind a proxy that sets X-Forwarded-For (Render does), otherwise clients could pick their own IP
+LOGIN_TRUST_X_FORWARDED_FOR = os.environ.get("LOGIN_TRUST_X_FORWARDED_FOR", "False").lower() == "true"
+
+# Part price refresh (pages/prices.py, manage.py refresh_prices). Prices older than PRICE_REFRESH_DAYS are
+# re-read from the part's retail_url, at most PRICE_FETCH_CONCURRENCY pages at once and PRICE_HOST_RATE
+# requests per second to any one site. PRICE_FETCHER is the class that downloads the pages.
+PRICE_REFRESH_DAYS = int(os.environ.get("PRICE_REFRESH_DAYS", "7"))
+PRICE_FETCH_CONCURRENCY = int(os.environ.get("PRICE_FETCH_CONCURRENCY", "16"))
+PRICE_HOST_RATE = float(os.environ.get("PRICE_HOST_RATE", "2"))
+PRICE_FETCH_RETRIES = int(os.environ.get("PRICE_FETCH_RETRIES", "2"))
+PRICE_FETCH_TIMEOUT = float(os.environ.get("PRICE_FETCH_TIMEOUT", "10"))
+PRICE_FETCHER = os.environ.get("PRICE_FETCHER", "pages.prices.HttpxFetcher")
+# Retail urls come from users, only public hosts are fetched. On for the local fixture shops (benchmark_prices)
+PRICE_FETCH_PRIVATE_HOSTS = os.environ.get("PRICE_FETCH_PRIVATE_HOSTS", "False").lower() == "true"
+
+# Background jobs (pages/jobs.py). On, post-write work is queued in the Job table for the run_jobs worker.
+# Off (nothing runs a worker on the free Render plan) it runs in the request right after the commit, except
+# purge_home, which is always queued for a scheduled run_jobs --burst --only purge_home (render.yaml).
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "False").lower() == "true"
+# Seconds a worker may hold a job before another worker can take it, unless the job sets its own
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get("JOB_VISIBILITY_TIMEOUT", "60"))
+# A failed job is retried JOB_RETRY_BACKOFF * 2**(attempts - 1) seconds later
+JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF", "5"))
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -135,3 +239,18 @@ STATIC_URL = 'static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Send our app logs (slow request warnings etc.) to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'pages': {
+            'handlers': ['console'],
+            'level': os.environ.get("DJANGO_LOGLEVEL", "info").upper(),
+        },
+    },
+}
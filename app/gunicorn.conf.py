@@ -0,0 +1,35 @@
+import multiprocessing
+import os
+
+# Production server config, run from app/:  gunicorn -c gunicorn.conf.py
+# Serves ASGI with uvicorn workers by default so the async views (pages/async_views.py) don't tie up
+# a worker per request. GUNICORN_WORKER_CLASS=gthread serves the WSGI app with threads and the sync views instead.
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+asgi = "uvicorn" in worker_class
+wsgi_app = "backend.asgi:application" if asgi else "backend.wsgi:application"
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# One event loop per core is enough for ASGI, WSGI workers only serve `threads` requests at a time each
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", "1" if asgi else "4"))
+# Local memory isn't shared between workers. A summary version bumped in one of them (pages/summary.py) never
+# reaches the rest, which keep serving the old dashboard summary, portfolio rollup and calendar feed ETag
+if workers > 1 and not os.environ.get("REDIS_URL"):
+    raise RuntimeError(f"{workers} workers need a shared cache, set REDIS_URL (or WEB_CONCURRENCY=1).")
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so a slow leak can't grow forever, jittered so they don't all restart at once
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+if asgi:
+    # See DATABASES in settings.py
+    os.environ.setdefault("DB_CONN_MAX_AGE", "0")
+    # The async views are only worth it here, see ASYNC_VIEWS in settings.py
+    os.environ.setdefault("ASYNC_VIEWS", "True")
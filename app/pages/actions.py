@@ -0,0 +1,445 @@
+import uuid
+from datetime import date, datetime
+from functools import wraps
+
+from django.contrib import messages
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
+
+from . import deletion
+from .completion import MAX_COMPLETE_TASKS, log_completions, owned_tasks
+from .current import set_current_home
+from .feeds import new_feed
+from .jobs import enqueue
+from .models import Asset, Consumable, Home, HomeUserConnection, Log, Room, Task
+from .parts import catalog_part
+from .queries import dashboard_rooms
+from .summary import get_home_summary
+from .views import (
+    compute_next_due_date,
+    parse_cost,
+    parse_interval_count,
+    validate_asset_fields,
+    validate_home_fields,
+)
+
+# One small endpoint per form action (POST /pages/actions/<action>/) instead of the old dashboard/manage homes
+# dispatchers, which built every queryset and re-rendered the whole page for a single delete.
+# Each action only touches what it needs and answers in one of three ways:
+#   Accept: application/json          {"messages": [...], "html": "...", "remove": {...}, "options": [...], "reload": bool}
+#   X-Requested-With: fetch           just the HTML fragment (elements with an id replace the ones on the page)
+#   anything else (plain form post)   flash messages + redirect, so the pages still work without javascript
+# The forms are wired up by the data-inplace script in base.html.
+
+
+class Outcome:
+    """What an action did, before it's turned into a response."""
+
+    def __init__(self):
+        self.messages = []
+        self.status = 200
+        self.html = ""
+        self.data = {}
+
+    def success(self, text):
+        self.messages.append(("success", text))
+
+    def error(self, text, status=400):
+        self.messages.append(("error", text))
+        if status:
+            self.status = status
+
+    def render(self, request, template, context):
+        self.html += render_to_string(template, context, request=request)
+
+    def option(self, request, choices, value, label):
+        # New <option> for every select[data-options=<choices>] on the page
+        self.data.setdefault("options", []).append({"list": choices, "value": str(value), "label": label})
+        self.render(request, "partials/option.html", {"choices": choices, "value": value, "label": label})
+
+
+def wants_json(request):
+    return "application/json" in request.headers.get("Accept", "")
+
+
+def is_partial(request):
+    return wants_json(request) or request.headers.get("X-Requested-With") == "fetch"
+
+
+def to_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def respond(request, outcome, fallback):
+    # A reload shows the messages from the session like a normal page load would
+    if not is_partial(request) or outcome.data.get("reload"):
+        for level, text in outcome.messages:
+            messages.add_message(request, messages.ERROR if level == "error" else messages.SUCCESS, text)
+        if not is_partial(request):
+            return redirect(fallback)
+        outcome.messages = []
+
+    if wants_json(request):
+        payload = {"messages": [{"level": level, "text": text} for level, text in outcome.messages]}
+        payload.update(outcome.data)
+        if outcome.html:
+            payload["html"] = outcome.html
+        return JsonResponse(payload, status=outcome.status)
+    if outcome.status >= 400:
+        return HttpResponse(" ".join(text for _, text in outcome.messages), status=outcome.status, content_type="text/plain")
+    return HttpResponse(outcome.html, status=outcome.status)
+
+
+def action(fallback, needs_home=True):
+    """Wraps an action handler(request, outcome, user, home): POST only, logged in, and unless needs_home
+    is off the user has a current home. The user and home come from CurrentUserMiddleware."""
+    def decorator(handler):
+        @require_POST
+        @wraps(handler)
+        def view(request):
+            user = request.current_user()
+            if user is None:
+                if is_partial(request):
+                    outcome = Outcome()
+                    outcome.error("Please log in to continue.", status=401)
+                    return respond(request, outcome, "login")
+                messages.error(request, "Please log in to continue.")
+                return redirect("login")
+            outcome = Outcome()
+            home = request.current_home()
+            if home is None and needs_home:
+                outcome.error("Add a home first.", status=404)
+                return respond(request, outcome, "manage_homes")
+            handler(request, outcome, user, home)
+            return respond(request, outcome, fallback)
+        return view
+    return decorator
+
+
+def render_summary(request, outcome, home):
+    outcome.render(request, "partials/summary_stats.html", {"summary": get_home_summary(home)})
+
+
+@action("dashboard", needs_home=False)
+def switch_home(request, outcome, user, home):
+    home_id = to_uuid(request.POST.get("home_id"))
+    new_home = user.homes.filter(home_id=home_id).first() if home_id else None
+    if not new_home:
+        outcome.error("Home not found.", status=404)
+        return
+    set_current_home(request, new_home)
+    outcome.success("Switched home.")
+    # The whole page belongs to the current home
+    outcome.data["reload"] = True
+
+
+@action("dashboard")
+def delete_task(request, outcome, user, home):
+    task_id = to_uuid(request.POST.get("task_id"))
+    task = Task.objects.filter(home=home, task_id=task_id).first() if task_id else None
+    if not task:
+        outcome.error("Task was not found", status=404)
+        return
+    deletion.delete_task(task)
+    outcome.success("Task deleted.")
+    outcome.data["remove"] = {"task": str(task_id)}
+    render_summary(request, outcome, home)
+
+
+@action("dashboard")
+def delete_room(request, outcome, user, home):
+    room_id = to_uuid(request.POST.get("room_id"))
+    room = Room.objects.filter(home=home, room_id=room_id).first() if room_id else None
+    if not room:
+        outcome.error("Room was not found", status=404)
+        return
+    deletion.delete_room(room)
+    outcome.success("Room was deleted.")
+    # Rows of its assets, tasks and logs carry data-room too
+    outcome.data["remove"] = {"room": str(room_id)}
+    render_summary(request, outcome, home)
+
+
+@action("dashboard")
+def delete_asset(request, outcome, user, home):
+    asset_id = to_uuid(request.POST.get("asset_id"))
+    asset = Asset.objects.filter(room__home=home, asset_id=asset_id).first() if asset_id else None
+    if not asset:
+        outcome.error("Asset was not found", status=404)
+        return
+    room_id = asset.room_id
+    deletion.delete_asset(asset)
+    outcome.success("Asset was deleted")
+    outcome.data["remove"] = {"asset": str(asset_id)}
+    # The room row shows an asset count
+    room = dashboard_rooms(home).filter(room_id=room_id).first()
+    if room:
+        outcome.render(request, "partials/room_row.html", {"room": room})
+    render_summary(request, outcome, home)
+
+
+def read_home_fields(request):
+    return {
+        "name": request.POST.get("home_name", "").strip(),
+        "address": request.POST.get("home_address", "").strip(),
+        "city": request.POST.get("home_city", "").strip(),
+        "state": request.POST.get("home_state", "").strip(),
+        "zip_code": request.POST.get("home_zip", "").strip(),
+    }
+
+
+def check_home_fields(outcome, fields):
+    if not fields["name"]:
+        outcome.error("Home name is required.")
+        return False
+    errors = validate_home_fields(fields["state"], fields["zip_code"])
+    for message in errors:
+        outcome.error(message)
+    fields["state"] = fields["state"].upper()
+    return not errors
+
+
+@action("manage_homes")
+def update_home(request, outcome, user, home):
+    fields = read_home_fields(request)
+    if not check_home_fields(outcome, fields):
+        return
+    for name, value in fields.items():
+        setattr(home, name, value)
+    home.save(update_fields=[*fields, "updated_at"])
+    outcome.success("Home updated.")
+    # The header shows the home
+    outcome.data["reload"] = True
+
+
+@action("manage_homes", needs_home=False)
+def add_home(request, outcome, user, home):
+    fields = read_home_fields(request)
+    if not check_home_fields(outcome, fields):
+        return
+    new_home = Home.objects.create(**fields)
+    HomeUserConnection.objects.create(user=user, home=new_home)
+    set_current_home(request, new_home)
+    outcome.success("Home added and set as current.")
+    outcome.data["reload"] = True
+
+
+@action("manage_homes")
+def add_room(request, outcome, user, home):
+    name = request.POST.get("room_name", "").strip()
+    description = request.POST.get("room_description", "").strip()
+    if not name:
+        outcome.error("Room name is required.")
+        return
+    room = Room.objects.create(home=home, name=name, description=description)
+    outcome.success("Room added for you to organize.")
+    outcome.option(request, "rooms", room.room_id, room.name)
+
+
+def selected_room(request, home, field):
+    # The picked room, else the room the page was filtered to, else the first room of the home
+    rooms = Room.objects.filter(home=home)
+    for value in (request.POST.get(field), request.POST.get("return_room")):
+        room_id = to_uuid(value)
+        room = rooms.filter(room_id=room_id).first() if room_id else None
+        if room:
+            return room
+    return rooms.first()
+
+
+@action("manage_homes")
+def add_asset(request, outcome, user, home):
+    name = request.POST.get("asset_name", "").strip()
+    category = request.POST.get("asset_category", "general").strip().lower() # I fucked up the casing for this flow. Just lowercase everything
+    brand = request.POST.get("asset_brand", "").strip()
+    model_number = request.POST.get("asset_model_number", "").strip()
+    consumable_name = request.POST.get("consumable_name", "").strip()
+    consumable_part_number = request.POST.get("consumable_part_number", "").strip()
+    consumable_cost = request.POST.get("consumable_cost", "").strip()
+    consumable_interval = request.POST.get("consumable_interval", "").strip()
+    has_consumable = request.POST.get("asset_has_consumable") == "yes"
+    #just in case the user hits no after entering everything in, it still saves
+    if not has_consumable and any([consumable_name, consumable_part_number, consumable_cost, consumable_interval]):
+        has_consumable = True
+
+    room = selected_room(request, home, "asset_room")
+    errors = validate_asset_fields(
+        name,
+        category,
+        brand,
+        has_consumable,
+        consumable_name,
+        consumable_part_number,
+        consumable_cost,
+        consumable_interval,
+    )
+    if not room:
+        outcome.error("Room is required to place assets.")
+        return
+    if errors:
+        outcome.error(errors[0])
+        return
+
+    # All or nothing, an asset never shows up without the consumable and task that came with it
+    task = None
+    with transaction.atomic():
+        asset = Asset.objects.create(
+            name=name,
+            brand=brand,
+            model_number=model_number,
+            category=category,
+            room=room,
+        )
+        if category == "appliance" and has_consumable:
+            # Shared with everyone else who has this part, see parts.py
+            part = catalog_part(user, brand, model_number, consumable_part_number, parse_cost(consumable_cost))
+            consumable = Consumable.objects.create(name=consumable_name, asset=asset, details=part)
+            task = Task.objects.create(
+                name=f"Replace {consumable_name}",
+                interval=consumable_interval,
+                asset=asset,
+                room=room,
+                home=home,
+                consumable=consumable,
+                last_completed_date=date.today(),
+                next_due_date=compute_next_due_date(consumable_interval, date.today()),
+            )
+            # The occurrence window is written by the job worker (jobs.py)
+            enqueue("roll_forward", task_id=str(task.task_id))
+    outcome.option(request, "assets", asset.asset_id, asset.name)
+    if task:
+        outcome.option(request, "tasks", task.task_id, task.name)
+    outcome.success("Asset added to the room.")
+
+
+@action("manage_homes")
+def add_task(request, outcome, user, home):
+    name = request.POST.get("task_name", "").strip()
+    interval = request.POST.get("task_interval", "").strip()
+    interval_count = parse_interval_count(request.POST.get("task_interval_count"))
+    start_date_value = request.POST.get("task_start_date", "").strip()
+
+    # If somehow the request goes through without required data expose error
+    if not name or not start_date_value:
+        outcome.error("Task name and start date are required.")
+        return
+    try:
+        # converts string into datetime object and extracts just the date, not the time
+        start_date = datetime.fromisoformat(start_date_value).date()
+    except ValueError:
+        outcome.error("Start date could not be read.")
+        return
+    asset_id = to_uuid(request.POST.get("task_asset"))
+    asset = Asset.objects.filter(asset_id=asset_id, room__home=home).select_related("room").first() if asset_id else None
+    room = selected_room(request, home, "task_room")
+    if asset and not room:
+        room = asset.room
+
+    with transaction.atomic():
+        task = Task.objects.create(
+            name=name,
+            interval=interval,
+            interval_count=interval_count,
+            asset=asset,
+            room=room,
+            home=home,
+            last_completed_date=start_date,
+            next_due_date=compute_next_due_date(interval, start_date, interval_count),
+        )
+        enqueue("roll_forward", task_id=str(task.task_id))
+    outcome.success("Task created successfully.")
+    outcome.option(request, "tasks", task.task_id, task.name)
+
+
+@action("manage_homes")
+def add_log(request, outcome, user, home):
+    task_id = to_uuid(request.POST.get("log_task"))
+    task = Task.objects.filter(home=home, task_id=task_id).first() if task_id else None
+    if not task:
+        outcome.error("Pick a valid task for the log.")
+        return
+
+    cost = None
+    cost_value = request.POST.get("log_cost", "").strip()
+    if cost_value:
+        try:
+            cost = parse_cost(cost_value)
+        except ValueError:
+            # The log is still recorded, just without a cost
+            outcome.error("Cost could not be read :(", status=None)
+
+    # Convert the date string to a date object if provided
+    completion_date = None
+    completion_date_value = request.POST.get("log_completion_date")
+    if completion_date_value:
+        try:
+            completion_date = datetime.fromisoformat(completion_date_value).date()
+        except ValueError:
+            outcome.error("Completion date could not be read.")
+            return
+
+    with transaction.atomic():
+        log = Log.objects.create(task=task, completion_date=completion_date, cost=cost, notes=request.POST.get("log_notes", "").strip())
+        if log.completion_date:
+            task.last_completed_date = log.completion_date
+            task.next_due_date = compute_next_due_date(task.interval, log.completion_date, task.interval_count)
+            task.save(update_fields=["last_completed_date", "next_due_date", "updated_at"])
+            # Drop the occurrences this log completed and extend the window from the new due date
+            enqueue("roll_forward", task_id=str(task.task_id))
+    outcome.success("Log recorded for task. :)")
+    outcome.data["next_due_date"] = task.next_due_date
+
+
+@action("manage_homes")
+def complete_tasks(request, outcome, user, home):
+    task_ids = {to_uuid(value) for value in request.POST.getlist("task_ids")}
+    if not task_ids:
+        outcome.error("Pick the tasks that were done.")
+        return
+    # Big form posts already stop at DATA_UPLOAD_MAX_NUMBER_FIELDS, the JSON API takes full batches
+    if len(task_ids) > MAX_COMPLETE_TASKS:
+        outcome.error(f"At most {MAX_COMPLETE_TASKS} tasks at a time.")
+        return
+    tasks = owned_tasks(Task.objects.filter(home=home), task_ids)
+    if tasks is None:
+        outcome.error("Some of those tasks were not found.", status=404)
+        return
+
+    try:
+        completion_date = date.fromisoformat(request.POST.get("completion_date", ""))
+    except ValueError:
+        outcome.error("Completion date could not be read.")
+        return
+    cost = None
+    cost_value = request.POST.get("cost", "").strip()
+    if cost_value:
+        try:
+            cost = parse_cost(cost_value)
+        except ValueError:
+            outcome.error("Cost could not be read :(")
+            return
+
+    log_completions(tasks, completion_date, cost, request.POST.get("notes", "").strip())
+    outcome.success(f"Logged {len(tasks)} completed tasks. :)")
+    outcome.data["completed"] = len(tasks)
+
+
+@action("calendar", needs_home=False)
+def calendar_link(request, outcome, user, home):
+    scope = request.POST.get("scope")
+    if scope == "home" and home is None:
+        outcome.error("Add a home first.", status=404)
+        return
+    if scope not in ("all", "home"):
+        outcome.error("Pick a calendar.")
+        return
+    new_feed(user, home if scope == "home" else None)
+    outcome.success("New calendar link made, the old one (if there was one) no longer works.")
+    # The page shows the link
+    outcome.data["reload"] = True
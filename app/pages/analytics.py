@@ -0,0 +1,289 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, NullIf, TruncMonth
+from django.shortcuts import redirect, render
+
+from .api import ApiError, api_user, api_view, conditional_json, parse_uuid
+from .jobs import job
+from .models import Log, MonthlySpend, Task
+from .recurrence import DAY_STEPS, MONTH_STEPS, add_months
+
+# Spend and upkeep numbers for one home, or every home of the user with ?home=all.
+#   /pages/analytics/                         html page
+#   GET /pages/api/analytics/?home=&months=   the same numbers as JSON
+# Everything is a GROUP BY in the database (the answers are a handful of rows whatever the number of logs),
+# Python only fills in months without spend and works out the running total over those few rows.
+# Spend is read straight from Log, or from the MonthlySpend rollup (one row per task and month) when
+# ANALYTICS_ROLLUP is on. signals.py keeps the rollup current as logs are saved, refresh_analytics rebuilds it.
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 60
+TOP_ASSETS = 10
+TOP_CONSUMABLES = 10
+
+# How often a task comes around in a year, before dividing by interval_count (every 2 months = 12 / 2).
+# Four decimals also keeps SQLite from doing integer division on whole number costs.
+YEARLY_OCCURRENCES = {
+    **{interval: Decimal(12) / months for interval, months in MONTH_STEPS.items()},
+    **{interval: Decimal(365) / days for interval, days in DAY_STEPS.items()},
+}
+YEARLY_OCCURRENCES = {interval: rate.quantize(Decimal("0.0001")) for interval, rate in YEARLY_OCCURRENCES.items()}
+
+CENT = Decimal("0.01")
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+RATE = DecimalField(max_digits=9, decimal_places=4)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def first_month(months, today=None):
+    return add_months(month_start(today or date.today()), -(months - 1))
+
+
+def spend_rows(home_ids, since):
+    """The rows spend is summed over, with the expressions that sum them.
+    Both sources have a month and a task, so the groupings below work on either."""
+    if settings.ANALYTICS_ROLLUP:
+        rows = MonthlySpend.objects.filter(home_id__in=home_ids, month__gte=since)
+        return rows, Sum("total"), Sum("log_count")
+    rows = Log.objects.filter(
+        task__home_id__in=home_ids, completion_date__gte=since, cost__isnull=False
+    ).annotate(month=TruncMonth("completion_date"))
+    return rows, Sum("cost"), Count("pk")
+
+
+def grouped_spend(home_ids, since, *fields, limit=None, **expressions):
+    rows, spend, logs = spend_rows(home_ids, since)
+    grouped = rows.values(*fields, **expressions).annotate(spend=spend, logs=logs).order_by("-spend")
+    return list(grouped[:limit] if limit else grouped)
+
+
+def spend_by_home(home_ids, since):
+    # The rollup has its own home column (and can't have an annotation by that name)
+    if settings.ANALYTICS_ROLLUP:
+        return grouped_spend(home_ids, since, "home_id", home_name=F("home__name"))
+    return grouped_spend(home_ids, since, home_id=F("task__home_id"), home_name=F("task__home__name"))
+
+
+def spend_by_month(home_ids, since, today=None):
+    """Every month from since up to this one, months without spend included, with a running total."""
+    rows, spend, logs = spend_rows(home_ids, since)
+    totals = {row["month"]: row for row in rows.values("month").annotate(spend=spend, logs=logs).order_by()}
+    months = []
+    running = Decimal("0.00")
+    month = since
+    last = month_start(today or date.today())
+    while month <= last:
+        row = totals.get(month, {"spend": Decimal(0), "logs": 0})
+        # SQLite sums decimals as floats, back to cents
+        spend = row["spend"].quantize(CENT)
+        running += spend
+        months.append({"month": month, "spend": spend, "logs": row["logs"], "running_total": running})
+        month = add_months(month, 1)
+    return months
+
+
+def yearly_occurrences(today):
+    """Times a task comes around in the next twelve months, as a database expression."""
+    horizon = today + timedelta(days=365)
+    whens = [When(interval=interval, then=Value(rate)) for interval, rate in YEARLY_OCCURRENCES.items()]
+    # One time tasks only count if they're still ahead of us this year
+    whens.append(When(interval="", next_due_date__range=(today, horizon), then=Value(Decimal("1.0000"))))
+    per_year = Case(*whens, default=Value(Decimal("0.0000")), output_field=RATE)
+    return ExpressionWrapper(per_year / F("interval_count"), output_field=RATE)
+
+
+def consumable_projection(home_ids, today=None):
+    """What the consumables of these homes will cost over the next twelve months at their estimated cost."""
+    today = today or date.today()
+    occurrences = yearly_occurrences(today)
+    cost = ExpressionWrapper(F("consumable__details__estimated_cost") * occurrences, output_field=MONEY)
+    tasks = Task.objects.filter(home_id__in=home_ids, consumable__isnull=False)
+    consumables = (
+        tasks.values(
+            "consumable_id",
+            "consumable__name",
+            "consumable__details__part_number",
+            "consumable__asset__name",
+            "consumable__details__estimated_cost",
+        )
+        .annotate(replacements=Sum(occurrences), projected=Sum(cost))
+        .order_by("-projected")
+    )
+    total = tasks.aggregate(projected=Sum(cost), replacements=Sum(occurrences))
+    return {
+        "total": round(total["projected"] or Decimal(0), 2),
+        "replacements": round(total["replacements"] or Decimal(0), 1),
+        "consumables": [
+            {
+                "consumable_id": row["consumable_id"],
+                "name": row["consumable__name"] or row["consumable__details__part_number"],
+                "asset": row["consumable__asset__name"],
+                "estimated_cost": row["consumable__details__estimated_cost"],
+                "replacements": round(row["replacements"] or Decimal(0), 1),
+                "projected": round(row["projected"] or Decimal(0), 2),
+            }
+            for row in consumables[:TOP_CONSUMABLES]
+        ],
+    }
+
+
+def overdue_rates(home_ids, today=None):
+    """Share of scheduled tasks that are past their due date, overall and per home, room and category."""
+    today = today or date.today()
+    tasks = Task.objects.filter(home_id__in=home_ids, next_due_date__isnull=False)
+    counts = {
+        "tasks": Count("pk"),
+        "overdue": Count("pk", filter=Q(next_due_date__lt=today)),
+        # No scheduled tasks is a NULL rate rather than a division by zero (Postgres raises on that)
+        "rate": Cast(Count("pk", filter=Q(next_due_date__lt=today)), FloatField()) / NullIf(Count("pk"), 0),
+    }
+    overall = tasks.aggregate(**counts)
+    overall["rate"] = overall["rate"] or 0
+    return {
+        "overall": overall,
+        "by_home": list(tasks.values("home_id", home_name=F("home__name")).annotate(**counts).order_by("-rate")),
+        "by_room": list(tasks.values("room_id", room_name=F("room__name")).annotate(**counts).order_by("-rate")),
+        "by_category": list(tasks.values(category=F("asset__category")).annotate(**counts).order_by("-rate")),
+    }
+
+
+def home_analytics(home_ids, months=DEFAULT_MONTHS, today=None):
+    today = today or date.today()
+    since = first_month(months, today)
+    series = spend_by_month(home_ids, since, today)
+    return {
+        "since": since,
+        "spend": series[-1]["running_total"],
+        "months": series,
+        "by_home": spend_by_home(home_ids, since),
+        "by_room": grouped_spend(home_ids, since, room_id=F("task__room_id"), room_name=F("task__room__name")),
+        "by_asset": grouped_spend(
+            home_ids, since, limit=TOP_ASSETS, asset_id=F("task__asset_id"), asset_name=F("task__asset__name")
+        ),
+        "projection": consumable_projection(home_ids, today),
+        "overdue": overdue_rates(home_ids, today),
+    }
+
+
+def parse_months(value):
+    try:
+        return max(1, min(int(value or DEFAULT_MONTHS), MAX_MONTHS))
+    except ValueError:
+        return None
+
+
+def requested_homes(request, user):
+    """The home ids ?home= asks for: one of the user's homes, "all" of them, or the current home."""
+    value = request.GET.get("home")
+    if value == "all":
+        return list(user.homes.values_list("home_id", flat=True))
+    if value:
+        home_id = parse_uuid(value, "home")
+        return [home_id] if user.homes.filter(pk=home_id).exists() else []
+    home = request.current_home()
+    return [home.home_id] if home else []
+
+
+def analytics_view(request):
+    user = request.current_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    try:
+        home_ids = requested_homes(request, user)
+    except ApiError:
+        home_ids = []
+    if not home_ids:
+        messages.info(request, "Add a home to get started.")
+        return redirect("manage_homes")
+    months = parse_months(request.GET.get("months")) or DEFAULT_MONTHS
+    context = {
+        "analytics": home_analytics(home_ids, months),
+        "homes": user.homes.all(),
+        "selected_home": request.GET.get("home", ""),
+        "months": months,
+    }
+    return render(request, "analytics.html", context)
+
+
+@api_view
+def analytics_api(request):
+    if request.method != "GET":
+        raise ApiError("Method not allowed.", status=405)
+    user = api_user(request)
+    home_ids = requested_homes(request, user)
+    if not home_ids:
+        raise ApiError("Not found.", status=404)
+    months = parse_months(request.GET.get("months"))
+    if months is None:
+        raise ApiError("months must be a number.")
+    return conditional_json(request, home_analytics(home_ids, months))
+
+
+# The rollup. Saving a log recomputes the one task month it touched from the logs themselves, so the
+# row is right even if two saves race or a log moves between months.
+def month_range(month):
+    return month, add_months(month, 1) - timedelta(days=1)
+
+
+def refresh_monthly_spend(task_id, months, home_id=None):
+    for month in {month_start(day) for day in months if day}:
+        totals = Log.objects.filter(
+            task_id=task_id, completion_date__range=month_range(month), cost__isnull=False
+        ).aggregate(total=Sum("cost"), log_count=Count("pk"))
+        if totals["log_count"]:
+            if home_id is None:
+                home_id = Task.objects.filter(pk=task_id).values_list("home_id", flat=True).first()
+            MonthlySpend.objects.update_or_create(task_id=task_id, month=month, defaults={"home_id": home_id, **totals})
+        else:
+            MonthlySpend.objects.filter(task_id=task_id, month=month).delete()
+
+
+# Queued by signals.py as logs change, dates come as ISO strings
+@job("refresh_monthly_spend")
+def refresh_monthly_spend_job(task_id, months, home_id=None):
+    refresh_monthly_spend(task_id, [date.fromisoformat(month) for month in months if month], home_id)
+
+
+def rebuild_monthly_spend(home_ids=None, batch_size=2000):
+    """Throw away and recompute the rollup, for every home or just these. Returns the rows written."""
+    logs = Log.objects.filter(cost__isnull=False, completion_date__isnull=False)
+    rollup = MonthlySpend.objects.all()
+    if home_ids is not None:
+        logs = logs.filter(task__home_id__in=home_ids)
+        rollup = rollup.filter(home_id__in=home_ids)
+    rows = (
+        logs.annotate(month=TruncMonth("completion_date"))
+        .values("task_id", "task__home_id", "month")
+        .annotate(total=Sum("cost"), log_count=Count("pk"))
+        .order_by()
+    )
+    written = 0
+    with transaction.atomic():
+        rollup.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(
+                MonthlySpend(
+                    task_id=row["task_id"],
+                    home_id=row["task__home_id"],
+                    month=row["month"],
+                    total=row["total"],
+                    log_count=row["log_count"],
+                )
+            )
+            if len(batch) >= batch_size:
+                MonthlySpend.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        MonthlySpend.objects.bulk_create(batch)
+        written += len(batch)
+    return written
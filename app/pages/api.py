@@ -0,0 +1,697 @@
+import hashlib
+import json
+import uuid
+from datetime import date
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import ensure_csrf_cookie
+
+from .models import (
+    Asset,
+    BRAND_CHOICES,
+    CATEGORY_CHOICES,
+    Consumable,
+    Home,
+    HomeUserConnection,
+    INTERVAL_CHOICES,
+    Log,
+    Room,
+    Task,
+)
+from . import cursors
+from .cursors import encode_cursor
+from .deletion import delete_asset, delete_home, delete_room, delete_task
+from .jobs import enqueue
+from .parts import (
+    AUTOCOMPLETE_LIMIT,
+    DETAIL_FIELDS,
+    KEY_FIELDS,
+    MAX_AUTOCOMPLETE_LIMIT,
+    catalog_part,
+    change_part,
+    lookup_parts,
+    queue_price_check,
+)
+from .views import MAX_COST, compute_next_due_date, parse_cost, validate_home_fields
+
+# JSON API for the mobile client. Same session login as the html pages.
+#   GET    /pages/api/<resource>/             list (cursor paginated)
+#   POST   /pages/api/<resource>/             create
+#   GET    /pages/api/<resource>/<id>/        one row
+#   PATCH  /pages/api/<resource>/<id>/        update
+#   DELETE /pages/api/<resource>/<id>/        delete
+# Every list/detail is a single values() query, so the query count per endpoint doesn't grow with the data.
+# ?fields=a,b picks fields, ?limit=n sets the page size, ?cursor= comes from next_cursor of the previous page.
+# GET responses carry an ETag and answer If-None-Match with a 304.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.errors = message if isinstance(message, list) else [message]
+        self.status = status
+
+
+# Parsers for incoming json values. They get the raw value and return the python value or raise ApiError
+def parse_text(max_length=None):
+    def parse(value, name):
+        if value is None:
+            return ""
+        if not isinstance(value, str):
+            raise ApiError(f"{name} must be a string.")
+        value = value.strip()
+        if max_length and len(value) > max_length:
+            raise ApiError(f"{name} must be {max_length} characters or less.")
+        return value
+    return parse
+
+
+def parse_url(max_length=None):
+    # Only http(s), prices.py fetches these
+    text = parse_text(max_length)
+    validate = URLValidator(schemes=["http", "https"])
+    def parse(value, name):
+        value = text(value, name)
+        if value:
+            try:
+                validate(value)
+            except ValidationError:
+                raise ApiError(f"{name} must be an http or https url.")
+        return value
+    return parse
+
+
+def parse_choice(choices, lower=False):
+    values = {value.lower() if lower else value for value, _ in choices}
+    def parse(value, name):
+        if value is not None and not isinstance(value, str):
+            raise ApiError(f"{name} must be a string.")
+        value = (value or "").strip()
+        if lower:
+            value = value.lower()
+        if value and value not in values:
+            raise ApiError(f"{name} must be one of: {', '.join(sorted(values))}.")
+        return value
+    return parse
+
+
+def parse_date(value, name):
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"{name} must be a date (YYYY-MM-DD).")
+
+
+def parse_decimal(value, name):
+    # Only used for costs, rounded to cents and no bigger than the columns hold
+    if value in (None, ""):
+        return None
+    if isinstance(value, bool):
+        raise ApiError(f"{name} must be a number.")
+    try:
+        return parse_cost(value)
+    except ValueError:
+        raise ApiError(f"{name} must be a number between -{MAX_COST} and {MAX_COST}.")
+
+
+def parse_count(value, name):
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"{name} must be a whole number.")
+    if not 1 <= count <= 365:
+        raise ApiError(f"{name} must be between 1 and 365.")
+    return count
+
+
+def parse_uuid(value, name):
+    if value in (None, ""):
+        return None
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ApiError(f"{name} is not a valid id.")
+
+
+class Resource:
+    """One API resource. Subclasses say which rows the user may see, how fields map onto the ORM
+    and how writes are validated."""
+
+    model = None
+    # api field name -> orm path for values()
+    fields = {}
+    # ?<param>=<uuid> list filters, param -> orm lookup
+    filters = {}
+    # ?order=<name> keyset orderings besides the primary key, name -> orm path of a non null date
+    orderings = {}
+    # api field name -> parser, for POST/PATCH
+    writable = {}
+    # fields that must be present on POST
+    required = ()
+
+    @property
+    def pk(self):
+        return self.model._meta.pk.name
+
+    def queryset(self, user):
+        raise NotImplementedError
+
+    def values(self, queryset, names):
+        plain = [name for name in names if self.fields[name] == name]
+        renamed = {name: F(self.fields[name]) for name in names if self.fields[name] != name}
+        return queryset.values(*plain, **renamed)
+
+    def get_object(self, user, pk):
+        return self.queryset(user).filter(**{self.pk: pk}).first()
+
+    def parse(self, data, partial):
+        if not isinstance(data, dict):
+            raise ApiError("Request body must be a JSON object.")
+        unknown = set(data) - set(self.writable)
+        if unknown:
+            raise ApiError(f"Unknown or read only fields: {', '.join(sorted(unknown))}.")
+        if not partial:
+            missing = [name for name in self.required if data.get(name) in (None, "")]
+            if missing:
+                raise ApiError(f"Missing required fields: {', '.join(missing)}.")
+        return {name: self.writable[name](value, name) for name, value in data.items()}
+
+    def owned(self, queryset, pk, name, required=True):
+        # Foreign keys coming from the client have to point at something the user owns
+        if pk is None:
+            if required:
+                raise ApiError(f"{name} is required.")
+            return None
+        obj = queryset.filter(pk=pk).first()
+        if obj is None:
+            raise ApiError(f"{name} was not found.")
+        return obj
+
+    def create(self, user, values):
+        raise NotImplementedError
+
+    def update(self, user, instance, values):
+        for name, value in values.items():
+            setattr(instance, name, value)
+        self.validate(instance)
+        instance.save()
+        return instance
+
+    def validate(self, instance):
+        pass
+
+    def delete(self, user, instance):
+        instance.delete()
+
+
+class HomeResource(Resource):
+    model = Home
+    fields = {name: name for name in ("home_id", "name", "address", "city", "state", "zip_code")}
+    writable = {
+        "name": parse_text(128),
+        "address": parse_text(255),
+        "city": parse_text(128),
+        "state": parse_text(64),
+        "zip_code": parse_text(20),
+    }
+    required = ("name",)
+
+    def queryset(self, user):
+        return Home.objects.filter(users=user)
+
+    def validate(self, home):
+        if not home.name:
+            raise ApiError("Home name is required.")
+        errors = validate_home_fields(home.state, home.zip_code)
+        if errors:
+            raise ApiError(errors)
+        home.state = home.state.upper()
+
+    def create(self, user, values):
+        home = Home(**values)
+        self.validate(home)
+        home.save()
+        HomeUserConnection.objects.create(user=user, home=home)
+        return home
+
+    def delete(self, user, home):
+        delete_home(home)
+
+
+class RoomResource(Resource):
+    model = Room
+    fields = {name: name for name in ("room_id", "home_id", "name", "description")}
+    filters = {"home": "home_id"}
+    writable = {"home_id": parse_uuid, "name": parse_text(64), "description": parse_text()}
+    required = ("home_id", "name")
+
+    def queryset(self, user):
+        return Room.objects.filter(home__users=user)
+
+    def validate(self, room):
+        if not room.name:
+            raise ApiError("Room name is required.")
+
+    def create(self, user, values):
+        values["home"] = self.owned(Home.objects.filter(users=user), values.pop("home_id"), "home_id")
+        room = Room(**values)
+        self.validate(room)
+        room.save()
+        return room
+
+    def update(self, user, room, values):
+        if "home_id" in values:
+            values["home"] = self.owned(Home.objects.filter(users=user), values.pop("home_id"), "home_id")
+            # Its tasks, occurrences, spend and search entries are all filed under the home
+            if values["home"].pk != room.home_id:
+                raise ApiError("A room can't move to another home.")
+        return super().update(user, room, values)
+
+    def delete(self, user, room):
+        delete_room(room)
+
+
+class AssetResource(Resource):
+    model = Asset
+    fields = {name: name for name in ("asset_id", "room_id", "name", "brand", "model_number", "category")}
+    filters = {"home": "room__home_id", "room": "room_id"}
+    writable = {
+        "room_id": parse_uuid,
+        "name": parse_text(64),
+        "brand": parse_choice(BRAND_CHOICES),
+        "model_number": parse_text(64),
+        # The html form stores categories lowercased, keep doing the same
+        "category": parse_choice(CATEGORY_CHOICES, lower=True),
+    }
+    required = ("room_id", "name")
+
+    def queryset(self, user):
+        return Asset.objects.filter(room__home__users=user)
+
+    def validate(self, asset):
+        if not asset.name:
+            raise ApiError("Asset name is required.")
+        if asset.category == "appliance" and not asset.brand:
+            raise ApiError("Brand is required for appliances.")
+
+    def create(self, user, values):
+        values["room"] = self.owned(Room.objects.filter(home__users=user), values.pop("room_id"), "room_id")
+        values["category"] = values.get("category") or "general"
+        asset = Asset(**values)
+        self.validate(asset)
+        asset.save()
+        return asset
+
+    def update(self, user, asset, values):
+        if "room_id" in values:
+            values["room"] = self.owned(Room.objects.filter(home__users=user), values.pop("room_id"), "room_id")
+            # Same as rooms, only within its home
+            if values["room"].home_id != asset.room.home_id:
+                raise ApiError("An asset can't move to another home.")
+        return super().update(user, asset, values)
+
+    def delete(self, user, asset):
+        delete_asset(asset)
+
+
+class ConsumableResource(Resource):
+    model = Consumable
+    fields = {
+        "consumable_id": "consumable_id",
+        "asset_id": "asset_id",
+        "name": "name",
+        "part_number": "details__part_number",
+        "estimated_cost": "details__estimated_cost",
+        "retail_url": "details__retail_url",
+    }
+    filters = {"home": "asset__room__home_id", "asset": "asset_id"}
+    writable = {
+        "asset_id": parse_uuid,
+        "name": parse_text(64),
+        "part_number": parse_text(64),
+        "estimated_cost": parse_decimal,
+        "retail_url": parse_url(200),
+    }
+    required = ("asset_id",)
+    detail_fields = DETAIL_FIELDS
+
+    def queryset(self, user):
+        return Consumable.objects.filter(asset__room__home__users=user)
+
+    def create(self, user, values):
+        asset = self.owned(Asset.objects.filter(room__home__users=user), values.pop("asset_id"), "asset_id")
+        details = {name: values.pop(name) for name in self.detail_fields if name in values}
+        with transaction.atomic():
+            part = None
+            if details:
+                part = catalog_part(
+                    user,
+                    asset.brand,
+                    asset.model_number,
+                    details.get("part_number", ""),
+                    details.get("estimated_cost") or 0,
+                    details.get("retail_url", ""),
+                )
+            consumable = Consumable.objects.create(asset=asset, name=values.get("name", ""), details=part)
+            queue_price_check(part)
+        return consumable
+
+    def update(self, user, consumable, values):
+        if "asset_id" in values:
+            values["asset"] = self.owned(Asset.objects.filter(room__home__users=user), values.pop("asset_id"), "asset_id")
+        details = {name: values.pop(name) for name in self.detail_fields if name in values}
+        with transaction.atomic():
+            if details:
+                # Catalog rows are shared, a change can point the consumable at another row (parts.py)
+                values["details"] = change_part(user, consumable, values.get("asset", consumable.asset), details)
+                queue_price_check(values["details"])
+            super().update(user, consumable, values)
+        return consumable
+
+
+class TaskResource(Resource):
+    model = Task
+    fields = {name: name for name in (
+        "task_id", "home_id", "room_id", "asset_id", "consumable_id", "name", "interval",
+        "interval_count", "next_due_date", "last_completed_date",
+    )}
+    filters = {"home": "home_id", "room": "room_id", "asset": "asset_id"}
+    orderings = {"next_due_date": "next_due_date"}
+    writable = {
+        "home_id": parse_uuid,
+        "room_id": parse_uuid,
+        "asset_id": parse_uuid,
+        "name": parse_text(64),
+        "interval": parse_choice(INTERVAL_CHOICES),
+        "interval_count": parse_count,
+        "next_due_date": parse_date,
+        "last_completed_date": parse_date,
+    }
+    required = ("home_id", "name")
+
+    def queryset(self, user):
+        return Task.objects.filter(home__users=user)
+
+    def resolve_relations(self, user, values):
+        if "home_id" in values:
+            values["home"] = self.owned(Home.objects.filter(users=user), values.pop("home_id"), "home_id")
+        if "room_id" in values:
+            values["room"] = self.owned(Room.objects.filter(home__users=user), values.pop("room_id"), "room_id", required=False)
+        if "asset_id" in values:
+            values["asset"] = self.owned(
+                Asset.objects.filter(room__home__users=user), values.pop("asset_id"), "asset_id", required=False
+            )
+        return values
+
+    def validate(self, task):
+        if not task.name:
+            raise ApiError("Task name is required.")
+        # Each id is owned by the user on its own, they still have to be in the task's home
+        if task.room_id and task.room.home_id != task.home_id:
+            raise ApiError("room_id is not in that home.")
+        if task.asset_id and not Asset.objects.filter(pk=task.asset_id, room__home_id=task.home_id).exists():
+            raise ApiError("asset_id is not in that home.")
+
+    def create(self, user, values):
+        task = Task(**self.resolve_relations(user, values))
+        # Same as the add task form, the due date follows from the start date when it isn't given
+        if task.next_due_date is None and task.last_completed_date:
+            task.next_due_date = compute_next_due_date(task.interval, task.last_completed_date, task.interval_count)
+        self.validate(task)
+        with transaction.atomic():
+            task.save()
+            enqueue("roll_forward", task_id=str(task.task_id))
+        return task
+
+    def update(self, user, task, values):
+        with transaction.atomic():
+            super().update(user, task, self.resolve_relations(user, values))
+            enqueue("roll_forward", task_id=str(task.task_id))
+        return task
+
+    def delete(self, user, task):
+        delete_task(task)
+
+
+class LogResource(Resource):
+    model = Log
+    fields = {name: name for name in ("log_id", "task_id", "completion_date", "cost", "notes")}
+    filters = {"home": "task__home_id", "task": "task_id"}
+    orderings = {"completion_date": "completion_date"}
+    writable = {"task_id": parse_uuid, "completion_date": parse_date, "cost": parse_decimal, "notes": parse_text()}
+    required = ("task_id",)
+
+    def queryset(self, user):
+        return Log.objects.filter(task__home__users=user)
+
+    def create(self, user, values):
+        task = self.owned(Task.objects.filter(home__users=user), values.pop("task_id"), "task_id")
+        with transaction.atomic():
+            log = Log.objects.create(task=task, **values)
+            self.complete_task(log)
+        return log
+
+    def update(self, user, log, values):
+        if "task_id" in values:
+            values["task"] = self.owned(Task.objects.filter(home__users=user), values.pop("task_id"), "task_id")
+        moved = "task" in values or "completion_date" in values
+        with transaction.atomic():
+            super().update(user, log, values)
+            if moved:
+                self.complete_task(log)
+        return log
+
+    def complete_task(self, log):
+        # Same as the add log form, a completed log moves the task's due date
+        if not log.completion_date:
+            return
+        task = log.task
+        task.last_completed_date = log.completion_date
+        task.next_due_date = compute_next_due_date(task.interval, log.completion_date, task.interval_count)
+        task.save(update_fields=["last_completed_date", "next_due_date", "updated_at"])
+        enqueue("roll_forward", task_id=str(task.task_id))
+
+
+RESOURCES = {
+    "homes": HomeResource(),
+    "rooms": RoomResource(),
+    "assets": AssetResource(),
+    "consumables": ConsumableResource(),
+    "tasks": TaskResource(),
+    "logs": LogResource(),
+}
+
+
+def json_response(payload, status=200):
+    return JsonResponse(payload, status=status, encoder=DjangoJSONEncoder, json_dumps_params={"separators": (",", ":")})
+
+
+def conditional_json(request, payload):
+    # The ETag is a hash of the body. It doesn't save the query but it does save the transfer
+    response = json_response(payload)
+    etag = quote_etag(hashlib.sha1(response.content).hexdigest())
+    response["ETag"] = etag
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def decode_cursor(cursor):
+    try:
+        return cursors.decode_cursor(cursor)
+    except ValueError:
+        raise ApiError("Invalid cursor.")
+
+
+def requested_fields(request, resource):
+    value = request.GET.get("fields")
+    if not value:
+        return list(resource.fields)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}.")
+    # Always send the id so the client can match rows up
+    if resource.pk not in names:
+        names.insert(0, resource.pk)
+    return names
+
+
+def page_size(request):
+    try:
+        return max(1, min(int(request.GET.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        raise ApiError("limit must be a number.")
+
+
+def list_query(request, resource, user):
+    """The rows of one list page (plus one to tell if there's another) and the keys of its ordering."""
+    queryset = resource.queryset(user)
+    for param, lookup in resource.filters.items():
+        if request.GET.get(param):
+            queryset = queryset.filter(**{lookup: parse_uuid(request.GET[param], param)})
+
+    order = request.GET.get("order", "")
+    if order and order not in resource.orderings:
+        raise ApiError(f"order must be one of: {', '.join(resource.orderings) or 'nothing for this resource'}.")
+    pk = resource.pk
+    # Keyset: (order value, pk) > (last order value, last pk). Date orderings skip rows without that date.
+    keys = [pk]
+    if order:
+        path = resource.orderings[order]
+        queryset = queryset.filter(**{f"{path}__isnull": False})
+        keys = [path, pk]
+
+    if request.GET.get("cursor"):
+        last = decode_cursor(request.GET["cursor"])
+        if len(last) != len(keys):
+            raise ApiError("Cursor doesn't match this ordering.")
+        try:
+            last = cursors.cursor_values(resource.model, keys, last)
+        except ValueError:
+            raise ApiError("Invalid cursor.")
+        if None in last:
+            raise ApiError("Invalid cursor.")
+        if order:
+            queryset = queryset.filter(Q(**{f"{keys[0]}__gt": last[0]}) | Q(**{keys[0]: last[0], f"{pk}__gt": last[1]}))
+        else:
+            queryset = queryset.filter(**{f"{pk}__gt": last[0]})
+
+    names = requested_fields(request, resource)
+    limit = page_size(request)
+    queryset = resource.values(queryset.order_by(*keys), names)
+    if order:
+        # The sort date might not be one of the requested fields
+        queryset = queryset.annotate(cursor_key=F(keys[0]))
+    # One extra row tells us if there is another page
+    return queryset[: limit + 1], keys, limit
+
+
+def list_payload(rows, keys, limit):
+    ordered = len(keys) > 1
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last["cursor_key"], last[keys[-1]]] if ordered else [last[keys[0]]])
+    if ordered:
+        for row in rows:
+            del row["cursor_key"]
+    return {"results": rows, "next_cursor": next_cursor}
+
+
+def list_rows(request, resource, user):
+    queryset, keys, limit = list_query(request, resource, user)
+    return list_payload(list(queryset), keys, limit)
+
+
+def read_json(request):
+    try:
+        return json.loads(request.body or b"{}")
+    except ValueError:
+        raise ApiError("Request body must be valid JSON.")
+
+
+def api_user(request):
+    user = request.current_user()
+    if user is None:
+        raise ApiError("Please log in to continue.", status=401)
+    return user
+
+
+def api_view(view):
+    # Turns ApiError into a json error response. Works on the async views in async_views.py too
+    if iscoroutinefunction(view):
+        async def wrapper(request, *args, **kwargs):
+            try:
+                return await view(request, *args, **kwargs)
+            except ApiError as error:
+                return json_response({"errors": error.errors}, status=error.status)
+    else:
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as error:
+                return json_response({"errors": error.errors}, status=error.status)
+    wrapper.__name__ = view.__name__
+    return wrapper
+
+
+def get_resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(f"Unknown resource {name}.", status=404)
+    return resource
+
+
+@ensure_csrf_cookie
+@api_view
+def api_collection(request, resource):
+    resource = get_resource(resource)
+    user = api_user(request)
+    if request.method == "GET":
+        return conditional_json(request, list_rows(request, resource, user))
+    return write_collection(request, resource, user)
+
+
+@ensure_csrf_cookie
+@api_view
+def api_detail(request, resource, pk):
+    resource = get_resource(resource)
+    user = api_user(request)
+    if request.method == "GET":
+        row = resource.values(resource.queryset(user).filter(pk=pk), requested_fields(request, resource)).first()
+        if row is None:
+            raise ApiError("Not found.", status=404)
+        return conditional_json(request, row)
+    return write_detail(request, resource, user, pk)
+
+
+# Part number / model number autocomplete against the parts catalog (parts.py)
+@api_view
+def api_parts(request):
+    if request.method != "GET":
+        raise ApiError("Method not allowed.", status=405)
+    api_user(request)
+    field = request.GET.get("field", "part")
+    if field not in KEY_FIELDS:
+        raise ApiError("field must be part or model.")
+    brand = parse_choice(BRAND_CHOICES)(request.GET.get("brand", ""), "brand")
+    try:
+        limit = max(1, min(int(request.GET.get("limit", AUTOCOMPLETE_LIMIT)), MAX_AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be a number.")
+    return conditional_json(request, {"results": lookup_parts(request.GET.get("q", ""), field, brand, limit)})
+
+
+# The writes, shared with the async views (which run them on a thread, they're not the hot path)
+def write_collection(request, resource, user):
+    if request.method == "POST":
+        obj = resource.create(user, resource.parse(read_json(request), partial=False))
+        row = resource.values(resource.queryset(user).filter(pk=obj.pk), list(resource.fields)).first()
+        return json_response(row, status=201)
+    return json_response({"errors": ["Method not allowed."]}, status=405)
+
+
+def write_detail(request, resource, user, pk):
+    obj = resource.get_object(user, pk)
+    if obj is None:
+        raise ApiError("Not found.", status=404)
+    if request.method == "PATCH":
+        resource.update(user, obj, resource.parse(read_json(request), partial=True))
+        return json_response(resource.values(resource.queryset(user).filter(pk=pk), list(resource.fields)).first())
+    if request.method == "DELETE":
+        resource.delete(user, obj)
+        return HttpResponse(status=204)
+    return json_response({"errors": ["Method not allowed."]}, status=405)
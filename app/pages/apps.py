@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class PagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'pages'
\ No newline at end of file
+    name = 'pages'
+
+    def ready(self):
+        # Connects the cache invalidation receivers
+        from . import signals  # noqa: F401
+        # Register the background jobs (jobs.py), the worker doesn't load views or urls
+        from . import analytics, deletion, prices, recurrence  # noqa: F401
@@ -0,0 +1,162 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.csrf import ensure_csrf_cookie
+
+from .api import (
+    ApiError,
+    api_view,
+    conditional_json,
+    get_resource,
+    list_payload,
+    list_query,
+    requested_fields,
+    write_collection,
+    write_detail,
+)
+from .models import Asset, Room, Task
+from .queries import (
+    DashboardFilters,
+    dashboard_assets,
+    dashboard_rooms,
+    fetch,
+    keyset_result,
+    log_page_query,
+    task_page_query,
+)
+from .summary import abuild_summary, aget_home_summary
+from .views import PANELS, dashboard_context, manage_homes_context, no_home_redirect, panel_url
+
+# Async versions of the read heavy pages (dashboard, manage homes, the dashboard panels) and the JSON API,
+# routed instead of the views.py/api.py ones when ASYNC_VIEWS is on (urls.py). gunicorn.conf.py turns it on for ASGI.
+# Under ASGI (gunicorn with the uvicorn worker, see gunicorn.conf.py) a request waiting on the database
+# no longer holds a worker thread. The independent queries of a page are sent together with asyncio.gather.
+# Django still runs a request's queries one at a time on its connection, what gather buys is that the
+# event loop can serve other requests while they run, not parallel queries inside one request.
+# Templates are rendered on the request's sync thread so anything they load lazily still works.
+# Writes stay sync (actions.py, api.write_*), they're short and need transactions and signals.
+
+
+async def task_page(tasks, cursor=None):
+    return keyset_result(await fetch(task_page_query(tasks, cursor)), "next_due_date", "task_id")
+
+
+async def log_page(logs, cursor=None):
+    return keyset_result(await fetch(log_page_query(logs, cursor)), "completion_date", "log_id")
+
+
+async def dashboard_view(request):
+    user = await request.acurrent_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    home = await request.acurrent_home()
+    if home is None:
+        return no_home_redirect(request)
+
+    filters = DashboardFilters(request.GET)
+    rooms = dashboard_rooms(home)
+    assets = filters.assets(home)
+    tasks = filters.tasks(home)
+    summary = abuild_summary(rooms, assets, tasks) if filters.active else aget_home_summary(home)
+    homes, room_rows, asset_rows, summary, task_rows, log_rows = await asyncio.gather(
+        fetch(user.homes.all()),
+        fetch(rooms),
+        fetch(dashboard_assets(assets)),
+        summary,
+        task_page(tasks),
+        log_page(filters.logs(home)),
+    )
+    context = dashboard_context(
+        home,
+        filters,
+        homes=homes,
+        rooms=room_rows,
+        assets=asset_rows,
+        summary=summary,
+        tasks=task_rows,
+        logs=log_rows,
+    )
+    return await sync_to_async(render)(request, "dashboard.html", context)
+
+
+async def dashboard_panel_view(request, panel):
+    if await request.acurrent_user() is None:
+        return HttpResponse("Please log in to continue.", status=401, content_type="text/plain")
+    home = await request.acurrent_home()
+    if home is None:
+        return HttpResponse("Add a home first.", status=404, content_type="text/plain")
+    filters = DashboardFilters(request.GET)
+    template, name = PANELS[panel]
+    try:
+        if panel == "tasks":
+            rows, cursor = await task_page(filters.tasks(home), request.GET.get("cursor"))
+        else:
+            rows, cursor = await log_page(filters.logs(home), request.GET.get("cursor"))
+    except ValueError:
+        return HttpResponse("Invalid cursor.", status=400, content_type="text/plain")
+    context = {panel: rows, f"{panel}_more_url": panel_url(name, filters, cursor)}
+    return await sync_to_async(render)(request, template, context)
+
+
+async def manage_homes_view(request):
+    user = await request.acurrent_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    home = await request.acurrent_home()
+
+    homes, rooms, assets, tasks = await asyncio.gather(
+        fetch(user.homes.all()),
+        fetch(Room.objects.filter(home=home) if home else Room.objects.none()),
+        fetch(Asset.objects.filter(room__home=home) if home else Asset.objects.none()),
+        fetch(Task.objects.filter(home=home) if home else Task.objects.none()),
+    )
+    selected_room_id = request.GET.get("room", "all")
+    # Picked out of the rooms we already have instead of another query
+    selected_room = next((room for room in rooms if str(room.room_id) == selected_room_id), None)
+
+    context = manage_homes_context(
+        home,
+        homes=homes,
+        rooms=rooms,
+        selected_room=selected_room,
+        selected_room_id=selected_room_id,
+        assets=assets,
+        tasks=tasks,
+    )
+    return await sync_to_async(render)(request, "manage_homes.html", context)
+
+
+async def api_user(request):
+    user = await request.acurrent_user()
+    if user is None:
+        raise ApiError("Please log in to continue.", status=401)
+    return user
+
+
+@ensure_csrf_cookie
+@api_view
+async def api_collection(request, resource):
+    resource = get_resource(resource)
+    user = await api_user(request)
+    if request.method == "GET":
+        queryset, keys, limit = list_query(request, resource, user)
+        return conditional_json(request, list_payload(await fetch(queryset), keys, limit))
+    return await sync_to_async(write_collection)(request, resource, user)
+
+
+@ensure_csrf_cookie
+@api_view
+async def api_detail(request, resource, pk):
+    resource = get_resource(resource)
+    user = await api_user(request)
+    if request.method == "GET":
+        row = await resource.values(resource.queryset(user).filter(pk=pk), requested_fields(request, resource)).afirst()
+        if row is None:
+            raise ApiError("Not found.", status=404)
+        return conditional_json(request, row)
+    return await sync_to_async(write_detail)(request, resource, user, pk)
@@ -0,0 +1,76 @@
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from django.db import connection
+
+# Small helpers shared by the benchmark_* management commands.
+# Every benchmark writes the same JSON layout so runs can be compared across commits.
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest-rank percentile, good enough for a couple hundred samples
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class QueryCounter:
+    """execute_wrapper that counts queries. Unlike CaptureQueriesContext it works with DEBUG off
+    and isn't thrown off by request_started resetting connection.queries."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(fn, runs=20, warmup=2):
+    """Time fn() and report latency percentiles, query count and peak Python memory."""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Query capture and tracemalloc both slow things down, so they get their own runs
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        fn()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": counter.count,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def write_results(path, benchmark, results, label=""):
+    payload = {
+        "benchmark": benchmark,
+        "label": label,
+        "database": connection.vendor,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    with open(path, "w") as handle:
+        json.dump(payload, handle, indent=2, default=str)
+    return payload
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .api import ApiError, api_user, api_view, json_response, parse_date, parse_decimal, parse_text, parse_uuid, read_json
+from .jobs import enqueue
+from .models import Log, Task
+from .search import index_objects
+from .signals import queue_spend_refresh
+from .summary import bump_version
+from .views import compute_next_due_date
+
+# Completing many tasks at once (the quarterly filter swap across a building) with one shared date,
+# cost and notes, instead of one add log form per task.
+#   POST /pages/actions/complete-tasks/     form on manage homes (task_ids, completion_date, cost, notes)
+#   POST /pages/api/tasks/complete/         {"task_ids": [...], "completion_date": "2026-01-31", "cost": "12.50", "notes": ""}
+# One bulk_create for the logs and an UPDATE per new due date for the tasks, in a single transaction,
+# with the due dates worked out the same way as for a single log (compute_next_due_date).
+# Neither bulk_create nor update() send signals, so log_completions does what signals.py would have done:
+# bumps the home summaries, queues the analytics rollup, indexes the notes for search and moves the
+# occurrence windows on (one roll_forward_many job per chunk of tasks, see recurrence.py).
+
+MAX_COMPLETE_TASKS = 1000
+BATCH_SIZE = 500
+# name goes into the search entries of the logs
+TASK_FIELDS = ("task_id", "home_id", "name", "interval", "interval_count", "next_due_date", "last_completed_date")
+
+
+def log_completions(tasks, completion_date, cost=None, notes=""):
+    """Logs one completion per task and moves each to its next due date. Returns the new logs."""
+    tasks = list(tasks)
+    now = timezone.now()
+    logs = [Log(task=task, completion_date=completion_date, cost=cost, notes=notes) for task in tasks]
+    # With one completion date the next due date only depends on the schedule, so tasks on the same
+    # schedule share it. One UPDATE per due date is a lot cheaper than bulk_update's CASE per row
+    # (which Django spends most of its time building).
+    next_due = defaultdict(list)
+    for task in tasks:
+        task.last_completed_date = completion_date
+        task.next_due_date = compute_next_due_date(task.interval, completion_date, task.interval_count)
+        # update() skips auto_now, updated_at is what delta sync looks at
+        task.updated_at = now
+        next_due[task.next_due_date].append(task.task_id)
+    with transaction.atomic():
+        Log.objects.bulk_create(logs, batch_size=BATCH_SIZE)
+        if notes:
+            index_objects(logs, batch_size=BATCH_SIZE)
+        for next_due_date, task_ids in next_due.items():
+            for start in range(0, len(task_ids), BATCH_SIZE):
+                Task.objects.filter(task_id__in=task_ids[start : start + BATCH_SIZE]).update(
+                    last_completed_date=completion_date, next_due_date=next_due_date, updated_at=now
+                )
+        for home_id in {task.home_id for task in tasks if task.home_id}:
+            transaction.on_commit(lambda home_id=home_id: bump_version(home_id))
+        for start in range(0, len(tasks), BATCH_SIZE):
+            enqueue("roll_forward_many", task_ids=[str(task.task_id) for task in tasks[start : start + BATCH_SIZE]])
+        # Logs without a cost don't change any spend
+        if settings.ANALYTICS_ROLLUP and cost is not None:
+            for task in tasks:
+                queue_spend_refresh(task.task_id, completion_date, task.home_id)
+    return logs
+
+
+def owned_tasks(tasks, task_ids):
+    """The tasks with these ids out of `tasks`, None if any of them isn't there."""
+    task_ids = set(task_ids)
+    found = list(tasks.filter(task_id__in=task_ids).only(*TASK_FIELDS))
+    return found if len(found) == len(task_ids) else None
+
+
+@api_view
+def complete_tasks_api(request):
+    if request.method != "POST":
+        raise ApiError("Method not allowed.", status=405)
+    user = api_user(request)
+    data = read_json(request)
+    if not isinstance(data, dict):
+        raise ApiError("Request body must be a JSON object.")
+    task_ids = data.get("task_ids")
+    if not isinstance(task_ids, list) or not task_ids:
+        raise ApiError("task_ids must be a list of task ids.")
+    if len(task_ids) > MAX_COMPLETE_TASKS:
+        raise ApiError(f"At most {MAX_COMPLETE_TASKS} tasks at a time.")
+    completion_date = parse_date(data.get("completion_date"), "completion_date")
+    if completion_date is None:
+        raise ApiError("completion_date is required.")
+    tasks = owned_tasks(Task.objects.filter(home__users=user), {parse_uuid(value, "task_ids") for value in task_ids})
+    if tasks is None:
+        raise ApiError("Some tasks were not found.", status=404)
+    logs = log_completions(
+        tasks,
+        completion_date,
+        parse_decimal(data.get("cost"), "cost"),
+        parse_text()(data.get("notes"), "notes"),
+    )
+    return json_response(
+        {
+            "logs": [{"log_id": log.log_id, "task_id": log.task_id} for log in logs],
+            "tasks": [
+                {"task_id": task.task_id, "next_due_date": task.next_due_date, "last_completed_date": task.last_completed_date}
+                for task in tasks
+            ],
+        },
+        status=201,
+    )
@@ -0,0 +1,108 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .models import AppUser, Home, HomeUserConnection
+from .queries import parse_uuid_param
+
+# The logged in AppUser and their current Home, looked up at most once per request and memoized on it.
+# CurrentUserMiddleware hangs these on the request as request.current_user() / request.current_home()
+# (and acurrent_user() / acurrent_home() for async views), nothing is loaded until a view asks.
+# Both are also kept in Django's cache, so with the cached_db session backend a page that only needs to
+# know who is asking costs no queries at all. signals.py drops the cached copies when the rows change.
+# The current home is the session's home_id if the user is still connected to it, otherwise their first
+# home. A user without any home gets None, views send them to manage homes to add one.
+
+CURRENT_CACHE_TIMEOUT = 60 * 15
+
+
+def user_key(username):
+    return f"current-user:{username}"
+
+
+def home_key(home_id):
+    return f"current-home:{home_id}"
+
+
+def load_user(username):
+    key = user_key(username)
+    user = cache.get(key)
+    if user is None:
+        # The hash stays out of the cache, logins.authenticate reads it from the database
+        user = AppUser.objects.defer("password").filter(username=username).first()
+        if user is not None:
+            cache.set(key, user, CURRENT_CACHE_TIMEOUT)
+    return user
+
+
+def load_home(home_id):
+    """The home and the usernames connected to it, or (None, ())."""
+    key = home_key(home_id)
+    entry = cache.get(key)
+    if entry is None:
+        home = Home.objects.filter(pk=home_id).first()
+        if home is None:
+            return None, ()
+        usernames = tuple(HomeUserConnection.objects.filter(home=home).values_list("user_id", flat=True))
+        entry = (home, usernames)
+        cache.set(key, entry, CURRENT_CACHE_TIMEOUT)
+    return entry
+
+
+def forget_user(username):
+    cache.delete(user_key(username))
+
+
+def forget_home(home_id):
+    cache.delete(home_key(home_id))
+
+
+def current_user(request):
+    if not hasattr(request, "_current_user"):
+        username = request.session.get("username")
+        request._current_user = load_user(username) if username else None
+    return request._current_user
+
+
+def current_home(request):
+    if not hasattr(request, "_current_home"):
+        request._current_home = find_home(request, current_user(request))
+    return request._current_home
+
+
+def find_home(request, user):
+    if user is None:
+        return None
+    home_id = request.session.get("home_id")
+    home_uuid = parse_uuid_param(home_id)
+    if home_uuid:
+        home, usernames = load_home(home_uuid)
+        if home is not None and user.username in usernames:
+            return home
+    home = user.homes.order_by("name", "home_id").first()
+    # Only written when it changes, a session that's saved on every request defeats the session cache
+    new_home_id = str(home.home_id) if home else None
+    if new_home_id != home_id:
+        if new_home_id:
+            request.session["home_id"] = new_home_id
+        else:
+            request.session.pop("home_id", None)
+    return home
+
+
+def set_current_home(request, home):
+    request.session["home_id"] = str(home.home_id)
+    request._current_home = home
+
+
+# Async views. Memoized values come straight back, otherwise the lookup runs on the request's sync thread
+# (the cache and session backends are sync underneath anyway, one hop beats one per cache call)
+async def acurrent_user(request):
+    if hasattr(request, "_current_user"):
+        return request._current_user
+    return await sync_to_async(current_user)(request)
+
+
+async def acurrent_home(request):
+    if hasattr(request, "_current_home"):
+        return request._current_home
+    return await sync_to_async(current_home)(request)
@@ -0,0 +1,36 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Opaque keyset cursors shared by the JSON API and the dashboard panels: a urlsafe base64 JSON list
+# of the sort values of the last row on the page.
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The list of values in the cursor. Raises ValueError for anything that isn't one of ours."""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    values = json.loads(raw)
+    if not isinstance(values, list):
+        raise ValueError("Cursor is not a list.")
+    return values
+
+
+def cursor_values(model, names, values):
+    """values turned back into the python types of model's fields names (None stays None), so they can go
+    straight into filters. Raises ValueError if they don't fit, like decode_cursor."""
+    if len(values) != len(names):
+        raise ValueError("Cursor doesn't match this list.")
+    try:
+        return [
+            None if value is None else model._meta.get_field(name).to_python(value)
+            for name, value in zip(names, values)
+        ]
+    except (ValidationError, TypeError, AttributeError) as error:
+        raise ValueError(f"Cursor doesn't match this list: {error}")
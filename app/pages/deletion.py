@@ -0,0 +1,165 @@
+from collections import Counter
+
+from django.db import router, transaction
+from django.db.models import Q
+
+from .current import forget_home
+from .jobs import enqueue, job
+from .models import (
+    Asset,
+    CalendarFeed,
+    Consumable,
+    Home,
+    HomeUserConnection,
+    Log,
+    MonthlySpend,
+    ReminderDelivery,
+    Room,
+    SearchEntry,
+    Task,
+    TaskOccurrence,
+    Tombstone,
+)
+from .summary import bump_portfolio_version, bump_version
+
+# Deleting homes, rooms, assets and tasks without Django's delete collector, which loads every dependent
+# row (years of logs) into Python before deleting anything.
+#   delete_room(room)  /  delete_asset(asset)  /  delete_task(task)  /  delete_home(home)
+# A single task goes right away, its logs are a few raw DELETEs (purge_tasks). Everything bigger takes two steps.
+# First the object is hidden, in the caller's transaction and in a few UPDATEs whatever its size:
+# a home loses its users, a room or asset (with every task hanging off it) is moved into a new home
+# nobody is connected to, and everything the app shows is scoped by the user's homes.
+# Then the purge_home job (jobs.py) deletes that home's rows with batched raw DELETEs, leaves first,
+# so Python never holds more than a batch of ids (logs go by the chunk of tasks they belong to).
+# It's queued even with JOB_QUEUE off (a home with a million logs takes longer than a request may), for the
+# worker or a scheduled run_jobs --burst --only purge_home to pick up. Until then the rows are only hidden.
+# Raw deletes send no signals, so this does what signals.py would for a normal delete: one Tombstone for
+# the object itself (the sync client cascades), the summary/portfolio versions and the cached home.
+
+DELETE_BATCH_SIZE = 2000
+# Tasks per purge transaction, each takes all its logs along
+TASK_BATCH_SIZE = 100
+# Name of the homes deleted rows wait in until purge_home gets to them
+PURGE_HOME_NAME = "Deleted"
+
+
+def raw_delete(queryset, batch_size=DELETE_BATCH_SIZE):
+    """Delete every row of queryset in batches of primary keys, no signals and no cascade. Returns the count."""
+    model = queryset.model
+    using = router.db_for_write(model)
+    deleted = 0
+    while pks := list(queryset.values_list("pk", flat=True)[:batch_size]):
+        with transaction.atomic(using=using):
+            deleted += model.objects.filter(pk__in=pks)._raw_delete(using)
+    return deleted
+
+
+def purge_tasks(tasks, using, batch_size=TASK_BATCH_SIZE):
+    """Deletes tasks and the rows that hang off them, a chunk of tasks per transaction and one DELETE per
+    table per chunk. Only the chunk's ids are held in Python, however many logs they have."""
+    counts = Counter()
+    while task_ids := list(tasks.values_list("pk", flat=True)[:batch_size]):
+        with transaction.atomic(using=using):
+            # Search entries first, a log's points at it
+            for model in (SearchEntry, Log, TaskOccurrence, MonthlySpend, ReminderDelivery):
+                counts[model._meta.model_name] += model.objects.filter(task_id__in=task_ids)._raw_delete(using)
+            counts["task"] += Task.objects.filter(pk__in=task_ids)._raw_delete(using)
+    return counts
+
+
+def purge_home(home_id):
+    """Deletes a home and everything in it, children before parents. Returns the counts per model.
+    Safe to run again after it stopped halfway."""
+    using = router.db_for_write(Home)
+    # Tasks belong to a home through their room, asset or consumable too. Filing them all under the home
+    # once keeps every batch below on the task home index.
+    owners = {
+        "room__in": Room.objects.filter(home_id=home_id),
+        "asset__in": Asset.objects.filter(room__home_id=home_id),
+        "consumable__in": Consumable.objects.filter(asset__room__home_id=home_id),
+    }
+    for lookup, owner in owners.items():
+        # One UPDATE per relation, each on its own foreign key index (an OR of the joins scans every task)
+        Task.objects.filter(**{lookup: owner.values("pk")}).exclude(home_id=home_id).update(home_id=home_id)
+    counts = purge_tasks(Task.objects.filter(home_id=home_id), using)
+    for queryset in (
+        TaskOccurrence.objects.filter(home_id=home_id),
+        MonthlySpend.objects.filter(home_id=home_id),
+        SearchEntry.objects.filter(home_id=home_id),
+        SearchEntry.objects.filter(asset__room__home_id=home_id),
+        Consumable.objects.filter(asset__room__home_id=home_id),
+        Asset.objects.filter(room__home_id=home_id),
+        Room.objects.filter(home_id=home_id),
+        HomeUserConnection.objects.filter(home_id=home_id),
+        CalendarFeed.objects.filter(home_id=home_id),
+        Home.objects.filter(pk=home_id),
+    ):
+        counts[queryset.model._meta.model_name] += raw_delete(queryset)
+    return dict(counts)
+
+
+@job("purge_home", priority=-5, timeout=600, always_queue=True)
+def purge_home_job(home_id):
+    purge_home(home_id)
+
+
+def move_tasks(task_filters, home):
+    """Moves the tasks matching any of task_filters, and the rows filed under their home, into home.
+    One UPDATE per filter, an OR across the relations would scan every task."""
+    for task_filter in task_filters:
+        Task.objects.filter(task_filter).exclude(home=home).update(home=home)
+    TaskOccurrence.objects.filter(task__home=home).update(home=home)
+    MonthlySpend.objects.filter(task__home=home).update(home=home)
+    SearchEntry.objects.filter(task__home=home).update(home=home)
+
+
+def hide(instance, home_id, task_filters, move):
+    """Moves instance and its tasks into a new home without users, leaves a tombstone and queues the purge."""
+    with transaction.atomic():
+        purge = Home.objects.create(name=PURGE_HOME_NAME)
+        move(purge)
+        move_tasks(task_filters, purge)
+        # The search entries of moved assets and their consumables, tasks and logs went with move_tasks
+        SearchEntry.objects.filter(asset__room__home=purge).update(home=purge)
+        Tombstone.objects.create(home_id=home_id, model=instance._meta.model_name, object_id=instance.pk)
+        transaction.on_commit(lambda: bump_version(home_id))
+        enqueue("purge_home", home_id=str(purge.home_id))
+
+
+def delete_room(room):
+    assets = Asset.objects.filter(room=room).values("pk")
+    hide(
+        room,
+        room.home_id,
+        [Q(room=room), Q(asset__in=assets), Q(consumable__in=Consumable.objects.filter(asset__in=assets).values("pk"))],
+        lambda purge: Room.objects.filter(pk=room.pk).update(home=purge),
+    )
+
+
+def delete_asset(asset):
+    def move(purge):
+        Asset.objects.filter(pk=asset.pk).update(room=Room.objects.create(home=purge, name=PURGE_HOME_NAME))
+
+    home_id = Room.objects.filter(pk=asset.room_id).values_list("home_id", flat=True).first()
+    consumables = Consumable.objects.filter(asset=asset).values("pk")
+    hide(asset, home_id, [Q(asset=asset), Q(consumable__in=consumables)], move)
+
+
+def delete_task(task):
+    # Its own room and asset stay. One task's logs aren't worth a hidden home and a purge job
+    with transaction.atomic():
+        purge_tasks(Task.objects.filter(pk=task.pk), router.db_for_write(Task))
+        if task.home_id:
+            Tombstone.objects.create(home_id=task.home_id, model=task._meta.model_name, object_id=task.pk)
+            transaction.on_commit(lambda: bump_version(task.home_id))
+
+
+def delete_home(home):
+    usernames = list(HomeUserConnection.objects.filter(home=home).values_list("user_id", flat=True))
+    with transaction.atomic():
+        # Without its users nobody sees the home anymore, the rest can wait for purge_home
+        HomeUserConnection.objects.filter(home=home)._raw_delete(router.db_for_write(HomeUserConnection))
+        enqueue("purge_home", home_id=str(home.home_id))
+        transaction.on_commit(lambda: forget_home(home.home_id))
+        for username in usernames:
+            transaction.on_commit(lambda username=username: bump_portfolio_version(username))
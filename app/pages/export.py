@@ -0,0 +1,217 @@
+import csv
+import zipfile
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+
+from .models import Asset, Consumable, Log, Room, Task
+
+# Full maintenance history export for one or more homes, streamed so memory doesn't grow with the log count.
+#   csv    one section (?section=logs by default) as a single CSV
+#   jsonl  every section, one {"type": "room"|"asset"|..., ...} object per line, parents before children
+#   zip    <section>.csv for every section plus history.jsonl
+# Rows are read with values_list().iterator(), which is a server-side cursor on Postgres (chunked fetches
+# on SQLite), and written out in ~64KB blocks. Nothing holds more than one block plus one cursor chunk.
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BLOCK_BYTES = 64 * 1024
+EXPORT_FORMATS = ("csv", "jsonl", "zip")
+
+# section -> (model, home lookup, ordering, [(column, orm path)])
+SECTIONS = {
+    "rooms": (Room, "home_id", ("home_id", "name", "room_id"), [
+        ("room_id", "room_id"),
+        ("home_id", "home_id"),
+        ("home", "home__name"),
+        ("name", "name"),
+        ("description", "description"),
+    ]),
+    "assets": (Asset, "room__home_id", ("room_id", "name", "asset_id"), [
+        ("asset_id", "asset_id"),
+        ("room_id", "room_id"),
+        ("room", "room__name"),
+        ("name", "name"),
+        ("category", "category"),
+        ("brand", "brand"),
+        ("model_number", "model_number"),
+    ]),
+    "consumables": (Consumable, "asset__room__home_id", ("asset_id", "consumable_id"), [
+        ("consumable_id", "consumable_id"),
+        ("asset_id", "asset_id"),
+        ("asset", "asset__name"),
+        ("name", "name"),
+        ("part_number", "details__part_number"),
+        ("estimated_cost", "details__estimated_cost"),
+        ("retail_url", "details__retail_url"),
+    ]),
+    "tasks": (Task, "home_id", ("home_id", "name", "task_id"), [
+        ("task_id", "task_id"),
+        ("home_id", "home_id"),
+        ("room_id", "room_id"),
+        ("asset_id", "asset_id"),
+        ("consumable_id", "consumable_id"),
+        ("name", "name"),
+        ("interval", "interval"),
+        ("interval_count", "interval_count"),
+        ("next_due_date", "next_due_date"),
+        ("last_completed_date", "last_completed_date"),
+    ]),
+    # (task, completion_date) walks log_task_completed_idx
+    "logs": (Log, "task__home_id", ("task_id", "completion_date", "log_id"), [
+        ("log_id", "log_id"),
+        ("task_id", "task_id"),
+        ("task", "task__name"),
+        ("room", "task__room__name"),
+        ("asset", "task__asset__name"),
+        ("completion_date", "completion_date"),
+        ("cost", "cost"),
+        ("notes", "notes"),
+    ]),
+}
+
+
+def section_rows(section, home_ids):
+    model, home_lookup, ordering, columns = SECTIONS[section]
+    queryset = (
+        model.objects.filter(**{f"{home_lookup}__in": home_ids})
+        .order_by(*ordering)
+        .values_list(*[path for _, path in columns])
+    )
+    return queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class LineBuffer:
+    """Write target for csv.writer. Collects text and hands it out in blocks."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        return len(text)
+
+    def full(self):
+        return self.size >= EXPORT_BLOCK_BYTES
+
+    def take(self):
+        text = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        return text
+
+
+def csv_blocks(section, home_ids):
+    buffer = LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in SECTIONS[section][3]])
+    for row in section_rows(section, home_ids):
+        writer.writerow(row)
+        if buffer.full():
+            yield buffer.take()
+    yield buffer.take()
+
+
+def jsonl_blocks(home_ids):
+    buffer = LineBuffer()
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for section, (model, _, _, columns) in SECTIONS.items():
+        record_type = model._meta.model_name
+        names = [name for name, _ in columns]
+        for row in section_rows(section, home_ids):
+            record = {"type": record_type}
+            record.update(zip(names, row))
+            buffer.write(encoder.encode(record) + "\n")
+            if buffer.full():
+                yield buffer.take()
+    yield buffer.take()
+
+
+class ZipStream:
+    """Unseekable file for zipfile. ZipFile falls back to data descriptors when it can't seek,
+    so entries can be written (and sent) before their size is known."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def zip_blocks(home_ids):
+    stream = ZipStream()
+    created = datetime.now().timetuple()[:6]
+    with zipfile.ZipFile(stream, "w") as archive:
+        entries = [(f"{section}.csv", csv_blocks(section, home_ids)) for section in SECTIONS]
+        entries.append(("history.jsonl", jsonl_blocks(home_ids)))
+        for name, blocks in entries:
+            info = zipfile.ZipInfo(name, date_time=created)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            # force_zip64 because the size isn't known up front and a big history can pass 4GB
+            with archive.open(info, "w", force_zip64=True) as entry:
+                for block in blocks:
+                    entry.write(block.encode())
+                    yield stream.take()
+    # The central directory is written on close
+    yield stream.take()
+
+
+def export_blocks(home_ids, file_format, section="logs"):
+    """Bytes of the export, in blocks. Used by the view and the export_history command."""
+    if file_format == "csv":
+        return (block.encode() for block in csv_blocks(section, home_ids))
+    if file_format == "jsonl":
+        return (block.encode() for block in jsonl_blocks(home_ids))
+    return zip_blocks(home_ids)
+
+
+def export_filename(name, file_format, section="logs"):
+    stem = "".join(char if char.isalnum() else "-" for char in name).strip("-").lower() or "home"
+    if file_format == "csv":
+        stem = f"{stem}-{section}"
+    return f"{stem}-{date.today().isoformat()}.{file_format}"
+
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "zip": "application/zip",
+}
+
+
+# GET /pages/export/?format=csv|jsonl|zip&section=logs exports the current home
+def export_home_view(request):
+    if request.current_user() is None:
+        return redirect("login")
+    home = request.current_home()
+    if home is None:
+        return redirect("manage_homes")
+
+    file_format = request.GET.get("format", "zip")
+    section = request.GET.get("section", "logs")
+    if file_format not in EXPORT_FORMATS or section not in SECTIONS:
+        return HttpResponse(
+            f"format must be one of {', '.join(EXPORT_FORMATS)} and section one of {', '.join(SECTIONS)}.",
+            status=400,
+            content_type="text/plain",
+        )
+
+    response = StreamingHttpResponse(
+        export_blocks([home.home_id], file_format, section),
+        content_type=CONTENT_TYPES[file_format],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{export_filename(home.name, file_format, section)}"'
+    response["Cache-Control"] = "no-store"
+    return response
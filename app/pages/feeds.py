@@ -0,0 +1,208 @@
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .export import LineBuffer
+from .models import CalendarFeed, HomeUserConnection, Task
+from .recurrence import DAY_STEPS, MONTH_STEPS
+from .summary import SUMMARY_TIMEOUT, get_portfolio_version, get_version
+
+# Upcoming maintenance as an iCalendar feed that phones and calendar apps subscribe to.
+#   /pages/calendar/                         html page with the user's feed links (new ones: actions.calendar_link)
+#   GET /pages/calendar/<token>.ics          one home's tasks, or all of the user's homes. No login, the token is the key
+# Every task with a due date is one all day event on next_due_date, recurring ones carry an RRULE so the
+# calendar app works out the later dates itself. Streamed in blocks straight off the tasks query.
+# Calendar apps poll every 15 minutes or so. The ETag is the summary version of the home (or the user's portfolio
+# version, summary.py), which every change bumps, and Last-Modified is when that version was first served.
+# An unchanged feed is a 304 from the token lookup and two cache reads, without reading a single task.
+
+FEED_CHUNK_SIZE = 2000
+PRODID = "-//Upkeep//Maintenance calendar//EN"
+# Octets per line before it's folded (RFC 5545 3.1)
+LINE_OCTETS = 75
+ONE_DAY = timedelta(days=1)
+TASK_COLUMNS = ("task_id", "name", "interval", "interval_count", "next_due_date", "home__name", "room__name", "asset__name")
+
+
+def new_token():
+    return secrets.token_urlsafe(24)
+
+
+def new_feed(user, home=None):
+    """The user's feed for home (all homes when None) under a new token. Replaces the old token if there was one."""
+    feed = CalendarFeed.objects.filter(user=user, home=home).first()
+    if feed is None:
+        return CalendarFeed.objects.create(user=user, home=home, token=new_token())
+    feed.token = new_token()
+    feed.save(update_fields=["token"])
+    return feed
+
+
+def find_feed(token):
+    # A home feed only while its user is still connected to the home
+    return (
+        CalendarFeed.objects.filter(token=token)
+        .filter(Q(home__isnull=True) | Q(home__users=F("user")))
+        .select_related("home")
+        .first()
+    )
+
+
+def escape_text(value):
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def fold(line):
+    """line with CRLF, split into 75 octet lines (continuations start with a space) without cutting a character."""
+    data = line.encode()
+    if len(data) <= LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    start = 0
+    limit = LINE_OCTETS
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Back off UTF-8 continuation bytes
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start = end
+        limit = LINE_OCTETS - 1
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def recurrence_rule(interval, every, due):
+    """The RRULE for the dates recurrence.nth_occurrence steps through from due, None for one time tasks."""
+    every = max(1, every or 1)
+    if interval in MONTH_STEPS:
+        months = MONTH_STEPS[interval] * every
+        if months % 12 == 0:
+            rule = f"FREQ=YEARLY;INTERVAL={months // 12}"
+            # Feb 29 falls back to Feb 28, like add_months does
+            if (due.month, due.day) == (2, 29):
+                rule += ";BYMONTH=2;BYMONTHDAY=28,29;BYSETPOS=-1"
+            return rule
+        rule = f"FREQ=MONTHLY;INTERVAL={months}"
+        # A plain monthly rule skips the months without that day. add_months uses the last day instead:
+        # the latest of 28..day that the month has
+        if due.day > 28:
+            rule += f";BYMONTHDAY={','.join(str(day) for day in range(28, due.day + 1))};BYSETPOS=-1"
+        return rule
+    if interval in DAY_STEPS:
+        days = DAY_STEPS[interval] * every
+        if days % 7 == 0:
+            return f"FREQ=WEEKLY;INTERVAL={days // 7}"
+        return f"FREQ=DAILY;INTERVAL={days}"
+    return None
+
+
+def ical_date(day):
+    # A few times faster than strftime, which adds up over 10,000 events
+    return day.isoformat().replace("-", "")
+
+
+def event_text(row, stamp):
+    task_id, name, interval, every, due, home_name, room_name, asset_name = row
+    rule = recurrence_rule(interval, every, due)
+    summary = f"{name} ({asset_name})" if asset_name else name
+    location = ", ".join(part for part in (home_name, room_name) if part)
+    # One string per event, only the lines with user text can run long enough to need folding
+    return (
+        f"BEGIN:VEVENT\r\nUID:task-{task_id}@upkeep\r\nDTSTAMP:{stamp}\r\n"
+        f"DTSTART;VALUE=DATE:{ical_date(due)}\r\nDTEND;VALUE=DATE:{ical_date(due + ONE_DAY)}\r\n"
+        + (f"RRULE:{rule}\r\n" if rule else "")
+        + fold(f"SUMMARY:{escape_text(summary)}")
+        + fold(f"LOCATION:{escape_text(location)}")
+        + "TRANSP:TRANSPARENT\r\nEND:VEVENT\r\n"
+    )
+
+
+def feed_tasks(feed):
+    if feed.home_id:
+        tasks = Task.objects.filter(home_id=feed.home_id)
+    else:
+        tasks = Task.objects.filter(home_id__in=HomeUserConnection.objects.filter(user_id=feed.user_id).values("home_id"))
+    return (
+        tasks.filter(next_due_date__isnull=False)
+        .order_by("home_id", "next_due_date", "task_id")
+        .values_list(*TASK_COLUMNS)
+        .iterator(chunk_size=FEED_CHUNK_SIZE)
+    )
+
+
+def feed_blocks(feed, published):
+    """The feed in blocks of about EXPORT_BLOCK_BYTES. published (a timestamp) is every event's DTSTAMP."""
+    buffer = LineBuffer()
+    stamp = f"{datetime.fromtimestamp(published, timezone.utc):%Y%m%dT%H%M%SZ}"
+    name = f"Upkeep: {feed.home.name}" if feed.home_id else "Upkeep: all homes"
+    for line in ("BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH",
+                 f"X-WR-CALNAME:{escape_text(name)}"):
+        buffer.write(fold(line))
+    for row in feed_tasks(feed):
+        buffer.write(event_text(row, stamp))
+        if buffer.full():
+            yield buffer.take()
+    buffer.write("END:VCALENDAR\r\n")
+    yield buffer.take()
+
+
+def feed_version(feed):
+    if feed.home_id:
+        return f"home-{feed.home_id}-{get_version(feed.home_id)}"
+    return f"user-{feed.user_id}-{get_portfolio_version(feed.user_id)}"
+
+
+def first_served(version):
+    """When the feed was first served under version, in whole seconds like HTTP dates."""
+    key = f"calendar-feed-served:{version}"
+    served = cache.get(key)
+    if served is None:
+        served = int(time.time())
+        if not cache.add(key, served, SUMMARY_TIMEOUT):
+            served = cache.get(key, served)
+    return served
+
+
+@require_safe
+def calendar_feed(request, token):
+    feed = find_feed(token)
+    if feed is None:
+        raise Http404("No such calendar.")
+    version = feed_version(feed)
+    etag = quote_etag(version)
+    last_modified = first_served(version)
+    # Nothing is read until the body is, a 304 never starts the tasks query
+    response = StreamingHttpResponse(feed_blocks(feed, last_modified), content_type="text/calendar; charset=utf-8")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Whoever has the link may cache it, but has to check back
+    response["Cache-Control"] = "private, no-cache"
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
+def feed_url(request, feed):
+    return request.build_absolute_uri(reverse("calendar_feed", args=[feed.token])) if feed else ""
+
+
+def calendar_view(request):
+    user = request.current_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    home = request.current_home()
+    # Only the current home's link, a user with hundreds of homes doesn't need hundreds of links on one page
+    feeds = {feed.home_id: feed for feed in CalendarFeed.objects.filter(Q(home__isnull=True) | Q(home=home), user=user)}
+    rows = [{"scope": "all", "name": "All your homes", "url": feed_url(request, feeds.get(None))}]
+    if home:
+        rows.append({"scope": "home", "name": home.name, "url": feed_url(request, feeds.get(home.home_id))})
+    return render(request, "calendar.html", {"feeds": rows})
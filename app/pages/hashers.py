@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# Django's PBKDF2 and scrypt hashers with the work factor read from settings, so the cost can be tuned
+# per deployment (PASSWORD_PBKDF2_ITERATIONS / PASSWORD_SCRYPT_WORK_FACTOR) without a code change.
+# The hash format and algorithm names are Django's own. A stored hash made with a different cost
+# reports must_update(), and logins.authenticate() re-hashes it with the current one.
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, "PASSWORD_PBKDF2_ITERATIONS", None) or hashers.PBKDF2PasswordHasher.iterations
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return getattr(settings, "PASSWORD_SCRYPT_WORK_FACTOR", None) or hashers.ScryptPasswordHasher.work_factor
+
+    @property
+    def maxmem(self):
+        # scrypt needs about 128 * n * r bytes, OpenSSL refuses anything over 32MB unless told otherwise
+        return 2 * 128 * self.work_factor * self.block_size
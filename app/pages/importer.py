@@ -0,0 +1,351 @@
+import csv
+import io
+import json
+from datetime import date
+
+from django.contrib import messages
+from django.db import transaction
+from django.shortcuts import redirect
+from django.views.decorators.http import require_POST
+
+from .models import (
+    Asset,
+    Consumable,
+    ConsumableDetails,
+    Home,
+    HomeUserConnection,
+    INTERVAL_CHOICES,
+    Room,
+    Task,
+    TaskOccurrence,
+)
+from .parts import catalog_parts
+from .recurrence import build_occurrences, window_end
+from .search import index_objects
+from .summary import bump_version
+from .views import compute_next_due_date, parse_cost, parse_interval_count, validate_asset_fields, validate_home_fields
+
+# Bulk import of rooms, assets, consumables and maintenance tasks from a CSV or JSONL file.
+# One row (or one JSON object per line) is one asset. Columns, only room and asset_name are required:
+#   home, home_address, home_city, home_state, home_zip     pick (or create) a home by name, defaults to the target home
+#   room                                                    created in that home if it doesn't exist yet
+#   asset_name, asset_category, asset_brand, asset_model_number
+#   consumable_name, consumable_part_number, consumable_cost, consumable_interval
+#   task_name, task_interval, task_interval_count, task_start_date    an extra maintenance task for the asset
+# Rows go through the same checks as the add-asset form. Bad rows are reported and skipped, the rest
+# are buffered and written with bulk_create, one transaction per chunk, so memory stays flat however big the file is.
+
+IMPORT_COLUMNS = (
+    "home", "home_address", "home_city", "home_state", "home_zip",
+    "room",
+    "asset_name", "asset_category", "asset_brand", "asset_model_number",
+    "consumable_name", "consumable_part_number", "consumable_cost", "consumable_interval",
+    "task_name", "task_interval", "task_interval_count", "task_start_date",
+)
+IMPORT_CHUNK_SIZE = 500
+# Errors past this many are only counted, a broken 100k row file shouldn't turn into a 100k line report
+MAX_REPORTED_ERRORS = 200
+# How many of those the upload view shows as messages
+MAX_ERROR_MESSAGES = 20
+
+CATEGORIES = {value.lower() for value, _ in Asset._meta.get_field("category").choices}
+INTERVALS = {value for value, _ in INTERVAL_CHOICES}
+# column -> max length of the field it ends up in
+MAX_LENGTHS = {
+    "home": Home._meta.get_field("name").max_length,
+    "home_address": Home._meta.get_field("address").max_length,
+    "home_city": Home._meta.get_field("city").max_length,
+    "room": Room._meta.get_field("name").max_length,
+    "asset_name": Asset._meta.get_field("name").max_length,
+    "asset_brand": Asset._meta.get_field("brand").max_length,
+    "asset_model_number": Asset._meta.get_field("model_number").max_length,
+    "consumable_name": Consumable._meta.get_field("name").max_length,
+    "consumable_part_number": ConsumableDetails._meta.get_field("part_number").max_length,
+    "task_name": Task._meta.get_field("name").max_length,
+}
+
+
+class ImportFileError(Exception):
+    """The file as a whole can't be read (wrong format, missing columns). Bad rows don't raise."""
+
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict) from a text stream, one row at a time."""
+    try:
+        yield from parse_rows(stream, file_format)
+    except (csv.Error, UnicodeDecodeError) as error:
+        raise ImportFileError(f"The file could not be read: {error}")
+
+
+def parse_rows(stream, file_format):
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        if not reader.fieldnames:
+            raise ImportFileError("The file is empty.")
+        columns = {name.strip() for name in reader.fieldnames if name}
+        missing = {"room", "asset_name"} - columns
+        if missing:
+            raise ImportFileError(f"Missing columns: {', '.join(sorted(missing))}.")
+        for row in reader:
+            yield reader.line_num, {key.strip(): value for key, value in row.items() if key}
+    elif file_format == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            # Handed to the row checks so it's reported like any other bad row
+            yield line_number, row if isinstance(row, dict) else {"__invalid__": True}
+    else:
+        raise ImportFileError("Format must be csv or jsonl.")
+
+
+def guess_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def text_stream(binary_file):
+    # utf-8-sig drops the byte order mark Excel puts in front of CSV exports
+    return io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+
+
+def clean_row(row):
+    values = {}
+    for column in IMPORT_COLUMNS:
+        value = row.get(column)
+        values[column] = "" if value is None else str(value).strip()
+    return values
+
+
+class AssetImporter:
+    def __init__(self, user, home=None, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+        self.user = user
+        # Rows without a home column land here
+        self.default_home = home
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.today = date.today()
+        self.until = window_end(self.today)
+        self.errors = []
+        self.error_count = 0
+        self.imported = 0
+        self.totals = {}
+        self.touched_homes = set()
+        # Lookups are per home/room name, not per row, so they stay small next to the file
+        self.homes = {home.name.lower(): home for home in user.homes.all()}
+        self.rooms = {}
+        self.reset_buffers()
+
+    def reset_buffers(self):
+        # Insert order matters, every model only points at models earlier in this list
+        self.buffers = {
+            Home: [],
+            HomeUserConnection: [],
+            Room: [],
+            Asset: [],
+            Consumable: [],
+            Task: [],
+            TaskOccurrence: [],
+        }
+        # (consumable, part) pairs, the parts are looked up in the catalog once per chunk
+        self.pending_parts = []
+        self.pending_rows = 0
+
+    def add(self, obj):
+        self.buffers[type(obj)].append(obj)
+        return obj
+
+    def run(self, rows):
+        for line_number, row in rows:
+            errors = self.import_row(row)
+            if errors:
+                self.error_count += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append((line_number, errors))
+                continue
+            self.pending_rows += 1
+            if self.pending_rows >= self.chunk_size:
+                self.flush()
+        self.flush()
+        return self
+
+    def flush(self):
+        if not self.pending_rows:
+            return
+        if not self.dry_run:
+            with transaction.atomic():
+                if self.pending_parts:
+                    parts = catalog_parts([part for _, part in self.pending_parts], self.user)
+                    for consumable, part in self.pending_parts:
+                        consumable.details = parts[part]
+                for model, objects in self.buffers.items():
+                    if objects:
+                        model.objects.bulk_create(objects, batch_size=self.chunk_size)
+                index_objects(self.buffers[Asset] + self.buffers[Consumable] + self.buffers[Task], batch_size=self.chunk_size)
+            # bulk_create doesn't send post_save, so the cached summaries have to be told here
+            for home_id in self.touched_homes:
+                bump_version(home_id)
+        for model, objects in self.buffers.items():
+            if objects:
+                name = model._meta.verbose_name_plural
+                self.totals[name] = self.totals.get(name, 0) + len(objects)
+        self.imported += self.pending_rows
+        self.touched_homes = set()
+        self.reset_buffers()
+
+    def import_row(self, row):
+        if row.get("__invalid__"):
+            return ["Line is not a JSON object."]
+        values = clean_row(row)
+        errors = [
+            f"{column} must be {max_length} characters or less."
+            for column, max_length in MAX_LENGTHS.items()
+            if len(values[column]) > max_length
+        ]
+        if errors:
+            return errors
+
+        category = (values["asset_category"] or "general").lower()
+        if category not in CATEGORIES:
+            return [f"asset_category must be one of: {', '.join(sorted(CATEGORIES))}."]
+        has_consumable = any(
+            values[column] for column in ("consumable_name", "consumable_part_number", "consumable_cost", "consumable_interval")
+        )
+        errors = validate_asset_fields(
+            values["asset_name"],
+            category,
+            values["asset_brand"],
+            has_consumable,
+            values["consumable_name"],
+            values["consumable_part_number"],
+            values["consumable_cost"],
+            values["consumable_interval"],
+        )
+        if not values["room"]:
+            errors.insert(0, "Room is required to place assets.")
+        for column in ("consumable_interval", "task_interval"):
+            if values[column] and values[column] not in INTERVALS:
+                errors.append(f"{column} must be one of: {', '.join(sorted(INTERVALS))}.")
+        start_date = self.today
+        if values["task_start_date"]:
+            try:
+                start_date = date.fromisoformat(values["task_start_date"])
+            except ValueError:
+                errors.append("task_start_date must be a date (YYYY-MM-DD).")
+        if (values["task_interval"] or values["task_start_date"]) and not values["task_name"]:
+            errors.append("task_name is required for a task.")
+        if errors:
+            return errors
+
+        home, errors = self.resolve_home(values)
+        if errors:
+            return errors
+        room = self.resolve_room(home, values["room"])
+
+        asset = self.add(Asset(
+            name=values["asset_name"],
+            brand=values["asset_brand"],
+            model_number=values["asset_model_number"],
+            category=category,
+            room=room,
+        ))
+        if category == "appliance" and has_consumable:
+            consumable = self.add(Consumable(name=values["consumable_name"], asset=asset))
+            part = (asset.brand, asset.model_number, values["consumable_part_number"], parse_cost(values["consumable_cost"]))
+            self.pending_parts.append((consumable, part))
+            self.add_task(
+                name=f"Replace {values['consumable_name']}",
+                interval=values["consumable_interval"],
+                interval_count=1,
+                home=home,
+                room=room,
+                asset=asset,
+                consumable=consumable,
+                last_completed_date=self.today,
+                next_due_date=compute_next_due_date(values["consumable_interval"], self.today),
+            )
+        if values["task_name"]:
+            interval_count = parse_interval_count(values["task_interval_count"])
+            self.add_task(
+                name=values["task_name"],
+                interval=values["task_interval"],
+                interval_count=interval_count,
+                home=home,
+                room=room,
+                asset=asset,
+                next_due_date=compute_next_due_date(values["task_interval"], start_date, interval_count),
+            )
+        self.touched_homes.add(home.home_id)
+        return []
+
+    def add_task(self, **fields):
+        task = self.add(Task(**fields))
+        # Same occurrences roll_forward would write, just batched with everything else
+        for occurrence in build_occurrences(task, self.until):
+            self.add(occurrence)
+        return task
+
+    def resolve_home(self, values):
+        if not values["home"]:
+            if self.default_home is None:
+                return None, ["home is required."]
+            return self.default_home, []
+        home = self.homes.get(values["home"].lower())
+        if home is not None:
+            return home, []
+        errors = validate_home_fields(values["home_state"], values["home_zip"])
+        if errors:
+            return None, errors
+        home = self.add(Home(
+            name=values["home"],
+            address=values["home_address"],
+            city=values["home_city"],
+            state=values["home_state"].upper(),
+            zip_code=values["home_zip"],
+        ))
+        self.add(HomeUserConnection(home=home, user=self.user))
+        self.homes[home.name.lower()] = home
+        return home, []
+
+    def resolve_room(self, home, name):
+        if home.home_id not in self.rooms:
+            # One query per home the first time it shows up
+            self.rooms[home.home_id] = {room.name.lower(): room for room in Room.objects.filter(home_id=home.home_id)}
+        rooms = self.rooms[home.home_id]
+        room = rooms.get(name.lower())
+        if room is None:
+            room = rooms[name.lower()] = self.add(Room(home=home, name=name))
+        return room
+
+
+# Upload form on the manage homes page. Rows without a home column go into the current home.
+@require_POST
+def import_assets_view(request):
+    user = request.current_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    # Rows without a home column need one to go into
+    home = request.current_home()
+
+    upload = request.FILES.get("import_file")
+    if not upload:
+        messages.error(request, "Choose a CSV or JSONL file to import.")
+        return redirect("manage_homes")
+
+    importer = AssetImporter(user, home=home)
+    try:
+        # Large uploads are spooled to a temp file by Django, this reads them back a line at a time
+        importer.run(read_rows(text_stream(upload), guess_format(upload.name)))
+    except ImportFileError as error:
+        messages.error(request, str(error))
+
+    for line_number, errors in importer.errors[:MAX_ERROR_MESSAGES]:
+        messages.error(request, f"Line {line_number}: {' '.join(errors)}")
+    if importer.error_count > MAX_ERROR_MESSAGES:
+        messages.error(request, f"... and {importer.error_count - MAX_ERROR_MESSAGES} more bad rows.")
+    if importer.imported:
+        messages.success(request, f"Imported {importer.imported} assets, skipped {importer.error_count} bad rows.")
+    return redirect("manage_homes")
@@ -0,0 +1,169 @@
+import logging
+import time
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .benchmarks import percentile
+from .models import Job
+
+logger = logging.getLogger("pages.jobs")
+
+# Background jobs without a broker: the queue is the Job table (models.py), run_jobs is the worker.
+#   enqueue("roll_forward", task_id=str(task.task_id))
+# Jobs are functions registered with @job next to the code they run (recurrence.py, analytics.py,
+# prices.py, deletion.py, imported by apps.ready so the worker knows every job). They look their objects up again,
+# those may have changed or gone since the job was queued.
+# enqueue just inserts a row, in the caller's transaction when there is one, so a job is queued exactly
+# when the write that wanted it commits. With JOB_QUEUE off enqueue runs the job right after the commit
+# instead, in the request, as it ran before the queue. Jobs registered with always_queue never run in a
+# request, they're queued either way and wait for a worker or a scheduled run_jobs --burst --only <name>.
+# A worker claims a batch of jobs by pushing available_at out by their visibility timeout, with a
+# compare-and-swap UPDATE so two workers never both win a job, on SQLite or Postgres.
+# Jobs run at least once (a worker can die after the work and before deleting the row), so every job
+# has to be safe to run twice. The payload is JSON, pass ids as strings.
+
+JOBS = {}
+
+
+class JobType:
+    def __init__(self, name, func, priority, max_attempts, timeout, inline, always_queue):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.inline = inline
+        self.always_queue = always_queue
+
+
+def job(name=None, priority=0, max_attempts=3, timeout=None, inline=True, always_queue=False):
+    """Registers a job. Higher priority runs first, timeout is the visibility timeout in seconds
+    (JOB_VISIBILITY_TIMEOUT by default). inline=False jobs are dropped when JOB_QUEUE is off, for
+    work too slow to do in a request that something else catches up on anyway. always_queue=True jobs
+    are queued even when JOB_QUEUE is off, for work too slow for a request that nothing else would redo."""
+    def decorator(func):
+        JOBS[name or func.__name__] = JobType(
+            name or func.__name__, func, priority, max_attempts, timeout, inline, always_queue
+        )
+        return func
+    return decorator
+
+
+def enqueue(name, priority=None, delay=0, **payload):
+    job_type = JOBS[name]
+    if not settings.JOB_QUEUE and not job_type.always_queue:
+        if job_type.inline:
+            transaction.on_commit(lambda: job_type.func(**payload))
+        return None
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        priority=job_type.priority if priority is None else priority,
+        max_attempts=job_type.max_attempts,
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def visibility_timeout(job):
+    job_type = JOBS.get(job.name)
+    return (job_type and job_type.timeout) or settings.JOB_VISIBILITY_TIMEOUT
+
+
+def claim(worker, limit=10, names=None):
+    """Up to `limit` available jobs for this worker, highest priority first, then oldest."""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, available_at__lte=now)
+    if names:
+        ready = ready.filter(name__in=names)
+    claimed = []
+    while not claimed:
+        candidates = list(ready.order_by("-priority", "available_at")[:limit])
+        if not candidates:
+            break
+        for job in candidates:
+            # The claim only sticks if nobody else moved available_at in the meantime. Jobs further down
+            # the batch get longer, they wait for the ones before them.
+            lease = now + timedelta(seconds=visibility_timeout(job) * (len(claimed) + 1))
+            won = Job.objects.filter(pk=job.pk, status=Job.QUEUED, available_at=job.available_at).update(
+                available_at=lease, attempts=F("attempts") + 1, locked_by=worker
+            )
+            if won:
+                # How long it was ready before a worker got to it
+                job.lag = (now - job.available_at).total_seconds()
+                job.available_at, job.attempts, job.locked_by = lease, job.attempts + 1, worker
+                claimed.append(job)
+        # Another worker won the whole batch, look again
+    return claimed
+
+
+def run(job):
+    """Runs a claimed job and records how it went: done jobs are deleted, failed ones retried with
+    backoff until they're out of attempts. Returns True if it worked."""
+    # Only while the claim is still ours. Past the timeout another worker may have the job now.
+    ours = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts)
+    try:
+        job_type = JOBS.get(job.name)
+        if job_type is None:
+            raise LookupError(f"No job called {job.name!r}")
+        job_type.func(**job.payload)
+    except Exception:
+        logger.exception("Job %s #%s failed (attempt %s of %s)", job.name, job.pk, job.attempts, job.max_attempts)
+        error = traceback.format_exc(limit=5)
+        if job.attempts >= job.max_attempts:
+            ours.update(status=Job.FAILED, last_error=error, available_at=timezone.now())
+        else:
+            backoff = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            ours.update(last_error=error, available_at=timezone.now() + timedelta(seconds=backoff))
+        return False
+    ours.delete()
+    return True
+
+
+def retry_failed(names=None):
+    failed = Job.objects.filter(status=Job.FAILED)
+    if names:
+        failed = failed.filter(name__in=names)
+    return failed.update(status=Job.QUEUED, attempts=0, available_at=timezone.now(), locked_by="")
+
+
+class WorkerStats:
+    """Throughput of one worker: jobs/s overall, per job name how many ran and failed, how long they
+    took and how long they waited after becoming available (lag)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = defaultdict(list)
+        self.lags = defaultdict(list)
+        self.failed = defaultdict(int)
+
+    def record(self, job, seconds, ok):
+        self.durations[job.name].append(seconds * 1000)
+        self.lags[job.name].append(job.lag * 1000)
+        if not ok:
+            self.failed[job.name] += 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        ran = sum(len(durations) for durations in self.durations.values())
+        return {
+            "jobs": ran,
+            "failed": sum(self.failed.values()),
+            "elapsed_s": round(elapsed, 3),
+            "jobs_per_s": round(ran / elapsed, 1) if elapsed else 0,
+            "by_name": {
+                name: {
+                    "jobs": len(durations),
+                    "failed": self.failed[name],
+                    "p50_ms": round(percentile(durations, 50), 3),
+                    "p95_ms": round(percentile(durations, 95), 3),
+                    "lag_p95_ms": round(percentile(self.lags[name], 95), 3),
+                }
+                for name, durations in self.durations.items()
+            },
+        }
@@ -0,0 +1,98 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+from .models import AppUser
+
+# Password checks and login throttling for login_view.
+# Passwords are hashed with the PASSWORD_HASHERS from settings (see hashers.py). On a successful login
+# a hash made with an older hasher or cost is replaced, and so is a row from before passwords were
+# hashed, which still holds the password itself. Nothing has to be migrated up front.
+# Attempts are counted in the cache per client IP (every attempt) and per username (failures only),
+# in fixed windows of LOGIN_RATE_WINDOW seconds. A blocked attempt is turned away before any hashing,
+# so a login storm costs a cache read per request instead of a hash. With the local memory cache the
+# counts are per process, set REDIS_URL to share them between workers.
+
+
+def hash_password(password):
+    return make_password(password)
+
+
+def is_hashed(stored):
+    try:
+        identify_hasher(stored)
+    except ValueError:
+        return False
+    return True
+
+
+def authenticate(username, password):
+    """The user if the password matches, otherwise None."""
+    user = AppUser.objects.filter(username=username).first()
+    if user is None:
+        # Same work as a real check so response times don't tell which usernames exist
+        make_password(password)
+        return None
+
+    def rehash(password):
+        user.password = make_password(password)
+        user.save(update_fields=["password"])
+
+    if is_hashed(user.password):
+        # check_password calls rehash when the hasher or its cost changed since the hash was made
+        return user if check_password(password, user.password, setter=rehash) else None
+    if constant_time_compare(user.password, password):
+        rehash(password)
+        return user
+    return None
+
+
+def client_ip(request):
+    if getattr(settings, "LOGIN_TRUST_X_FORWARDED_FOR", False):
+        # The proxy in front of us appends the address it saw, anything before that came from the client
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def ip_key(request):
+    return f"login-ip:{client_ip(request)}"
+
+
+def username_key(username):
+    # Usernames can hold characters some cache backends don't allow in keys
+    return f"login-user:{hashlib.sha1(username.lower().encode()).hexdigest()}"
+
+
+def rate_window():
+    return getattr(settings, "LOGIN_RATE_WINDOW", 300)
+
+
+def login_blocked(request, username):
+    counts = cache.get_many([ip_key(request), username_key(username)])
+    return (
+        counts.get(ip_key(request), 0) >= getattr(settings, "LOGIN_IP_LIMIT", 50)
+        or counts.get(username_key(username), 0) >= getattr(settings, "LOGIN_USERNAME_LIMIT", 5)
+    )
+
+
+def count(key):
+    # add() starts the window, incr() doesn't touch the expiry so the window doesn't slide
+    cache.add(key, 0, timeout=rate_window())
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired between the two calls
+        cache.set(key, 1, timeout=rate_window())
+
+
+def record_login(request, username, success):
+    count(ip_key(request))
+    if success:
+        cache.delete(username_key(username))
+    else:
+        count(username_key(username))
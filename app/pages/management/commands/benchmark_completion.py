@@ -0,0 +1,109 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from pages.benchmarks import QueryCounter, write_results
+from pages.logins import hash_password
+from pages.models import AppUser, Home, HomeUserConnection, Job, Task
+
+BENCH_USERNAME = "bench-completion"
+
+# Tasks completed per second through the JSON API, one POST /api/logs/ per task against the batch
+# completion (POST /api/tasks/complete/, pages/completion.py).
+#   python manage.py benchmark_completion --tasks 2000 --batch 10 100 1000 --queue
+# Gives the user bench-completion (password "password") a home with --tasks quarterly tasks first and
+# completes them over and over through the test client, so run it against a scratch database.
+# Without --queue the occurrence windows are rolled forward in the request like with JOB_QUEUE off,
+# with it they're queued (and the queued jobs are thrown away afterwards).
+class Command(BaseCommand):
+    help = "Benchmark completing tasks one log at a time vs. in batches (tasks/sec)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=2000, help="Tasks in the benchmark home")
+        parser.add_argument("--single", type=int, default=200, help="Tasks completed one log at a time")
+        parser.add_argument("--batch", type=int, nargs="+", default=[10, 100, 1000], help="Batch sizes to try")
+        parser.add_argument("--queue", action="store_true", help="Run with JOB_QUEUE on")
+        parser.add_argument("--output", default="benchmark_completion.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        home = self.bench_home(options["tasks"])
+        task_ids = [str(task_id) for task_id in Task.objects.filter(home=home).order_by("task_id").values_list("task_id", flat=True)]
+        last_job = Job.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        self.day = date.today()
+
+        with override_settings(ALLOWED_HOSTS=["testserver"], JOB_QUEUE=options["queue"]):
+            client = Client()
+            if client.post("/pages/login/", {"username": BENCH_USERNAME, "password": "password"}).status_code != 302:
+                raise CommandError(f"Could not log in as {BENCH_USERNAME}.")
+
+            results = {}
+            single = task_ids[: options["single"]]
+            results["single"] = self.run(
+                [("/pages/api/logs/", {"task_id": task_id}) for task_id in single], len(single), client
+            )
+            self.report("one at a time", results["single"])
+            for size in options["batch"]:
+                posts = [
+                    ("/pages/api/tasks/complete/", {"task_ids": task_ids[start : start + size]})
+                    for start in range(0, len(task_ids), size)
+                ]
+                results[f"batch_{size}"] = self.run(posts, len(task_ids), client)
+                self.report(f"batch of {size}", results[f"batch_{size}"])
+
+        # Only ours, the runs above queue a lot of them with --queue
+        Job.objects.filter(pk__gt=last_job, name__in=["roll_forward", "roll_forward_many"]).delete()
+        results["settings"] = {"tasks": len(task_ids), "single": len(single), "job_queue": options["queue"]}
+        write_results(options["output"], "completion", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def run(self, posts, tasks, client):
+        # A new day for every run, so each one really moves the due dates
+        self.day += timedelta(days=1)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            for path, data in posts:
+                body = json.dumps({**data, "completion_date": self.day.isoformat(), "cost": "9.99"})
+                response = client.post(path, body, content_type="application/json")
+                if response.status_code != 201:
+                    raise CommandError(f"{path} answered {response.status_code}: {response.content[:200]}")
+        elapsed = time.perf_counter() - start
+        return {
+            "tasks": tasks,
+            "requests": len(posts),
+            "elapsed_s": round(elapsed, 3),
+            "tasks_per_s": round(tasks / elapsed, 1),
+            "queries_per_task": round(counter.count / tasks, 2),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<14} {result['tasks_per_s']:>9.1f} tasks/s  {result['elapsed_s']:>8.2f}s  "
+            f"{result['requests']:>5} requests  {result['queries_per_task']:>6.2f} queries/task"
+        )
+
+    def bench_home(self, count):
+        user = AppUser.objects.filter(username=BENCH_USERNAME).first()
+        if user is None:
+            user = AppUser.objects.create(
+                username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@example.com", password=hash_password("password")
+            )
+        home = user.homes.first()
+        if home is None:
+            home = Home.objects.create(name="Bench building")
+            HomeUserConnection.objects.create(home=home, user=user)
+        have = Task.objects.filter(home=home).count()
+        if have < count:
+            Task.objects.bulk_create(
+                [
+                    Task(home=home, name=f"Filter {number:05d}", interval="quarterly", next_due_date=date.today())
+                    for number in range(have, count)
+                ],
+                batch_size=1000,
+            )
+        return home
@@ -0,0 +1,105 @@
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from pages.benchmarks import QueryCounter, write_results
+from pages.deletion import delete_home, purge_home
+from pages.models import Asset, Consumable, Home, Job, Log, Room, Task
+
+# Deleting a home with a lot of history: deletion.py (hide, then batched raw deletes) against Django's
+# delete collector.
+#   python manage.py benchmark_deletes --logs 1000000 --collector-logs 50000
+# Builds a home with --logs logs (spread over rooms, assets, consumables and tasks), deletes it the
+# deletion.py way and fails if Python's peak memory during the purge goes over --max-peak-mb, which
+# should hold whatever --logs is. Then does the same with home.delete() on a home with --collector-logs
+# logs (0 to skip) for comparison, that one grows with the logs. Run it against a scratch database.
+# Peak memory is measured with tracemalloc, which also slows the deletes down a bit.
+class Command(BaseCommand):
+    help = "Benchmark deleting a home with many logs (time, queries, peak memory)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logs", type=int, default=1000000)
+        parser.add_argument("--collector-logs", type=int, default=50000, help="Logs in the home deleted with home.delete()")
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--tasks", type=int, default=2000, help="Tasks in the home, one asset and consumable each")
+        parser.add_argument("--max-peak-mb", type=float, default=64)
+        parser.add_argument("--output", default="benchmark_deletes.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        results = {}
+        home = self.build_home(options["logs"], options["rooms"], options["tasks"])
+        # Queued, so hiding and purging are timed on their own
+        with override_settings(JOB_QUEUE=True):
+            results["hide"] = self.run(lambda: delete_home(home), memory=False)
+        Job.objects.filter(name="purge_home", payload__home_id=str(home.home_id)).delete()
+        self.report("hide home", results["hide"])
+        results["purge"] = self.run(lambda: purge_home(home.home_id))
+        results["purge"]["logs"] = options["logs"]
+        self.report("purge home", results["purge"])
+        if Log.objects.filter(task__home=home).exists() or Home.objects.filter(pk=home.pk).exists():
+            raise CommandError("purge_home left rows behind.")
+
+        if options["collector_logs"]:
+            home = self.build_home(options["collector_logs"], options["rooms"], min(options["tasks"], options["collector_logs"]))
+            results["collector"] = self.run(home.delete)
+            results["collector"]["logs"] = options["collector_logs"]
+            self.report("home.delete()", results["collector"])
+
+        write_results(options["output"], "deletes", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if results["purge"]["peak_memory_mb"] > options["max_peak_mb"]:
+            raise CommandError(
+                f"purge_home peaked at {results['purge']['peak_memory_mb']}MB, over --max-peak-mb {options['max_peak_mb']}."
+            )
+
+    def run(self, fn, memory=True):
+        counter = QueryCounter()
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                fn()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if memory else 0
+        finally:
+            if memory:
+                tracemalloc.stop()
+        return {"elapsed_s": round(elapsed, 3), "queries": counter.count, "peak_memory_mb": round(peak / 1024 / 1024, 2)}
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<14} {result['elapsed_s']:>9.2f}s  {result['queries']:>7} queries  {result['peak_memory_mb']:>9.2f}MB peak"
+        )
+
+    def build_home(self, logs, rooms, tasks, batch_size=10000):
+        with transaction.atomic():
+            home = Home.objects.create(name="Bench delete")
+            room_rows = Room.objects.bulk_create(Room(home=home, name=f"Room {n}") for n in range(rooms))
+            assets = Asset.objects.bulk_create(
+                (Asset(room=room_rows[n % rooms], name=f"Asset {n}") for n in range(tasks)), batch_size=batch_size
+            )
+            consumables = Consumable.objects.bulk_create(
+                (Consumable(asset=asset, name="Filter") for asset in assets), batch_size=batch_size
+            )
+            task_rows = Task.objects.bulk_create(
+                (
+                    Task(home=home, room=asset.room, asset=asset, consumable=consumable, name=f"Task {n}", interval="monthly")
+                    for n, (asset, consumable) in enumerate(zip(assets, consumables))
+                ),
+                batch_size=batch_size,
+            )
+        start = date.today() - timedelta(days=3650)
+        for first in range(0, logs, batch_size):
+            with transaction.atomic():
+                Log.objects.bulk_create(
+                    Log(task=task_rows[n % tasks], completion_date=start + timedelta(days=n % 3650), cost=10)
+                    for n in range(first, min(first + batch_size, logs))
+                )
+        self.stdout.write(f"Built a home with {logs} logs")
+        return home
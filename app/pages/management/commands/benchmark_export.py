@@ -0,0 +1,97 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from pages.benchmarks import measure, write_results
+from pages.export import EXPORT_FORMATS, export_blocks
+from pages.models import Home, Log, Task
+
+BENCHMARK_NOTE = "benchmark_export"
+
+# Streams the export of one home and reports time, throughput and peak Python memory per format.
+# Peak memory should stay flat as --logs grows, that's the point of the streaming export.
+#   python manage.py benchmark_export --logs 1000000 --output export.json
+# --logs tops the home up with synthetic logs first, so run it against a scratch database.
+class Command(BaseCommand):
+    help = "Benchmark the streaming history export (time, rows/sec, peak memory)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--home", help="home_id to export (defaults to the home with the most logs)")
+        parser.add_argument("--logs", type=int, default=0, help="Add synthetic logs until the home has this many")
+        parser.add_argument("--format", action="append", choices=EXPORT_FORMATS, help="Formats to run (default all)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk_create when adding logs")
+        parser.add_argument("--output", default="benchmark_export.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        home = self.get_home(options["home"])
+        if options["logs"]:
+            self.top_up(home, options["logs"], options["batch_size"])
+        log_count = Log.objects.filter(task__home=home).count()
+        self.stdout.write(f"Exporting {home.name} ({home.home_id}) with {log_count} logs")
+
+        results = {"home": {"home_id": home.home_id, "logs": log_count}}
+        for file_format in options["format"] or EXPORT_FORMATS:
+            size = 0
+
+            def run():
+                nonlocal size
+                size = 0
+                for block in export_blocks([home.home_id], file_format):
+                    size += len(block)
+
+            # One timed run, then measure()'s query count and tracemalloc runs
+            result = measure(run, runs=1, warmup=0)
+            result["bytes"] = size
+            result["logs_per_sec"] = round(log_count / (result["mean_ms"] / 1000)) if result["mean_ms"] else None
+            results[file_format] = result
+            self.stdout.write(
+                f"{file_format:<6} {result['mean_ms'] / 1000:>8.2f}s  {result['logs_per_sec'] or 0:>9} logs/s  "
+                f"{size / 1024 / 1024:>9.1f}MB  {result['queries']:>4} queries  {result['peak_memory_kb']:>9.1f}KB peak"
+            )
+
+        write_results(options["output"], "export", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def get_home(self, home_id):
+        if home_id:
+            home = Home.objects.filter(home_id=home_id).first()
+            if not home:
+                raise CommandError(f"Home {home_id} does not exist.")
+            return home
+        home = Home.objects.annotate(log_count=Count("tasks__logs")).order_by("-log_count").first()
+        if not home:
+            raise CommandError("No homes found. Run generate_data first.")
+        return home
+
+    def top_up(self, home, target, batch_size):
+        task_ids = list(Task.objects.filter(home=home).values_list("task_id", flat=True))
+        if not task_ids:
+            raise CommandError(f"{home.name} has no tasks to add logs to.")
+        missing = target - Log.objects.filter(task__home=home).count()
+        if missing <= 0:
+            return
+        rng = random.Random(0)
+        today = date.today()
+        started = time.perf_counter()
+        added = 0
+        while added < missing:
+            size = min(batch_size, missing - added)
+            logs = [
+                Log(
+                    task_id=rng.choice(task_ids),
+                    completion_date=today - timedelta(days=rng.randint(0, 365 * 30)),
+                    cost=Decimal(rng.randint(0, 20000)) / 100 if rng.random() < 0.3 else None,
+                    notes=BENCHMARK_NOTE,
+                )
+                for _ in range(size)
+            ]
+            with transaction.atomic():
+                Log.objects.bulk_create(logs, batch_size=batch_size)
+            added += size
+        self.stdout.write(f"Added {added} logs in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,116 @@
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from pages.benchmarks import measure, write_results
+from pages.feeds import new_feed
+from pages.logins import hash_password
+from pages.models import AppUser, Asset, Home, HomeUserConnection, Room, Task
+from pages.summary import bump_portfolio_version
+
+BENCH_USERNAME = "bench-calendar"
+INTERVALS = [
+    ("monthly", 1), ("monthly", 6), ("quarterly", 1), ("yearly", 1), ("weekly", 1), ("every_n_weeks", 2),
+    ("every_n_days", 10), ("", 1),
+]
+
+# The iCalendar feeds (pages/feeds.py) for a 10,000 task portfolio.
+#   python manage.py benchmark_feeds --tasks 10000 --homes 20 --runs 20
+# Gives the user bench-calendar (password "password") --homes homes sharing --tasks tasks with a mix of
+# intervals first, so run it against a scratch database. Measures the whole all-homes feed read to the
+# end, one home's feed, and what a calendar app polling an unchanged feed gets: a 304 for If-None-Match
+# and for If-Modified-Since.
+class Command(BaseCommand):
+    help = "Benchmark generating the calendar feeds and answering conditional GETs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=10000)
+        parser.add_argument("--homes", type=int, default=20)
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark_feeds.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        user = self.bench_user(random.Random(options["seed"]), options)
+        tasks = Task.objects.filter(home__users=user, next_due_date__isnull=False).count()
+        self.stdout.write(f"{user.username} has {user.homes.count()} homes and {tasks} tasks with a due date")
+        all_homes = new_feed(user)
+        one_home = new_feed(user, user.homes.order_by("name").first())
+
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            client = Client()
+            url = f"/pages/calendar/{all_homes.token}.ics"
+            first = client.get(url)
+            body = b"".join(first.streaming_content)
+            if first.status_code != 200 or body.count(b"BEGIN:VEVENT") != tasks:
+                raise CommandError(f"The feed answered {first.status_code} with {body.count(b'BEGIN:VEVENT')} events.")
+
+            def read(path, **headers):
+                response = client.get(path, **headers)
+                # Read to the end a block at a time, like a client would
+                for _ in response.streaming_content if response.status_code == 200 else ():
+                    pass
+                return response
+
+            cases = {
+                "all_homes": lambda: read(url),
+                "one_home": lambda: read(f"/pages/calendar/{one_home.token}.ics"),
+                "if_none_match": lambda: read(url, HTTP_IF_NONE_MATCH=first["ETag"]),
+                "if_modified_since": lambda: read(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]),
+            }
+            for name in ("if_none_match", "if_modified_since"):
+                if cases[name]().status_code != 304:
+                    raise CommandError(f"{name} did not get a 304.")
+            results = {}
+            for name, fn in cases.items():
+                results[name] = measure(fn, runs=options["runs"])
+                self.report(name, results[name])
+
+        results["feed"] = {"events": tasks, "bytes": len(body)}
+        self.stdout.write(f"all homes feed: {tasks} events, {len(body) / 1024:.0f}KB")
+        results["settings"] = {key: options[key] for key in ("tasks", "homes")}
+        write_results(options["output"], "feeds", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<18} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+            f"{result['queries']:>4} queries  {result['peak_memory_kb']:>9.1f}KB peak"
+        )
+
+    def bench_user(self, rng, options):
+        user = AppUser.objects.filter(username=BENCH_USERNAME).first()
+        if user is None:
+            user = AppUser.objects.create(
+                username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@example.com", password=hash_password("password")
+            )
+        if user.homes.exists():
+            return user
+        today = date.today()
+        with transaction.atomic():
+            homes = Home.objects.bulk_create(Home(name=f"Calendar home {number:03d}") for number in range(options["homes"]))
+            HomeUserConnection.objects.bulk_create(HomeUserConnection(home=home, user=user) for home in homes)
+            rooms = Room.objects.bulk_create(Room(home=home, name=name) for home in homes for name in ("Kitchen", "Basement"))
+            assets = Asset.objects.bulk_create(Asset(room=room, name=f"{room.name} appliance") for room in rooms)
+            tasks = []
+            for number in range(options["tasks"]):
+                asset = rng.choice(assets)
+                interval, every = rng.choice(INTERVALS)
+                tasks.append(Task(
+                    home=asset.room.home,
+                    room=asset.room,
+                    asset=asset,
+                    name=f"Maintenance task {number}",
+                    interval=interval,
+                    interval_count=every,
+                    next_due_date=today + timedelta(days=rng.randint(-30, 365)),
+                ))
+            Task.objects.bulk_create(tasks, batch_size=2000)
+        # bulk_create sends no signals
+        bump_portfolio_version(user.username)
+        self.stdout.write(f"Added {options['homes']} homes and {options['tasks']} tasks")
+        return user
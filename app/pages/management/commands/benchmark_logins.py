@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+
+from pages.benchmarks import percentile, write_results
+from pages.logins import authenticate, hash_password, login_blocked
+from pages.models import AppUser
+
+# Logins per second at each hasher setting, so the work factor can be picked knowing what it costs.
+#   python manage.py benchmark_logins --concurrency 4 --logins 40 --output logins.json
+# A setting is <hasher>:<cost>, pbkdf2:<iterations> or scrypt:<work factor>. Each one gets a throwaway
+# user hashed with that setting, then --concurrency threads log in as it --logins times in total
+# (hashlib releases the GIL, so threads hash in parallel like gunicorn threads would).
+# The throttled path (a blocked attempt, no hashing) is measured once at the end for comparison.
+
+DEFAULT_SETTINGS = ("pbkdf2:100000", "pbkdf2:600000", "pbkdf2:1000000", "scrypt:16384", "scrypt:32768")
+HASHERS = {
+    "pbkdf2": ("pages.hashers.PBKDF2PasswordHasher", "PASSWORD_PBKDF2_ITERATIONS"),
+    "scrypt": ("pages.hashers.ScryptPasswordHasher", "PASSWORD_SCRYPT_WORK_FACTOR"),
+}
+BENCH_USERNAME = "benchlogin"
+BENCH_PASSWORD = "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = "Benchmark logins/sec (password hashing) at each hasher setting"
+
+    def add_arguments(self, parser):
+        parser.add_argument("costs", nargs="*", default=DEFAULT_SETTINGS, help="e.g. pbkdf2:600000 scrypt:16384")
+        parser.add_argument("--concurrency", type=int, default=4, help="Threads logging in at the same time")
+        parser.add_argument("--logins", type=int, default=40, help="Logins per setting")
+        parser.add_argument("--output", default="benchmark_logins.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        if AppUser.objects.filter(username=BENCH_USERNAME).exists():
+            raise CommandError(f"User {BENCH_USERNAME} already exists, delete it or use a scratch database.")
+
+        results = {}
+        try:
+            for setting in options["costs"]:
+                name, _, cost = setting.partition(":")
+                if name not in HASHERS or not cost.isdigit():
+                    raise CommandError(f"Bad setting {setting}, expected pbkdf2:<iterations> or scrypt:<work factor>.")
+                path, cost_setting = HASHERS[name]
+                with override_settings(PASSWORD_HASHERS=[path], **{cost_setting: int(cost)}):
+                    results[setting] = self.measure(options["concurrency"], options["logins"])
+                self.stdout.write(
+                    f"{setting:<16} {results[setting]['logins_per_s']:>8.1f} logins/s  "
+                    f"p50 {results[setting]['p50_ms']:>8.1f}ms  p95 {results[setting]['p95_ms']:>8.1f}ms"
+                )
+            results["throttled"] = self.measure_throttled(options["logins"])
+            self.stdout.write(f"{'throttled':<16} {results['throttled']['checks_per_s']:>8.1f} rejections/s")
+        finally:
+            AppUser.objects.filter(username=BENCH_USERNAME).delete()
+
+        results["settings"] = {"concurrency": options["concurrency"], "logins": options["logins"]}
+        write_results(options["output"], "logins", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def measure(self, concurrency, logins):
+        AppUser.objects.update_or_create(
+            username=BENCH_USERNAME,
+            defaults={"email": "bench@example.com", "password": hash_password(BENCH_PASSWORD)},
+        )
+
+        def login(_):
+            start = time.perf_counter()
+            try:
+                if authenticate(BENCH_USERNAME, BENCH_PASSWORD) is None:
+                    raise CommandError("Benchmark login failed.")
+            finally:
+                # Every thread opened its own connection
+                connections.close_all()
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = list(pool.map(login, range(logins)))
+        elapsed = time.perf_counter() - start
+        return {
+            "logins": logins,
+            "logins_per_s": round(logins / elapsed, 1),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+        }
+
+    def measure_throttled(self, checks):
+        request = RequestFactory().post("/pages/login/", REMOTE_ADDR="203.0.113.7")
+        start = time.perf_counter()
+        for _ in range(checks):
+            login_blocked(request, BENCH_USERNAME)
+        elapsed = time.perf_counter() - start
+        return {"checks": checks, "checks_per_s": round(checks / elapsed, 1)}
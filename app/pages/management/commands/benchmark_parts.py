@@ -0,0 +1,96 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pages.benchmarks import percentile, write_results
+from pages.models import BRAND_CHOICES, ConsumableDetails
+from pages.parts import KEY_FIELDS, lookup_parts, normalize_key, prefix_range
+
+BENCH_MODEL_PREFIX = "BENCH-"
+
+# Autocomplete latency against a big parts catalog.
+#   python manage.py benchmark_parts --catalog 1000000 --lookups 500 --output parts.json
+# --catalog tops the catalog up with synthetic parts (model numbers start with BENCH-) first, so run it
+# against a scratch database. Prefixes of 1 to 6 characters are taken from real rows, so most lookups
+# have a full page of answers, which is the slow case. The query plan is printed once per field.
+class Command(BaseCommand):
+    help = "Benchmark part/model number prefix lookups on the parts catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", type=int, default=0, help="Add synthetic parts until the catalog has this many")
+        parser.add_argument("--lookups", type=int, default=500, help="Lookups per field")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Rows per bulk_create when adding parts")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark_parts.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["catalog"]:
+            self.top_up(rng, options["catalog"], options["batch_size"])
+        catalog = ConsumableDetails.objects.filter(owner__isnull=True)
+        size = catalog.count()
+        self.stdout.write(f"Catalog has {size} parts")
+
+        results = {"catalog": size}
+        for field, column in KEY_FIELDS.items():
+            sample = list(catalog.order_by("?").values_list(column, flat=True)[:200])
+            if not sample:
+                continue
+            prefixes = [key[: rng.randint(1, min(6, len(key)))] for key in (rng.choice(sample) for _ in range(options["lookups"]))]
+            self.stdout.write(f"{field} plan: {self.plan(prefixes[0], field)}")
+
+            timings = []
+            found = 0
+            for prefix in prefixes:
+                start = time.perf_counter()
+                found += len(lookup_parts(prefix, field))
+                timings.append((time.perf_counter() - start) * 1000)
+            results[field] = {
+                "lookups": len(prefixes),
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p95_ms": round(percentile(timings, 95), 3),
+                "max_ms": round(max(timings), 3),
+                "mean_results": round(found / len(prefixes), 1),
+            }
+            self.stdout.write(
+                f"{field:<6} p50 {results[field]['p50_ms']:>7.3f}ms  p95 {results[field]['p95_ms']:>7.3f}ms  "
+                f"max {results[field]['max_ms']:>7.3f}ms  {results[field]['mean_results']} results"
+            )
+
+        write_results(options["output"], "parts", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def plan(self, prefix, field):
+        column = KEY_FIELDS[field]
+        low, high = prefix_range(normalize_key(prefix))
+        queryset = ConsumableDetails.objects.filter(
+            owner__isnull=True, **{f"{column}__gte": low, f"{column}__lt": high}
+        ).order_by(column)[:10]
+        return " | ".join(line.strip() for line in queryset.explain().splitlines())
+
+    def top_up(self, rng, target, batch_size):
+        existing = ConsumableDetails.objects.filter(owner__isnull=True).count()
+        offset = ConsumableDetails.objects.filter(model_number__startswith=BENCH_MODEL_PREFIX).count()
+        brands = [value for value, _ in BRAND_CHOICES]
+        letters = "ABCDEFGHJKLMNPRSTUVWXYZ"
+        added = 0
+        while existing + added < target:
+            batch = []
+            for number in range(offset + added, offset + added + min(batch_size, target - existing - added)):
+                # Looks like a real part number: letters, digits and a dash
+                part_number = f"{rng.choice(letters)}{rng.choice(letters)}{rng.randint(10, 99)}-{number:07d}{rng.choice(letters)}"
+                batch.append(ConsumableDetails(
+                    brand=rng.choice(brands),
+                    model_number=f"{BENCH_MODEL_PREFIX}{rng.choice(letters)}{number:07d}",
+                    part_number=part_number,
+                    estimated_cost=Decimal(rng.randint(500, 20000)) / 100,
+                ))
+            with transaction.atomic():
+                ConsumableDetails.objects.bulk_create(batch, batch_size=batch_size)
+            added += len(batch)
+        if added:
+            self.stdout.write(f"Added {added} synthetic parts")
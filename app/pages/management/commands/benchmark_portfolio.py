@@ -0,0 +1,122 @@
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from pages.benchmarks import measure, write_results
+from pages.logins import hash_password
+from pages.models import AppUser, Asset, Home, HomeUserConnection, Room, Task
+from pages.portfolio import home_page, portfolio_rollup
+from pages.summary import bump_portfolio_version
+
+BENCH_USERNAME = "bench-portfolio"
+
+# The portfolio page and API for a user with a lot of homes.
+#   python manage.py benchmark_portfolio --homes 5000 --runs 20 --output portfolio.json
+# Gives the user bench-portfolio (password "password") --homes homes with a few rooms, assets and
+# tasks each first, so run it against a scratch database. Measures the rollup with and without the
+# cache, the first and a deep page of homes, the API and the html page, plus the one-query-set-per-home
+# loop the portfolio replaces (--per-home-runs 0 to skip it, it is slow on purpose).
+class Command(BaseCommand):
+    help = "Benchmark the portfolio rollup, home pages and API for a user with many homes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--homes", type=int, default=5000)
+        parser.add_argument("--rooms", type=int, default=3, help="Rooms per home")
+        parser.add_argument("--assets", type=int, default=2, help="Assets per room")
+        parser.add_argument("--tasks", type=int, default=6, help="Tasks per home")
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--per-home-runs", type=int, default=2)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark_portfolio.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        user = self.top_up(random.Random(options["seed"]), options)
+        homes = user.homes.count()
+        self.stdout.write(f"{user.username} has {homes} homes")
+
+        # A cursor about halfway down the list
+        cursor = None
+        for _ in range(homes // 50 // 2):
+            cursor = home_page(user, cursor)[1]
+
+        def cold_rollup():
+            bump_portfolio_version(user.username)
+            return portfolio_rollup(user)
+
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            client = Client()
+            if client.post("/pages/login/", {"username": user.username, "password": "password"}).status_code != 302:
+                raise CommandError(f"Could not log in as {user.username}.")
+            cases = {
+                "rollup_cold": cold_rollup,
+                "rollup_cached": lambda: portfolio_rollup(user),
+                "first_page": lambda: home_page(user),
+                "deep_page": lambda: home_page(user, cursor),
+                "api": lambda: client.get("/pages/api/portfolio/"),
+                "portfolio_view": lambda: client.get("/pages/portfolio/"),
+            }
+            results = {}
+            for name, fn in cases.items():
+                results[name] = measure(fn, runs=options["runs"])
+                self.report(name, results[name])
+            if options["per_home_runs"]:
+                results["per_home_loop"] = measure(lambda: self.per_home(user), runs=options["per_home_runs"], warmup=0)
+                self.report("per_home_loop", results["per_home_loop"])
+
+        results["settings"] = {"homes": homes, **{key: options[key] for key in ("rooms", "assets", "tasks")}}
+        write_results(options["output"], "portfolio", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<16} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+            f"{result['queries']:>6} queries  {result['peak_memory_kb']:>9.1f}KB peak"
+        )
+
+    def per_home(self, user):
+        # What the same numbers cost home by home, the way the dashboard summary counts one home
+        today = date.today()
+        for home in user.homes.all():
+            Room.objects.filter(home=home).count()
+            Asset.objects.filter(room__home=home).count()
+            tasks = Task.objects.filter(home=home)
+            tasks.count()
+            tasks.filter(next_due_date__lt=today).count()
+            tasks.filter(next_due_date__gte=today).order_by("next_due_date").first()
+
+    def top_up(self, rng, options):
+        user = AppUser.objects.filter(username=BENCH_USERNAME).first()
+        if user is None:
+            user = AppUser.objects.create(
+                username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@example.com", password=hash_password("password")
+            )
+        have = user.homes.count()
+        today = date.today()
+        for start in range(have, options["homes"], 500):
+            homes, rooms, assets, tasks = [], [], [], []
+            for number in range(start, min(start + 500, options["homes"])):
+                home = Home(name=f"Bench home {number:05d}", city="Chicago", state="IL")
+                homes.append(home)
+                for room_number in range(options["rooms"]):
+                    room = Room(home=home, name=f"Room {room_number}")
+                    rooms.append(room)
+                    assets.extend(Asset(room=room, name=f"Asset {n}") for n in range(options["assets"]))
+                tasks.extend(
+                    Task(home=home, name=f"Task {n}", interval="monthly", next_due_date=today + timedelta(days=rng.randint(-30, 60)))
+                    for n in range(options["tasks"])
+                )
+            with transaction.atomic():
+                Home.objects.bulk_create(homes)
+                HomeUserConnection.objects.bulk_create(HomeUserConnection(home=home, user=user) for home in homes)
+                Room.objects.bulk_create(rooms)
+                Asset.objects.bulk_create(assets)
+                Task.objects.bulk_create(tasks)
+        if have < options["homes"]:
+            self.stdout.write(f"Added {options['homes'] - have} homes")
+            # bulk_create sends no signals
+            bump_portfolio_version(user.username)
+        return user
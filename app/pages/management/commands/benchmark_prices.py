@@ -0,0 +1,102 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from pages.benchmarks import write_results
+from pages.models import BRAND_CHOICES, ConsumableDetails
+from pages.price_fixtures import fixture_price, fixture_shops, product_page
+from pages.prices import parse_price, refresh_prices
+
+BENCH_MODEL_PREFIX = "BENCH-PRICE-"
+
+# Price refresh throughput against local fake shops (pages/price_fixtures.py), nothing leaves the machine.
+#   python manage.py benchmark_prices --parts 2000 --hosts 4 --latency 0.05 --concurrency 1 8 32
+# Adds --parts catalog parts whose retail_url points at the shops, refreshes them once per concurrency
+# level (every price changes between runs), checks the saved prices and deletes the parts again.
+# Also reports how fast pages parse on their own, the ceiling for one process however many requests fly.
+# The shops run in this process too and take their share of the CPU, so the pages/s are a floor.
+class Command(BaseCommand):
+    help = "Benchmark the part price refresh (pages/sec) against local fixture shops"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--parts", type=int, default=2000)
+        parser.add_argument("--hosts", type=int, default=4, help="Fake shops, each rate limited on its own")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+        parser.add_argument("--host-rate", type=float, default=0, help="Requests per second per shop, 0 for no limit")
+        parser.add_argument("--latency", type=float, default=0.05, help="Seconds every shop response takes")
+        parser.add_argument("--fail-every", type=int, default=20, help="Every nth part gets a 503 the first time")
+        parser.add_argument("--page-kb", type=int, default=30, help="Size of a product page")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--output", default="benchmark_prices.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        results = {"parse": self.parse_rate(options["page_kb"])}
+        self.stdout.write(f"parse only        {results['parse']['pages_per_s']:>8.1f} pages/s")
+
+        # The shops are on 127.0.0.1, which the fetcher refuses otherwise
+        with override_settings(PRICE_FETCH_PRIVATE_HOSTS=True), fixture_shops(
+            options["hosts"], options["latency"], options["fail_every"], options["page_kb"]
+        ) as shops:
+            parts = self.add_parts(shops, options["parts"])
+            try:
+                for concurrency in options["concurrency"]:
+                    for shop in shops:
+                        shop.generation += 1
+                        # New prices, and the flaky pages fail once more
+                        shop.failed.clear()
+                    parts.update(price_checked_at=None)
+                    stats = refresh_prices(
+                        parts=parts,
+                        batch_size=options["batch_size"],
+                        concurrency=concurrency,
+                        host_rate=options["host_rate"],
+                    )
+                    stats["wrong_prices"] = self.wrong_prices(parts, shops[0].generation)
+                    results[f"concurrency_{concurrency}"] = stats
+                    self.stdout.write(
+                        f"concurrency {concurrency:<5} {stats['pages_per_s']:>8.1f} pages/s  {stats['elapsed_s']:>7.2f}s  "
+                        f"{stats['updated']} updated  {stats['retries']} retries  {stats['failed']} failed  "
+                        f"{stats['wrong_prices']} wrong"
+                    )
+            finally:
+                parts.delete()
+
+        results["settings"] = {
+            key: options[key] for key in ("parts", "hosts", "host_rate", "latency", "fail_every", "page_kb", "batch_size")
+        }
+        write_results(options["output"], "prices", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def parse_rate(self, page_kb, pages=200):
+        sample = [product_page(number, 0, page_kb) for number in range(pages)]
+        start = time.perf_counter()
+        for page in sample:
+            parse_price(page)
+        elapsed = time.perf_counter() - start
+        return {"pages": pages, "pages_per_s": round(pages / elapsed, 1), "ms_per_page": round(elapsed / pages * 1000, 3)}
+
+    def add_parts(self, shops, count):
+        ConsumableDetails.objects.filter(model_number__startswith=BENCH_MODEL_PREFIX).delete()
+        brand = BRAND_CHOICES[0][0]
+        ConsumableDetails.objects.bulk_create(
+            [
+                ConsumableDetails(
+                    brand=brand,
+                    model_number=f"{BENCH_MODEL_PREFIX}{number:07d}",
+                    part_number=f"BP{number:07d}",
+                    retail_url=f"{shops[number % len(shops)].url}parts/{number}",
+                )
+                for number in range(count)
+            ],
+            batch_size=1000,
+        )
+        return ConsumableDetails.objects.filter(model_number__startswith=BENCH_MODEL_PREFIX)
+
+    def wrong_prices(self, parts, generation):
+        return sum(
+            1
+            for model_number, estimated_cost in parts.values_list("model_number", "estimated_cost").iterator()
+            if estimated_cost != fixture_price(int(model_number.removeprefix(BENCH_MODEL_PREFIX)), generation)
+        )
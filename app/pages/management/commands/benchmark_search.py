@@ -0,0 +1,159 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pages.benchmarks import measure, write_results
+from pages.logins import hash_password
+from pages.models import AppUser, Asset, Consumable, ConsumableDetails, Home, HomeUserConnection, Log, Room, Task
+from pages.search import like_ids, rebuild_search_index, search, search_terms
+
+BENCH_USERNAME = "bench-search"
+# (asset, brand, model number, consumable, part number, task)
+ASSETS = [
+    ("Water Heater", "GE", "GE40T06", "Anode rod", "WH-ANODE-44", "Flush water heater"),
+    ("Furnace", "Carrier", "59SC5A", "Furnace filter", "MERV-11-16X25", "Change furnace filter"),
+    ("Refrigerator", "Samsung", "RF28R7351SG", "Water filter", "DA29-00020B", "Replace fridge water filter"),
+    ("Dishwasher", "Whirlpool", "WDT730PAHZ", "Drain filter", "W10872845", "Clean dishwasher filter"),
+    ("Dryer", "LG", "DLE3400W", "Lint screen", "5231EL1001A", "Clean dryer vent"),
+    ("Sump Pump", "", "SP-33", "Check valve", "CV-9-9", "Test sump pump float"),
+    ("Air Conditioner", "Frigidaire", "FFRA0811U1", "Air filter", "5304483920", "Clean AC coils"),
+    ("Range Hood", "GE", "JVX5300SJSS", "Grease filter", "WB02X10733", "Replace grease filter"),
+]
+NOTES = [
+    "Replaced the magnesium anode, lots of sediment in the tank",
+    "Flushed sediment until the water ran clear",
+    "Filter was pretty dirty, swapped for a MERV 11",
+    "Small leak at the supply line, tightened the fitting",
+    "Had to call a pro",
+    "Quick job",
+    "Bought the part online",
+    "Descaled with vinegar",
+    "Vent had a lint clog near the wall cap",
+    "Float switch stuck, cleaned it and tested twice",
+    "Coils were covered in dust, rinsed them off",
+    "Replaced on schedule",
+]
+ROOMS = ["Basement", "Kitchen", "Laundry", "Garage", "Attic"]
+
+# Full-text search (pages/search.py) with a million logs in the database.
+#   python manage.py benchmark_search --logs 1000000 --homes 200 --user-homes 3 --runs 20
+# Builds --homes homes first (appliances, parts, tasks and --logs logs, most with a note picked from a
+# short list, so common words are very common) and indexes them with rebuild_search_index. The user
+# bench-search (password "password") gets --user-homes of them, the rest belong to nobody and are only
+# there to be skipped. Run it against a scratch database, a second run reuses the homes.
+# Measures the first and the next page of each --queries search, the same words with LIKE (what there
+# was to go on without the index) and saving a log with and without notes. With --max-p95-ms it fails
+# if a search is slower than that at p95.
+class Command(BaseCommand):
+    help = "Benchmark full-text search over assets, parts, tasks and log notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logs", type=int, default=1000000)
+        parser.add_argument("--homes", type=int, default=200)
+        parser.add_argument("--user-homes", type=int, default=3, help="Homes of the bench user")
+        parser.add_argument(
+            "--queries", nargs="+",
+            default=["water heater anode", "filter", "sediment", "leak supply line", "da2900020b", "lint clog vent"],
+        )
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--max-p95-ms", type=float, help="Fail if a search is slower than this at p95")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark_search.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        user = self.bench_user(random.Random(options["seed"]), options)
+        home_ids = list(user.homes.values_list("home_id", flat=True))
+        self.stdout.write(f"{Log.objects.count()} logs, {user.username} has {len(home_ids)} homes")
+
+        results = {}
+        slowest = 0
+        for query in options["queries"]:
+            first_page, cursor = search(user, query)
+            results[query] = {"first_page": measure(lambda: search(user, query), runs=options["runs"])}
+            if cursor:
+                results[query]["next_page"] = measure(lambda: search(user, query, cursor=cursor), runs=options["runs"])
+            results[query]["like"] = measure(
+                lambda: like_ids(search_terms(query), home_ids, "", None, 26), runs=max(1, options["runs"] // 4)
+            )
+            results[query]["results"] = len(first_page)
+            for case in ("first_page", "next_page"):
+                if case in results[query]:
+                    slowest = max(slowest, results[query][case]["p95_ms"])
+            for case, result in results[query].items():
+                if case != "results":
+                    self.report(f"{query[:20]} {case}", result)
+
+        task = Task.objects.filter(home_id=home_ids[0]).first()
+        today = date.today()
+        results["save_log"] = measure(lambda: Log.objects.create(task=task, completion_date=today), runs=options["runs"])
+        self.report("save log", results["save_log"])
+        results["save_log_notes"] = measure(
+            lambda: Log.objects.create(task=task, completion_date=today, notes="Replaced the anode rod"), runs=options["runs"]
+        )
+        self.report("save log + notes", results["save_log_notes"])
+
+        results["settings"] = {key: options[key] for key in ("logs", "homes", "user_homes")}
+        write_results(options["output"], "search", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if options["max_p95_ms"] and slowest > options["max_p95_ms"]:
+            raise CommandError(f"A search took {slowest}ms at p95, over --max-p95-ms {options['max_p95_ms']}.")
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<28} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  {result['queries']:>4} queries"
+        )
+
+    def bench_user(self, rng, options):
+        user = AppUser.objects.filter(username=BENCH_USERNAME).first()
+        if user is None:
+            user = AppUser.objects.create(
+                username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@example.com", password=hash_password("password")
+            )
+        if not user.homes.exists():
+            start = time.perf_counter()
+            homes = self.build_homes(rng, options)
+            HomeUserConnection.objects.bulk_create(HomeUserConnection(home=home, user=user) for home in homes[: options["user_homes"]])
+            self.stdout.write(f"Built {len(homes)} homes in {time.perf_counter() - start:.1f}s")
+            start = time.perf_counter()
+            written = rebuild_search_index([home.home_id for home in homes])
+            self.stdout.write(f"Indexed {written} entries in {time.perf_counter() - start:.1f}s")
+        return user
+
+    def build_homes(self, rng, options, batch_size=10000):
+        with transaction.atomic():
+            homes = Home.objects.bulk_create(Home(name=f"Search home {number:04d}") for number in range(options["homes"]))
+            rooms = Room.objects.bulk_create(Room(home=home, name=name) for home in homes for name in ROOMS)
+            # Catalog parts, shared like the real ones
+            parts = {
+                row: ConsumableDetails.objects.get_or_create(brand=row[1], model_number=row[2], part_number=row[4], owner=None)[0]
+                for row in ASSETS
+            }
+            assets, consumables, tasks = [], [], []
+            for room in rooms:
+                for row in rng.sample(ASSETS, 3):
+                    name, brand, model_number, consumable_name, _, task_name = row
+                    asset = Asset(room=room, name=name, brand=brand, model_number=model_number, category="appliance")
+                    consumable = Consumable(asset=asset, name=consumable_name, details=parts[row])
+                    assets.append(asset)
+                    consumables.append(consumable)
+                    tasks.append(Task(home=room.home, room=room, asset=asset, consumable=consumable, name=task_name, interval="quarterly"))
+            Asset.objects.bulk_create(assets, batch_size=batch_size)
+            Consumable.objects.bulk_create(consumables, batch_size=batch_size)
+            Task.objects.bulk_create(tasks, batch_size=batch_size)
+        start = date.today() - timedelta(days=3650)
+        for first in range(0, options["logs"], batch_size):
+            with transaction.atomic():
+                Log.objects.bulk_create(
+                    Log(
+                        task=rng.choice(tasks),
+                        completion_date=start + timedelta(days=rng.randrange(3650)),
+                        # Most logs say something
+                        notes=rng.choice(NOTES) if rng.random() < 0.7 else "",
+                    )
+                    for _ in range(first, min(first + batch_size, options["logs"]))
+                )
+        return homes
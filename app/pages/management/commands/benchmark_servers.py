@@ -0,0 +1,185 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from importlib import import_module
+from pathlib import Path
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from pages.benchmarks import percentile, write_results
+from pages.models import AppUser
+
+# Throughput of the real servers under concurrent clients: gunicorn with threaded WSGI workers and the
+# sync views, against gunicorn with uvicorn workers and the async views (gunicorn.conf.py for both).
+# Each server is started on its own, hit with --concurrency clients at once, then stopped.
+#   python manage.py benchmark_servers --concurrency 32 --requests 400 --output servers.json
+# Both servers use the configured database, seed it first with generate_data. More than one worker needs
+# REDIS_URL like any gunicorn run (gunicorn.conf.py), or pass --workers 1.
+
+APP_DIR = Path(settings.BASE_DIR)
+
+SERVERS = {
+    "wsgi": {"GUNICORN_WORKER_CLASS": "gthread", "ASYNC_VIEWS": "False"},
+    "asgi": {"GUNICORN_WORKER_CLASS": "uvicorn.workers.UvicornWorker", "ASYNC_VIEWS": "True"},
+}
+PATHS = ("/pages/dashboard/", "/pages/manage-homes/", "/pages/api/tasks/")
+
+
+class Command(BaseCommand):
+    help = "Compare WSGI (sync views) and ASGI (async views) throughput under concurrent clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", help="User to benchmark as (defaults to the user with the most tasks)")
+        parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+        parser.add_argument("--path", action="append", dest="paths", help="Path to request (repeatable)")
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--threads", type=int, default=4, help="Threads per WSGI worker")
+        parser.add_argument("--concurrency", type=int, default=32, help="Clients sending requests at the same time")
+        parser.add_argument("--requests", type=int, default=400, help="Requests per path")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--output", default="benchmark_servers.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["username"])
+        # A logged in session both servers accept, they share the database
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session["username"] = user.username
+        home = user.homes.first()
+        if home:
+            session["home_id"] = str(home.home_id)
+        session.create()
+
+        paths = options["paths"] or PATHS
+        results = {}
+        try:
+            for name in options["servers"]:
+                with self.server(name, options):
+                    results[name] = asyncio.run(self.load(options, session.session_key, paths))
+                for path, numbers in results[name].items():
+                    self.stdout.write(
+                        f"{name:<5} {path:<24} {numbers['requests_per_s']:>8.1f} req/s  p50 {numbers['p50_ms']:>8.1f}ms  "
+                        f"p95 {numbers['p95_ms']:>8.1f}ms  {numbers['errors']} errors"
+                    )
+        finally:
+            session.delete()
+
+        results["settings"] = {
+            key: options[key] for key in ("workers", "threads", "concurrency", "requests")
+        }
+        results["user"] = {"username": user.username, "homes": user.homes.count()}
+        write_results(options["output"], "servers", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def server(self, name, options):
+        env = {
+            **os.environ,
+            **SERVERS[name],
+            "PORT": str(options["port"]),
+            "WEB_CONCURRENCY": str(options["workers"]),
+            "GUNICORN_THREADS": str(options["threads"]) if name == "wsgi" else "1",
+            "GUNICORN_ACCESS_LOG": "",
+            "DJANGO_ALLOWED_HOSTS": "127.0.0.1",
+            "REQUEST_METRICS_SLOW_MS": "1000000",
+        }
+        return RunningServer(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{options['port']}"],
+            env,
+            options["port"],
+        )
+
+    async def load(self, options, session_key, paths):
+        limits = httpx.Limits(max_connections=options["concurrency"])
+        results = {}
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{options['port']}",
+            cookies={settings.SESSION_COOKIE_NAME: session_key},
+            limits=limits,
+            timeout=60,
+        ) as client:
+            for path in paths:
+                # Warm up, the first requests pay for imports and connections
+                await asyncio.gather(*(client.get(path) for _ in range(options["concurrency"])))
+                results[path] = await self.hammer(client, path, options["requests"], options["concurrency"])
+        return results
+
+    async def hammer(self, client, path, total, concurrency):
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(path)
+        timings = []
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {
+            "requests": total,
+            "errors": errors,
+            "requests_per_s": round(total / elapsed, 1),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+            "mean_ms": round(statistics.fmean(timings), 1),
+        }
+
+    def get_user(self, username):
+        if username:
+            user = AppUser.objects.filter(username=username).first()
+            if not user:
+                raise CommandError(f"User {username} does not exist.")
+            return user
+        user = AppUser.objects.annotate(task_count=Count("homes__tasks")).order_by("-task_count").first()
+        if not user:
+            raise CommandError("No users found. Run generate_data first.")
+        return user
+
+
+class RunningServer:
+    """Starts gunicorn on enter, waits until it accepts connections, stops it on exit."""
+
+    def __init__(self, command, env, port, startup_timeout=30):
+        self.command = command
+        self.env = env
+        self.port = port
+        self.startup_timeout = startup_timeout
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=APP_DIR, env=self.env)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"Server exited with {self.process.returncode}, is gunicorn installed?")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise CommandError("Server didn't start in time.")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
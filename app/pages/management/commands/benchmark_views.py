@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from pages.benchmarks import measure, write_results
+from pages.models import AppUser
+
+# Drives the real views through the Django test client against whatever database is configured.
+# Seed first with generate_data, then e.g.
+#   python manage.py benchmark_views --runs 50 --output before.json --label $(git rev-parse --short HEAD)
+class Command(BaseCommand):
+    help = "Benchmark login, dashboard and manage homes (p50/p95 latency, queries, peak memory)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", help="User to benchmark as (defaults to the user with the most tasks)")
+        parser.add_argument("--password", default="password", help="Password for the login benchmark")
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--output", default="benchmark_views.json", help="Where to write the JSON results")
+        parser.add_argument("--label", default="", help="Free text stored with the results, e.g. a commit hash")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["username"])
+        password = options["password"]
+
+        # The test client always talks to "testserver"
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            client = Client()
+            response = client.post("/pages/login/", {"username": user.username, "password": password})
+            if response.status_code != 302:
+                raise CommandError(f"Could not log in as {user.username}, check --password.")
+
+            login_client = Client()
+            views = {
+                "login": lambda: login_client.post("/pages/login/", {"username": user.username, "password": password}),
+                "dashboard_view": lambda: client.get("/pages/dashboard/"),
+                "manage_homes_view": lambda: client.get("/pages/manage-homes/"),
+            }
+            results = {}
+            for name, fn in views.items():
+                results[name] = measure(fn, runs=options["runs"], warmup=options["warmup"])
+                self.stdout.write(
+                    f"{name:<20} p50 {results[name]['p50_ms']:>9.2f}ms  p95 {results[name]['p95_ms']:>9.2f}ms  "
+                    f"{results[name]['queries']:>4} queries  {results[name]['peak_memory_kb']:>9.1f}KB peak"
+                )
+
+        results["user"] = {
+            "username": user.username,
+            "homes": user.homes.count(),
+            "tasks": user.homes.aggregate(total=Count("tasks"))["total"],
+        }
+        write_results(options["output"], "views", results, label=options["label"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def get_user(self, username):
+        if username:
+            user = AppUser.objects.filter(username=username).first()
+            if not user:
+                raise CommandError(f"User {username} does not exist.")
+            return user
+        user = AppUser.objects.annotate(task_count=Count("homes__tasks")).order_by("-task_count").first()
+        if not user:
+            raise CommandError("No users found. Run generate_data first.")
+        return user
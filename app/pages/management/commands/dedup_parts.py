@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from pages.parts import dedup_parts
+
+# Folds the per-user consumable details from before the parts catalog into it (pages/parts.py):
+# drops rows nothing points at, merges rows that are the same part at the same cost into one, then
+# makes the most used row of every part nobody shares yet the catalog's. Works batch by batch in
+# short transactions, safe to stop and run again.
+class Command(BaseCommand):
+    help = "Collapse duplicate consumable details into the shared parts catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Groups/rows per transaction")
+
+    def handle(self, *args, **options):
+        counts = dedup_parts(options["batch_size"])
+        summary = ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Parts catalog: {summary}."))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from pages.models import Asset, Consumable, Home, Task
+from pages.queries import (
+    dashboard_assets,
+    dashboard_logs,
+    dashboard_rooms,
+    dashboard_tasks,
+    get_due_soon_tasks,
+)
+
+# Prints the query plans for the dashboard queries so we can check the indexes are actually used.
+# Run it against a seeded database: python manage.py explain_dashboard --analyze
+# On Postgres the due soon and log queries should show index scans on task_home_due_idx / log_task_completed_idx.
+class Command(BaseCommand):
+    help = "Print EXPLAIN plans for the dashboard queries of a home"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--home", help="home_id to explain (defaults to the home with the most tasks)")
+        parser.add_argument("--analyze", action="store_true", help="Run EXPLAIN ANALYZE (Postgres only)")
+
+    def handle(self, *args, **options):
+        home = self.get_home(options["home"])
+        explain_options = {}
+        # SQLite doesn't accept any explain options
+        if options["analyze"] and connection.vendor == "postgresql":
+            explain_options = {"analyze": True, "buffers": True}
+
+        tasks = dashboard_tasks(Task.objects.filter(home=home))
+        queries = [
+            ("Rooms with asset counts", dashboard_rooms(home)),
+            ("Assets", dashboard_assets(Asset.objects.filter(room__home=home))),
+            # The prefetch runs as its own query, so explain it separately
+            ("Asset consumables (prefetch)", Consumable.objects.filter(asset__room__home=home).select_related("details")),
+            ("Tasks", tasks),
+            ("Due soon", get_due_soon_tasks(tasks)),
+            ("Activity log", dashboard_logs(tasks)),
+        ]
+
+        self.stdout.write(f"Home {home.name} ({home.home_id}) on {connection.vendor}")
+        for label, queryset in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+            self.stdout.write(queryset.explain(**explain_options))
+
+    def get_home(self, home_id):
+        if home_id:
+            home = Home.objects.filter(home_id=home_id).first()
+            if not home:
+                raise CommandError(f"Home {home_id} does not exist.")
+            return home
+        home = Home.objects.annotate(task_count=Count("tasks")).order_by("-task_count").first()
+        if not home:
+            raise CommandError("No homes found. Seed the database first.")
+        return home
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.export import EXPORT_FORMATS, SECTIONS, export_blocks
+from pages.models import AppUser, Home
+
+# Bulk version of the export view, e.g. for an insurer that wants every home of an account:
+#   python manage.py export_history --user owner01 --format zip --output owner01.zip
+#   python manage.py export_history --home <id> --home <id> --format jsonl > history.jsonl
+class Command(BaseCommand):
+    help = "Stream the full maintenance history of one or more homes as CSV, JSONL or zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--home", action="append", default=[], help="home_id to export (repeat for more)")
+        parser.add_argument("--user", help="Export every home of this username")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="zip")
+        parser.add_argument("--section", choices=list(SECTIONS), default="logs", help="Which section a csv export holds")
+        parser.add_argument("--output", help="File to write, defaults to stdout")
+
+    def handle(self, *args, **options):
+        homes = Home.objects.filter(home_id__in=options["home"])
+        if options["user"]:
+            user = AppUser.objects.filter(username=options["user"]).first()
+            if not user:
+                raise CommandError(f"User {options['user']} does not exist.")
+            homes = homes | user.homes.all()
+        home_ids = list(homes.values_list("home_id", flat=True).distinct())
+        if not home_ids:
+            raise CommandError("Nothing to export, pass --home and/or --user.")
+
+        blocks = export_blocks(home_ids, options["format"], options["section"])
+        written = 0
+        if options["output"]:
+            with open(options["output"], "wb") as handle:
+                for block in blocks:
+                    handle.write(block)
+                    written += len(block)
+            self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes for {len(home_ids)} homes to {options['output']}."))
+        else:
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,206 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pages.models import (
+    AppUser,
+    Asset,
+    BRAND_CHOICES,
+    Consumable,
+    Home,
+    HomeUserConnection,
+    INTERVAL_DAY_MAP,
+    Log,
+    Room,
+    Task,
+)
+from pages.logins import hash_password
+from pages.parts import catalog_parts
+from pages.recurrence import materialize
+from pages.views import compute_next_due_date
+
+# Replaces the old load_assets no-op. Bulk generates users, homes, rooms, assets, consumables,
+# tasks and years of logs so we can reproduce production sized homes locally.
+# The distributions are rough guesses at what a real account looks like, not exact.
+
+ROOM_NAMES = [
+    "Kitchen", "Living Room", "Master Bedroom", "Bedroom", "Bathroom", "Garage",
+    "Basement", "Laundry Room", "Office", "Dining Room", "Attic", "Patio",
+]
+ASSET_NAMES = {
+    "appliance": ["Refrigerator", "Dishwasher", "Washer", "Dryer", "Furnace", "Water Heater", "Range Hood", "Air Purifier", "Humidifier"],
+    "general": ["Smoke Detector", "Ceiling Fan", "Faucet", "Window", "Gutter", "Light Fixture", "Garage Door"],
+    "furniture": ["Sofa", "Bed Frame", "Dining Table", "Bookshelf", "Desk"],
+}
+CONSUMABLE_NAMES = ["Water Filter", "Air Filter", "HEPA Filter", "Anode Rod", "Grease Filter", "Wick Filter"]
+NOTES = ["Replaced on schedule", "Was pretty dirty", "Bought the part online", "Had to call a pro", "Quick job"]
+
+# (value, weight) pairs
+CATEGORY_WEIGHTS = [("general", 50), ("appliance", 35), ("furniture", 15)]
+INTERVAL_WEIGHTS = [("daily", 2), ("weekly", 10), ("monthly", 40), ("quarterly", 30), ("yearly", 18)]
+HOMES_PER_USER_WEIGHTS = [(1, 85), (2, 10), (3, 4), (10, 1)]
+
+# Appliances come out of a fixed pool of models so different users own the same one and share its
+# catalog part (pages/parts.py). Fixed seed, reruns with other --seed values still agree on the costs.
+_pool_rng = random.Random(394)
+APPLIANCE_MODELS = [
+    (
+        brand,
+        f"M{_pool_rng.randint(10000, 99999)}",
+        f"P{_pool_rng.randint(100000, 999999)}",
+        Decimal(_pool_rng.randint(500, 8000)) / 100,
+    )
+    for brand, _ in BRAND_CHOICES
+    for _ in range(200)
+]
+
+
+def weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights)[0]
+
+
+class Command(BaseCommand):
+    help = "Bulk generate users, homes, rooms, assets, consumables, tasks and logs for local load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10, help="Number of users to create")
+        parser.add_argument("--years", type=int, default=3, help="Years of log history per task")
+        parser.add_argument("--rooms-per-home", type=int, default=10, help="Max rooms per home")
+        parser.add_argument("--assets-per-room", type=int, default=8, help="Max assets per room")
+        parser.add_argument("--prefix", default="seed", help="Username prefix")
+        parser.add_argument("--password", default="password", help="Password for every generated user")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed so runs are reproducible")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows per bulk_create")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if len(prefix) > 15:
+            raise CommandError("Prefix must be 15 characters or less (usernames max out at 20).")
+
+        self.rng = random.Random(options["seed"])
+        self.years = options["years"]
+        self.rooms_per_home = options["rooms_per_home"]
+        self.assets_per_room = options["assets_per_room"]
+        self.batch_size = options["batch_size"]
+        self.today = date.today()
+        self.totals = {}
+        self.reset_buffers()
+
+        # Hashed once and shared, hashing on purpose takes long enough that thousands of users would crawl
+        password = hash_password(options["password"])
+        # Continue numbering after earlier runs with the same prefix
+        offset = AppUser.objects.filter(username__startswith=prefix).count()
+        for number in range(offset, offset + options["users"]):
+            self.add_user(f"{prefix}{number:05d}", password)
+            if self.pending >= self.batch_size:
+                self.flush()
+        self.flush()
+        # Upcoming due dates for the calendar/reminder queries
+        self.totals["task occurrences"] = materialize(
+            Task.objects.filter(home__in=Home.objects.filter(users__username__startswith=prefix)),
+            chunk_size=self.batch_size,
+        )
+
+        summary = ", ".join(f"{count} {name}" for name, count in self.totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary}."))
+
+    def reset_buffers(self):
+        # Insert order matters, every model only points at models earlier in this list
+        self.buffers = {
+            Home: [],
+            AppUser: [],
+            HomeUserConnection: [],
+            Room: [],
+            Asset: [],
+            Consumable: [],
+            Task: [],
+            Log: [],
+        }
+        # (consumable, part) pairs, resolved against the parts catalog on flush
+        self.pending_parts = []
+        self.pending = 0
+
+    def add(self, obj):
+        self.buffers[type(obj)].append(obj)
+        self.pending += 1
+        return obj
+
+    def flush(self):
+        with transaction.atomic():
+            if self.pending_parts:
+                # Pool parts always have the pool cost, so these are all catalog rows
+                parts = catalog_parts([part for _, part in self.pending_parts], None)
+                for consumable, part in self.pending_parts:
+                    consumable.details = parts[part]
+            for model, objects in self.buffers.items():
+                if objects:
+                    model.objects.bulk_create(objects, batch_size=self.batch_size)
+                    name = model._meta.verbose_name_plural
+                    self.totals[name] = self.totals.get(name, 0) + len(objects)
+        self.reset_buffers()
+
+    def add_user(self, username, password_hash):
+        rng = self.rng
+        user = self.add(AppUser(username=username, email=f"{username}@example.com", password=password_hash))
+        for home_number in range(weighted(rng, HOMES_PER_USER_WEIGHTS)):
+            home = self.add(Home(
+                name=f"{username} home {home_number + 1}",
+                address=f"{rng.randint(1, 9999)} Main St",
+                city="Chicago",
+                state="IL",
+                zip_code=f"{rng.randint(60601, 60661)}",
+            ))
+            self.add(HomeUserConnection(home=home, user=user))
+            for room_name in rng.sample(ROOM_NAMES, k=min(len(ROOM_NAMES), rng.randint(2, self.rooms_per_home))):
+                self.add_room(home, room_name)
+
+    def add_room(self, home, room_name):
+        rng = self.rng
+        room = self.add(Room(home=home, name=room_name))
+        for _ in range(rng.randint(1, self.assets_per_room)):
+            category = weighted(rng, CATEGORY_WEIGHTS)
+            brand, model_number, part_number, cost = rng.choice(APPLIANCE_MODELS)
+            asset = self.add(Asset(
+                name=rng.choice(ASSET_NAMES[category]),
+                category=category,
+                brand=brand if category == "appliance" else "",
+                model_number=model_number if category == "appliance" else "",
+                room=room,
+            ))
+            if category == "appliance" and rng.random() < 0.6:
+                consumable = self.add(Consumable(name=rng.choice(CONSUMABLE_NAMES), asset=asset))
+                self.pending_parts.append((consumable, (brand, model_number, part_number, cost)))
+                self.add_task(home, room, asset, f"Replace {consumable.name}", consumable=consumable, cost=cost)
+            elif rng.random() < 0.3:
+                self.add_task(home, room, asset, f"Inspect {asset.name}")
+        # A few room level chores
+        for _ in range(rng.randint(0, 2)):
+            self.add_task(home, room, None, f"Clean {room_name}")
+
+    def add_task(self, home, room, asset, name, consumable=None, cost=None):
+        rng = self.rng
+        interval = weighted(rng, INTERVAL_WEIGHTS)
+        task = self.add(Task(name=name, interval=interval, home=home, room=room, asset=asset, consumable=consumable))
+
+        # Walk backwards from today one interval at a time with a bit of jitter
+        step = INTERVAL_DAY_MAP[interval]
+        jitter = min(3, step // 4)
+        oldest = self.today - timedelta(days=365 * self.years)
+        completed = self.today - timedelta(days=rng.randint(0, step))
+        last_completed = completed
+        while completed >= oldest:
+            self.add(Log(
+                task=task,
+                completion_date=completed,
+                cost=cost if cost is not None else (Decimal(rng.randint(0, 5000)) / 100 if rng.random() < 0.2 else None),
+                notes=rng.choice(NOTES) if rng.random() < 0.2 else "",
+            ))
+            completed -= timedelta(days=step + rng.randint(-jitter, jitter))
+
+        task.last_completed_date = last_completed
+        task.next_due_date = compute_next_due_date(interval, last_completed)
+        return task
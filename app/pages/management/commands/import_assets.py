@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.importer import IMPORT_CHUNK_SIZE, AssetImporter, ImportFileError, guess_format, read_rows, text_stream
+from pages.models import AppUser
+
+# Bulk onboarding from a CSV/JSONL export, see pages/importer.py for the columns.
+#   python manage.py import_assets units.csv --user manager01
+# Rows without a home column go into --home, otherwise each home is looked up (or created) by name.
+class Command(BaseCommand):
+    help = "Import rooms, assets, consumables and tasks from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file, - for stdin")
+        parser.add_argument("--user", required=True, help="Username that owns the imported homes")
+        parser.add_argument("--home", help="home_id for rows without a home column")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Rows per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Check every row but don't write anything")
+
+    def handle(self, *args, **options):
+        user = AppUser.objects.filter(username=options["user"]).first()
+        if not user:
+            raise CommandError(f"User {options['user']} does not exist.")
+        home = None
+        if options["home"]:
+            home = user.homes.filter(home_id=options["home"]).first()
+            if not home:
+                raise CommandError(f"Home {options['home']} does not belong to {user.username}.")
+
+        path = options["path"]
+        file_format = options["format"] or guess_format(path)
+        importer = AssetImporter(user, home=home, chunk_size=options["chunk_size"], dry_run=options["dry_run"])
+        try:
+            if path == "-":
+                importer.run(read_rows(text_stream(sys.stdin.buffer), file_format))
+            else:
+                with open(path, "rb") as binary_file:
+                    importer.run(read_rows(text_stream(binary_file), file_format))
+        except (ImportFileError, OSError) as error:
+            raise CommandError(f"{error} ({importer.imported} rows were imported before this.)")
+
+        for line_number, errors in importer.errors:
+            self.stderr.write(f"Line {line_number}: {' '.join(errors)}")
+        if importer.error_count > len(importer.errors):
+            self.stderr.write(f"... and {importer.error_count - len(importer.errors)} more bad rows.")
+
+        created = ", ".join(f"{count} {name}" for name, count in importer.totals.items()) or "nothing"
+        verb = "Would import" if options["dry_run"] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {importer.imported} rows ({created}), skipped {importer.error_count} bad rows."
+        ))
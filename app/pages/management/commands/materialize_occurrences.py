@@ -0,0 +1,24 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from pages.models import Task
+from pages.recurrence import OCCURRENCE_WINDOW_DAYS, materialize
+
+# Rolls the TaskOccurrence window forward for every task. Logging a task already does this for
+# that one task, run this daily (cron) so the window keeps moving for everything else.
+class Command(BaseCommand):
+    help = "Materialize upcoming task occurrences for every task"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=OCCURRENCE_WINDOW_DAYS, help="How many days ahead to materialize")
+        parser.add_argument("--home", help="Only this home_id")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        tasks = Task.objects.all()
+        if options["home"]:
+            tasks = tasks.filter(home_id=options["home"])
+        until = date.today() + timedelta(days=options["days"])
+        written = materialize(tasks, until=until, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Materialized {written} occurrences through {until}."))
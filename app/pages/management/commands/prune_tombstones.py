@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from pages.sync import prune_tombstones, tombstone_retention
+
+# Deletes sync tombstones older than SYNC_TOMBSTONE_DAYS. Clients with an older token get a 410
+# and do a full sync instead, so nothing is lost. Run daily (cron) next to materialize_occurrences.
+class Command(BaseCommand):
+    help = "Delete delta sync tombstones past their retention"
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones older than {tombstone_retention().days} days."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pages.search import rebuild_search_index
+
+# Rebuilds the search entries (pages/search.py) from the assets, consumables, tasks and log notes. Run it
+# once after migrating, and after bulk loads that skip signals (generate_data, benchmark_export).
+# Saved objects keep their entries current on their own.
+class Command(BaseCommand):
+    help = "Rebuild the full-text search entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--home", action="append", dest="homes", help="Only this home_id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = rebuild_search_index(options["homes"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} search entries."))
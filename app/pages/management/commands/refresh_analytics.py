@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pages.analytics import rebuild_monthly_spend
+
+# Rebuilds the MonthlySpend rollup the analytics page reads when ANALYTICS_ROLLUP is on. Run it once
+# before turning the setting on, and after bulk loads that skip signals (generate_data, benchmark_export).
+# Saved and deleted logs keep it current on their own.
+class Command(BaseCommand):
+    help = "Rebuild the monthly spend rollup used by the analytics page"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--home", action="append", dest="homes", help="Only this home_id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = rebuild_monthly_spend(options["homes"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} monthly spend rows."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from pages.prices import refresh_prices
+
+# Re-reads part prices from their retail_url, for parts not checked in PRICE_REFRESH_DAYS (pages/prices.py).
+# Run it from cron, e.g. nightly. Pages that fail are left due and tried again on the next run.
+class Command(BaseCommand):
+    help = "Refresh part prices from their retail pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Parts per bulk update")
+        parser.add_argument("--limit", type=int, help="Stop after this many parts")
+        parser.add_argument("--concurrency", type=int, help="Pages in flight at once (PRICE_FETCH_CONCURRENCY)")
+        parser.add_argument("--host-rate", type=float, help="Requests per second per site, 0 for no limit (PRICE_HOST_RATE)")
+
+    def handle(self, *args, **options):
+        stats = refresh_prices(
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            concurrency=options["concurrency"],
+            host_rate=options["host_rate"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {stats['checked']} parts: {stats['updated']} new prices, {stats['unchanged']} unchanged, "
+            f"{stats['no_price']} without a price, {stats['failed']} failed "
+            f"({stats['pages']} pages in {stats['elapsed_s']}s, {stats['pages_per_s']} pages/s, {stats['retries']} retries)."
+        ))
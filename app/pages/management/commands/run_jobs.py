@@ -0,0 +1,83 @@
+import json
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pages.jobs import WorkerStats, claim, retry_failed, run
+from pages.models import Job
+
+# The background job worker (pages/jobs.py), needs JOB_QUEUE=True on the web app to get any jobs.
+#   python manage.py run_jobs                      run until stopped (SIGTERM/Ctrl-C finish the current job first)
+#   python manage.py run_jobs --burst              run what's queued, then exit (cron, or a benchmark)
+#   python manage.py run_jobs --retry-failed       put failed jobs back in the queue first
+# Run as many as you like side by side, a job only goes to one of them. Throughput (jobs/s, per job
+# p50/p95 run time and how long jobs waited) is printed every --stats-every seconds and on exit.
+class Command(BaseCommand):
+    help = "Run queued background jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10, help="Jobs claimed per query")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty")
+        parser.add_argument("--max-jobs", type=int, help="Exit after this many jobs")
+        parser.add_argument("--only", action="append", dest="names", help="Only jobs with this name (repeatable)")
+        parser.add_argument("--retry-failed", action="store_true", help="Requeue failed jobs before starting")
+        parser.add_argument("--stats-every", type=float, default=60, help="Seconds between throughput lines")
+        parser.add_argument("--stats-file", help="Also write the final throughput numbers here as JSON")
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            self.stdout.write(f"Requeued {retry_failed(options['names'])} failed jobs.")
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        stats = WorkerStats()
+        last_report = time.monotonic()
+        try:
+            while not self.stopping:
+                # Same as the end of a request: drop connections that are broken or past CONN_MAX_AGE
+                close_old_connections()
+                jobs = claim(worker, options["batch"], options["names"])
+                if not jobs:
+                    if options["burst"]:
+                        break
+                    time.sleep(options["sleep"])
+                for job in jobs:
+                    if self.stopping:
+                        # Unstarted claims come back once their visibility timeout is up
+                        break
+                    start = time.perf_counter()
+                    ok = run(job)
+                    stats.record(job, time.perf_counter() - start, ok)
+                if options["max_jobs"] and sum(len(times) for times in stats.durations.values()) >= options["max_jobs"]:
+                    break
+                if time.monotonic() - last_report >= options["stats_every"]:
+                    self.report(stats)
+                    last_report = time.monotonic()
+        finally:
+            self.report(stats)
+            if options["stats_file"]:
+                with open(options["stats_file"], "w") as handle:
+                    json.dump(stats.summary(), handle, indent=2)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def report(self, stats):
+        summary = stats.summary()
+        waiting = Job.objects.filter(status=Job.QUEUED).count()
+        self.stdout.write(
+            f"{summary['jobs']} jobs in {summary['elapsed_s']}s ({summary['jobs_per_s']} jobs/s), "
+            f"{summary['failed']} failed, {waiting} queued"
+        )
+        for name, numbers in summary["by_name"].items():
+            self.stdout.write(
+                f"  {name:<24} {numbers['jobs']:>7} jobs  p50 {numbers['p50_ms']:>8.2f}ms  "
+                f"p95 {numbers['p95_ms']:>8.2f}ms  lag p95 {numbers['lag_p95_ms']:>9.1f}ms  {numbers['failed']} failed"
+            )
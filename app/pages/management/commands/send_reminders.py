@@ -0,0 +1,118 @@
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from pages.models import ReminderDelivery, Task
+
+USER = "home__home_user_connections__user_id"
+
+# Emails every user a digest of their due and overdue tasks across all of their homes.
+# Tasks are streamed in keyset pages ordered by (user, task) so a user's tasks arrive together and
+# memory stays flat no matter how many tasks there are. ReminderDelivery rows make re-runs safe:
+# a task is only mailed once per due date.
+class Command(BaseCommand):
+    help = "Email users a digest of tasks that are due soon or overdue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Include tasks due within this many days")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Tasks per keyset page")
+        parser.add_argument("--send-batch", type=int, default=100, help="Emails per send_messages call")
+        parser.add_argument("--dry-run", action="store_true", help="Build the digests but don't send or record anything")
+
+    def handle(self, *args, **options):
+        self.today = date.today()
+        self.dry_run = options["dry_run"]
+        self.send_batch = options["send_batch"]
+        cutoff = self.today + timedelta(days=options["days"])
+
+        self.outbox = []
+        self.deliveries = []
+        self.sent = 0
+        self.skipped = 0
+        # One SMTP connection for the whole run
+        self.connection = get_connection()
+        started = time.perf_counter()
+        scanned = 0
+
+        current_user = None
+        digest = []
+        for chunk in self.stream_due_tasks(cutoff, options["chunk_size"]):
+            scanned += len(chunk)
+            already_sent = self.already_sent(chunk)
+            for row in chunk:
+                user_id = row[0]
+                if user_id != current_user:
+                    self.queue_digest(current_user, digest)
+                    current_user, digest = user_id, []
+                if (user_id, row[2], row[4]) in already_sent:
+                    self.skipped += 1
+                    continue
+                digest.append(row)
+        self.queue_digest(current_user, digest)
+        self.send_outbox()
+        self.connection.close()
+
+        elapsed = time.perf_counter() - started
+        rate = scanned / elapsed * 60 if elapsed else 0
+        verb = "Would send" if self.dry_run else "Sent"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {self.sent} digests. Scanned {scanned} due tasks ({self.skipped} already reminded) "
+            f"in {elapsed:.2f}s, {rate:,.0f} tasks/minute."
+        ))
+
+    def stream_due_tasks(self, cutoff, chunk_size):
+        """Yield lists of (user_id, email, task_id, task_name, next_due_date, home_name), keyset paginated."""
+        fields = (USER, "home__home_user_connections__user__email", "task_id", "name", "next_due_date", "home__name")
+        last = None
+        while True:
+            # Everything has to be in one filter() call so the connection join is shared
+            condition = Q(next_due_date__lte=cutoff, home__home_user_connections__isnull=False)
+            if last:
+                condition &= Q(**{f"{USER}__gt": last[0]}) | Q(**{USER: last[0], "task_id__gt": last[1]})
+            queryset = Task.objects.filter(condition).order_by(USER, "task_id").values_list(*fields)[:chunk_size]
+            chunk = list(queryset.iterator(chunk_size=chunk_size))
+            if not chunk:
+                return
+            yield chunk
+            last = (chunk[-1][0], chunk[-1][2])
+
+    def already_sent(self, chunk):
+        task_ids = {row[2] for row in chunk}
+        sent = ReminderDelivery.objects.filter(task_id__in=task_ids).values_list("user_id", "task_id", "due_date")
+        return set(sent)
+
+    def queue_digest(self, user_id, rows):
+        if not rows or not rows[0][1]:
+            return
+        lines = []
+        # Rows arrive in task_id order for the keyset, read nicer by due date
+        for _, _, _, name, due_date, home_name in sorted(rows, key=lambda row: row[4]):
+            days = (due_date - self.today).days
+            when = f"{-days} days overdue" if days < 0 else "due today" if days == 0 else f"due in {days} days"
+            lines.append(f"- {name} ({home_name}): {when} ({due_date:%b %d, %Y})")
+        body = "Hi {user},\n\nThese maintenance tasks need attention:\n\n{lines}\n\n- Upkeep".format(
+            user=user_id, lines="\n".join(lines)
+        )
+        subject = f"Upkeep: {len(rows)} task{'s' if len(rows) != 1 else ''} due soon"
+        self.outbox.append(EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [rows[0][1]]))
+        self.deliveries.extend(
+            ReminderDelivery(user_id=user_id, task_id=task_id, due_date=due_date)
+            for _, _, task_id, _, due_date, _ in rows
+        )
+        if len(self.outbox) >= self.send_batch:
+            self.send_outbox()
+
+    def send_outbox(self):
+        if not self.outbox:
+            return
+        if not self.dry_run:
+            self.connection.send_messages(self.outbox)
+            # Record after sending. If the run dies in between, those users get the digest again next time
+            ReminderDelivery.objects.bulk_create(self.deliveries, batch_size=1000, ignore_conflicts=True)
+        self.sent += len(self.outbox)
+        self.outbox = []
+        self.deliveries = []
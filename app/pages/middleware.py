@@ -0,0 +1,180 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .current import acurrent_home, acurrent_user, current_home, current_user
+
+logger = logging.getLogger("pages.metrics")
+
+# IN (%s, %s, %s) lists change length with the data, collapse them so the same query fingerprints the same
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+def fingerprint(sql):
+    return IN_LIST_RE.sub("IN (...)", sql)
+
+
+class RequestMetrics:
+    """Numbers collected for one request. Lives on request.metrics while the request runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_name = None
+        self.slow_ms = None
+        self.query_count = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.fingerprints = Counter()
+
+    # connection.execute_wrapper hook. Works with DEBUG off, unlike connection.queries
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - start) * 1000
+            self.query_count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def duplicates(self):
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+    def server_timing(self, total_ms):
+        duplicate_count = sum(count - 1 for _, count in self.duplicates())
+        return ", ".join([
+            f"total;dur={total_ms:.1f}",
+            f'db;dur={self.sql_ms:.1f};desc="{self.query_count} queries"',
+            f"tpl;dur={self.template_ms:.1f}",
+            f'dup;desc="{duplicate_count} duplicate queries"',
+        ])
+
+
+def slow_after(setting, default):
+    """For views that are slow on purpose (password hashing): they're logged past settings.<setting> ms
+    instead of REQUEST_METRICS_SLOW_MS, so every login doesn't show up as a slow request."""
+    def decorator(view):
+        view.metrics_slow_ms = lambda: getattr(settings, setting, default)
+        return view
+    return decorator
+
+
+def watch_queries(stack, metrics):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(metrics.record_query))
+
+
+# Records wall time, SQL count/time, duplicate queries and template render time per request.
+# Exposed as a Server-Timing header and logged when a request crosses the REQUEST_METRICS_SLOW_* thresholds.
+# REQUEST_METRICS_SAMPLE_RATE controls what fraction of requests get measured so it can stay on in production.
+# Works both ways so it doesn't force async views under ASGI back onto a thread (see async_views.py).
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 1.0)
+        self.slow_ms = getattr(settings, "REQUEST_METRICS_SLOW_MS", 500)
+        self.slow_queries = getattr(settings, "REQUEST_METRICS_SLOW_QUERIES", 50)
+        self.send_header = getattr(settings, "REQUEST_METRICS_HEADER", True)
+
+    def sampled(self):
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        with ExitStack() as stack:
+            watch_queries(stack, metrics)
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        stack = ExitStack()
+        # The async ORM runs queries on the request's sync thread, connections are per thread,
+        # so the wrapper has to be installed (and removed) over there
+        await sync_to_async(watch_queries)(stack, metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total_ms = metrics.total_ms
+        if self.send_header:
+            response["Server-Timing"] = metrics.server_timing(total_ms)
+        slow_ms = self.slow_ms if metrics.slow_ms is None else metrics.slow_ms
+        if total_ms >= slow_ms or metrics.query_count >= self.slow_queries:
+            self.log_slow_request(request, response, metrics, total_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, "metrics", None)
+        if metrics is not None:
+            metrics.view_name = getattr(view_func, "__name__", repr(view_func))
+            if hasattr(view_func, "metrics_slow_ms"):
+                metrics.slow_ms = view_func.metrics_slow_ms()
+
+    def log_slow_request(self, request, response, metrics, total_ms):
+        duplicates = metrics.duplicates()
+        logger.warning(
+            "Slow request %s %s -> %s (%s): %.1fms total, %d queries in %.1fms, %.1fms templates, %d duplicated query shapes",
+            request.method,
+            request.path,
+            response.status_code,
+            metrics.view_name or "unknown view",
+            total_ms,
+            metrics.query_count,
+            metrics.sql_ms,
+            metrics.template_ms,
+            len(duplicates),
+        )
+        # Only the worst few, a N+1 can produce hundreds
+        for sql, count in duplicates[:5]:
+            logger.warning("  %dx %s", count, sql[:300])
+
+
+# request.current_user() / request.current_home(), and the a* versions for async views, see current.py.
+# Needs to come after SessionMiddleware.
+class CurrentUserMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.current_user = partial(current_user, request)
+        request.current_home = partial(current_home, request)
+        request.acurrent_user = partial(acurrent_user, request)
+        request.acurrent_home = partial(acurrent_home, request)
+        return self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['task', 'completion_date'], name='log_task_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('next_due_date__isnull', False)), fields=['home', 'next_due_date'], name='task_home_due_idx'),
+        ),
+    ]
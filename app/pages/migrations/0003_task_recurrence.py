@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0002_task_log_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='interval_count',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='interval',
+            field=models.CharField(blank=True, choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('quarterly', 'Quarterly'), ('yearly', 'Yearly'), ('every_n_days', 'Every N days'), ('every_n_weeks', 'Every N weeks')], max_length=16),
+        ),
+        migrations.CreateModel(
+            name='TaskOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_date', models.DateField()),
+                ('home', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='task_occurrences', to='pages.home')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='pages.task')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['home', 'due_date'], name='occurrence_home_due_idx'), models.Index(fields=['due_date'], name='occurrence_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('task', 'due_date'), name='unique_task_occurrence')],
+            },
+        ),
+    ]
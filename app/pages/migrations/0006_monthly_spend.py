@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0005_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('log_count', models.PositiveIntegerField(default=0)),
+                ('home', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spend', to='pages.home')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spend', to='pages.task')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['home', 'month'], name='spend_home_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('task', 'month'), name='unique_task_month_spend')],
+            },
+        ),
+    ]
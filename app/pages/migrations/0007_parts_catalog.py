@@ -0,0 +1,91 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:45
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+# Consumable -> details flips from a one-to-one on the details row to a foreign key on the consumable,
+# so many consumables can share a row. Every consumable keeps the row it had, run dedup_parts afterwards
+# to collapse the duplicates. Brand and model number are copied over from the consumable's asset.
+def point_consumables_at_details(apps, schema_editor):
+    Asset = apps.get_model("pages", "Asset")
+    Consumable = apps.get_model("pages", "Consumable")
+    ConsumableDetails = apps.get_model("pages", "ConsumableDetails")
+    Consumable.objects.update(
+        details=Subquery(ConsumableDetails.objects.filter(consumable=OuterRef("pk")).values("pk")[:1])
+    )
+    assets = Asset.objects.filter(consumables=OuterRef("consumable_id"))
+    ConsumableDetails.objects.update(
+        brand=Subquery(assets.values("brand")[:1]),
+        model_number=Subquery(assets.values("model_number")[:1]),
+    )
+
+
+def point_details_at_consumables(apps, schema_editor):
+    Consumable = apps.get_model("pages", "Consumable")
+    ConsumableDetails = apps.get_model("pages", "ConsumableDetails")
+    # Only one consumable per row fits back into the one-to-one
+    ConsumableDetails.objects.update(
+        consumable=Subquery(Consumable.objects.filter(details=OuterRef("pk")).values("pk")[:1])
+    )
+    ConsumableDetails.objects.filter(consumable__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0006_monthly_spend'),
+    ]
+
+    operations = [
+        # Frees up the "details" name for the new foreign key
+        migrations.AlterField(
+            model_name='consumabledetails',
+            name='consumable',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pages.consumable'),
+        ),
+        migrations.AddField(
+            model_name='consumable',
+            name='details',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consumables', to='pages.consumabledetails'),
+        ),
+        migrations.AddField(
+            model_name='consumabledetails',
+            name='brand',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='consumabledetails',
+            name='model_number',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(point_consumables_at_details, point_details_at_consumables),
+        migrations.RemoveField(
+            model_name='consumabledetails',
+            name='consumable',
+        ),
+        migrations.AddField(
+            model_name='consumabledetails',
+            name='part_key',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Upper(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('part_number'), models.Value('-')), models.Value(' '))), output_field=models.CharField(max_length=64)),
+        ),
+        migrations.AddField(
+            model_name='consumabledetails',
+            name='model_key',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Upper(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('model_number'), models.Value('-')), models.Value(' '))), output_field=models.CharField(max_length=64)),
+        ),
+        migrations.AddIndex(
+            model_name='consumabledetails',
+            index=models.Index(fields=['owner', 'part_key'], name='catalog_part_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consumabledetails',
+            index=models.Index(fields=['owner', 'model_key'], name='catalog_model_key_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='consumabledetails',
+            constraint=models.UniqueConstraint(condition=models.Q(('owner__isnull', True)), fields=('brand', 'model_number', 'part_number'), name='unique_catalog_part'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0007_parts_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumabledetails',
+            name='price_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The full-text index of SearchEntry, in whatever the database has (pages/search.py queries it).
+# Postgres: a generated tsvector column (names weighted A, context C, the rest D) with a GIN index.
+# SQLite: an external content FTS5 table over title, context and body, plus home_id so a search can be narrowed
+# to the user's homes inside the index. Triggers keep it in step with the table.
+# Anything else gets no index and search.py falls back to LIKE.
+# Careful on SQLite: a later migration that alters SearchEntry rebuilds the table, which drops the
+# triggers. Recreate them there (and rebuild the FTS table) when that happens.
+POSTGRES_SQL = [
+    """
+    ALTER TABLE pages_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', context), 'C')
+        || setweight(to_tsvector('english', body), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX searchentry_document_idx ON pages_searchentry USING GIN (document)",
+]
+POSTGRES_REVERSE_SQL = [
+    "DROP INDEX IF EXISTS searchentry_document_idx",
+    "ALTER TABLE pages_searchentry DROP COLUMN IF EXISTS document",
+]
+SQLITE_SQL = [
+    """
+    CREATE VIRTUAL TABLE pages_searchentry_fts USING fts5(
+        home_id, title, context, body, content='pages_searchentry', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER pages_searchentry_fts_insert AFTER INSERT ON pages_searchentry BEGIN
+        INSERT INTO pages_searchentry_fts (rowid, home_id, title, context, body) VALUES (new.id, new.home_id, new.title, new.context, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER pages_searchentry_fts_delete AFTER DELETE ON pages_searchentry BEGIN
+        INSERT INTO pages_searchentry_fts (pages_searchentry_fts, rowid, home_id, title, context, body)
+        VALUES ('delete', old.id, old.home_id, old.title, old.context, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER pages_searchentry_fts_update AFTER UPDATE OF home_id, title, context, body ON pages_searchentry BEGIN
+        INSERT INTO pages_searchentry_fts (pages_searchentry_fts, rowid, home_id, title, context, body)
+        VALUES ('delete', old.id, old.home_id, old.title, old.context, old.body);
+        INSERT INTO pages_searchentry_fts (rowid, home_id, title, context, body) VALUES (new.id, new.home_id, new.title, new.context, new.body);
+    END
+    """,
+]
+SQLITE_REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS pages_searchentry_fts_insert",
+    "DROP TRIGGER IF EXISTS pages_searchentry_fts_delete",
+    "DROP TRIGGER IF EXISTS pages_searchentry_fts_update",
+    "DROP TABLE IF EXISTS pages_searchentry_fts",
+]
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_search_index = run_sql({"postgresql": POSTGRES_SQL, "sqlite": SQLITE_SQL})
+drop_search_index = run_sql({"postgresql": POSTGRES_REVERSE_SQL, "sqlite": SQLITE_REVERSE_SQL})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('asset', 'Asset'), ('consumable', 'Consumable'), ('task', 'Task'), ('log', 'Log')], max_length=16)),
+                ('title', models.CharField(blank=True, max_length=128)),
+                ('context', models.CharField(blank=True, max_length=128)),
+                ('body', models.TextField(blank=True)),
+                ('asset', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='pages.asset')),
+                ('consumable', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='pages.consumable')),
+                ('home', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='pages.home')),
+                ('log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='pages.log')),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='pages.task')),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
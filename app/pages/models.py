@@ -2,6 +2,8 @@ import uuid
 
 from django.core.validators import MinLengthValidator
 from django.db import models
+from django.db.models.functions import Replace, Upper
+from django.utils import timezone
 from datetime import date
 
 #Left, is what is stored, I capitalized the right to be pretty
@@ -11,14 +13,19 @@ INTERVAL_CHOICES = [
     ("monthly", "Monthly"),
     ("quarterly", "Quarterly"),
     ("yearly", "Yearly"),
+    ("every_n_days", "Every N days"),
+    ("every_n_weeks", "Every N weeks"),
 ]
-# use this in build upcoming occurrences
+# Rough length of each interval in days. Only good for estimates (e.g. how far back to generate logs),
+# real due dates come from pages.recurrence which steps monthly/quarterly/yearly in calendar months
 INTERVAL_DAY_MAP = {
     "daily": 1,
     "weekly": 7,
     "monthly": 30,
     "quarterly": 91,
     "yearly": 365,
+    "every_n_days": 1,
+    "every_n_weeks": 7,
 }
 
 #choices for asset category
@@ -51,6 +58,8 @@ class Home(models.Model):
     city = models.CharField(max_length=128, blank=True)
     state = models.CharField(max_length=64, blank=True)
     zip_code = models.CharField(max_length=20, blank=True)
+    # Change tracking for the delta sync endpoint (sync.py). Keep it in update_fields when saving partially
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -95,6 +104,7 @@ class Room(models.Model):
     home = models.ForeignKey(Home, on_delete=models.CASCADE, related_name="rooms")
     name = models.CharField(max_length=64)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.home.name})"
@@ -113,6 +123,7 @@ class Asset(models.Model):
     #model_number = models.CharField(max_length=64, blank=True)
     category = models.CharField(max_length=32, choices=CATEGORY_CHOICES, default="general")
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="assets")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         name = self.name or "Unnamed asset"
@@ -123,11 +134,13 @@ class Asset(models.Model):
     def consumable_name(self):
         #grabs consumable or part number for the ui to display
         # this is used in dashboard.html to show what part an appliance needs.
+        # dashboard_assets prefetches consumables + details so this doesn't query per asset
         for consumable in self.consumables.all():
             if consumable.name:
                 return consumable.name
-            if consumable.details and consumable.details.part_number:
-                return consumable.details.part_number
+            details = getattr(consumable, "details", None)
+            if details and details.part_number:
+                return details.part_number
         return None
 
 # The task id is a uuid that is automatically generated on creation
@@ -139,6 +152,8 @@ class Task(models.Model):
     task_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=64)
     interval = models.CharField(max_length=16, choices=INTERVAL_CHOICES, blank=True)
+    # The N in "every N days/weeks". Also works as a multiplier for the other intervals (every 2 months)
+    interval_count = models.PositiveSmallIntegerField(default=1)
     next_due_date = models.DateField(null=True, blank=True)
     last_completed_date = models.DateField(null=True, blank=True)
     #completed = models.BooleanField(default=False)
@@ -146,8 +161,39 @@ class Task(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="tasks", null=True, blank=True)
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name="tasks", null=True, blank=True)
     consumable = models.ForeignKey("Consumable", on_delete=models.CASCADE, related_name="tasks", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Every page filters tasks by home and orders by next_due_date (get_due_soon_tasks).
+    # One-time tasks without a due date never show up there so they are left out of the index.
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["home", "next_due_date"],
+                name="task_home_due_idx",
+                condition=models.Q(next_due_date__isnull=False),
+            ),
+            # Cross home scans like send_reminders
+            models.Index(
+                fields=["next_due_date"],
+                name="task_due_idx",
+                condition=models.Q(next_due_date__isnull=False),
+            ),
+        ]
+
+    # "Monthly", or "Every 3 months" when interval_count is more than 1
+    @property
+    def interval_display(self):
+        if not self.interval:
+            return ""
+        if self.interval == "every_n_days" or (self.interval == "daily" and self.interval_count > 1):
+            return f"Every {self.interval_count} days"
+        if self.interval == "every_n_weeks" or (self.interval == "weekly" and self.interval_count > 1):
+            return f"Every {self.interval_count} weeks"
+        if self.interval_count > 1:
+            unit = {"monthly": "months", "quarterly": "quarters", "yearly": "years"}[self.interval]
+            return f"Every {self.interval_count} {unit}"
+        return self.get_interval_display()
 
-    
 #Calculating the number of days between today and next due date
     @property
     def days_until_due(self):
@@ -166,6 +212,26 @@ class Task(models.Model):
         )
         return f"{self.name} ({location})"
 
+# Upcoming due dates of a task, materialized by pages.recurrence up to OCCURRENCE_WINDOW_DAYS ahead.
+# Lets calendar/reminder queries ("what is due across all homes in the next 90 days") be simple range scans.
+# home is copied from the task so those queries don't need a join.
+class TaskOccurrence(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="occurrences")
+    home = models.ForeignKey(Home, on_delete=models.CASCADE, related_name="task_occurrences", null=True, blank=True)
+    due_date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["task", "due_date"], name="unique_task_occurrence"),
+        ]
+        indexes = [
+            models.Index(fields=["home", "due_date"], name="occurrence_home_due_idx"),
+            models.Index(fields=["due_date"], name="occurrence_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task.name} due {self.due_date}"
+
 # The consumable id is a uuid that is automatically generated on creation
 # The consumable is matched to the particular task, when the task is deleted, the consumable is deleted
 # The part number is optional, but if it is present, it will be displayed in the admin page. I think this is what we can use API to get the price of the consumable
@@ -174,6 +240,9 @@ class Consumable(models.Model):
     consumable_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=64, blank=True)
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name="consumables")
+    # The part from the catalog, shared with every other consumable that uses it
+    details = models.ForeignKey("ConsumableDetails", on_delete=models.SET_NULL, related_name="consumables", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         if self.name:
@@ -182,15 +251,43 @@ class Consumable(models.Model):
             return self.details.part_number
         return f"Consumable for {self.asset.name}"
 
-# Details for a consumable. Allows for  
+# Upper cased without spaces or dashes, so "da29-00020b" finds "DA29 00020B"
+def search_key(field):
+    return Upper(Replace(Replace(models.F(field), models.Value("-")), models.Value(" ")))
+
+# The parts catalog: brand + model number of the appliance -> part number, cost and where to buy it.
+# One row per part, shared by every consumable that uses it (Consumable.details). owner is null for
+# catalog rows, a user who changes the cost or url of a shared part gets their own copy (pages/parts.py).
+# part_key/model_key are generated by the database and indexed for the autocomplete prefix lookups.
 class ConsumableDetails(models.Model):
-    consumable = models.OneToOneField("Consumable", on_delete=models.CASCADE, related_name="details")
+    brand = models.CharField(max_length=64, blank=True)
+    model_number = models.CharField(max_length=64, blank=True)
     part_number = models.CharField(max_length=64, blank=True)
     estimated_cost = models.DecimalField(max_digits=9, decimal_places=2, default=0, blank=True)
     retail_url = models.URLField(blank=True)
 
     # Null for consumable details not made by a user
     owner = models.ForeignKey(AppUser, null=True, blank=True, on_delete=models.CASCADE, related_name="custom_consumable_details")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Last time refresh_prices read the price off retail_url (pages/prices.py)
+    price_checked_at = models.DateTimeField(null=True, blank=True)
+    part_key = models.GeneratedField(expression=search_key("part_number"), output_field=models.CharField(max_length=64), db_persist=True)
+    model_key = models.GeneratedField(expression=search_key("model_number"), output_field=models.CharField(max_length=64), db_persist=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["brand", "model_number", "part_number"],
+                name="unique_catalog_part",
+                condition=models.Q(owner__isnull=True),
+            ),
+        ]
+        indexes = [
+            # owner first: "owner IS NULL" pins the catalog and the key range is read off in order. A
+            # partial index on the key alone loses to the owner foreign key index without ANALYZE stats.
+            models.Index(fields=["owner", "part_key"], name="catalog_part_key_idx"),
+            models.Index(fields=["owner", "model_key"], name="catalog_model_key_idx"),
+        ]
 
     def __str__(self):
         return self.part_number or "Unnamed Consumable"
@@ -207,7 +304,138 @@ class Log(models.Model):
     cost = models.DecimalField(max_digits=9, decimal_places=2, null=True, blank=True)
     notes = models.TextField(blank=True)
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="logs")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Logs are always fetched by task (task__in=tasks) and read in completion order
+    class Meta:
+        indexes = [
+            models.Index(fields=["task", "completion_date"], name="log_task_completed_idx"),
+        ]
 
     def __str__(self):
         date = self.completion_date or "pending"
         return f"{self.task.name} on {date}"
+
+# Log spend summed per task and calendar month, for the analytics page (pages/analytics.py) when
+# ANALYTICS_ROLLUP is on. Kept current by signals.py as logs are saved, rebuilt by refresh_analytics.
+# home is copied from the task like TaskOccurrence, so a home's months are one index range.
+class MonthlySpend(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="monthly_spend")
+    home = models.ForeignKey(Home, on_delete=models.CASCADE, related_name="monthly_spend", null=True, blank=True)
+    month = models.DateField()
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    log_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["task", "month"], name="unique_task_month_spend"),
+        ]
+        indexes = [
+            models.Index(fields=["home", "month"], name="spend_home_month_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} {self.month:%Y-%m}: {self.total}"
+
+# One row per reminder email line we sent, so re-running send_reminders doesn't email the same
+# task twice for the same due date. A new due date (after a log) makes the task eligible again.
+class ReminderDelivery(models.Model):
+    user = models.ForeignKey(AppUser, on_delete=models.CASCADE, related_name="reminder_deliveries")
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="reminder_deliveries")
+    due_date = models.DateField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "task", "due_date"], name="unique_reminder_delivery"),
+        ]
+
+    def __str__(self):
+        return f"Reminder to {self.user_id} for {self.task_id} due {self.due_date}"
+
+# Left behind when a Room, Asset, Consumable, Task or Log is deleted so offline clients can find out in the
+# next delta sync. Only the deleted object gets one, rows removed by its cascade don't, clients cascade
+# locally the same way the database does. home_id isn't a foreign key so tombstones outlive their home.
+class Tombstone(models.Model):
+    home_id = models.UUIDField()
+    model = models.CharField(max_length=32)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["home_id", "deleted_at"], name="tombstone_home_deleted_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at}"
+
+# Work for the run_jobs worker, queued by pages/jobs.py (enqueue) in the same transaction as the write that
+# needs it. A worker claims a job by moving available_at past the job's visibility timeout, so a job whose
+# worker died comes round again on its own. Done jobs are deleted, jobs out of attempts stay as "failed".
+class Job(models.Model):
+    QUEUED = "queued"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    # Higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Not before this. Also the end of the claim while a worker has it
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # The worker asks for queued jobs that are available by priority, then age
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "-priority", "available_at"], name="job_ready_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+# The search document of an asset, consumable, task or log (notes only, logs without notes have none),
+# for the search page and api (pages/search.py). Kept current by signals.py as those are saved.
+# The full-text index lives in the database next to this table (migration 0010): a tsvector column with
+# a GIN index on Postgres, an FTS5 table kept in step by triggers on SQLite.
+# The object is whichever of asset/consumable/task/log kind says. A consumable also points at its asset and
+# a log at its task, so entries move and go with them. home is copied like TaskOccurrence.home.
+class SearchEntry(models.Model):
+    ASSET = "asset"
+    CONSUMABLE = "consumable"
+    TASK = "task"
+    LOG = "log"
+    KIND_CHOICES = [(ASSET, "Asset"), (CONSUMABLE, "Consumable"), (TASK, "Task"), (LOG, "Log")]
+
+    home = models.ForeignKey(Home, on_delete=models.CASCADE, related_name="search_entries")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name="search_entries", null=True, blank=True)
+    consumable = models.ForeignKey(Consumable, on_delete=models.CASCADE, related_name="search_entries", null=True, blank=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="search_entries", null=True, blank=True)
+    log = models.ForeignKey(Log, on_delete=models.CASCADE, related_name="search_entries", null=True, blank=True)
+    # Names rank above the rest. context is the name of what it belongs to (the asset of a consumable or task,
+    # the task of a log), so "water heater anode" finds the anode rod of the water heater
+    title = models.CharField(max_length=128, blank=True)
+    context = models.CharField(max_length=128, blank=True)
+    body = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.kind}: {self.title or self.body[:40]}"
+
+# A secret link to an iCalendar feed of upcoming maintenance (pages/feeds.py), for calendar apps that can't log in.
+# One home's tasks, or every home of the user when home is empty. The token is the only thing checked, so a
+# new link replaces the token and the old one stops working. Feeds of a home the user left stop working too.
+class CalendarFeed(models.Model):
+    token = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(AppUser, on_delete=models.CASCADE, related_name="calendar_feeds")
+    home = models.ForeignKey(Home, on_delete=models.CASCADE, related_name="calendar_feeds", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Calendar of {self.user_id} for {self.home_id or 'all homes'}"
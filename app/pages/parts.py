@@ -0,0 +1,228 @@
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q
+
+from .jobs import enqueue
+from .models import Consumable, ConsumableDetails
+
+# The shared parts catalog. ConsumableDetails rows without an owner are the catalog, one per
+# (brand, model number, part number), and every consumable of that part points at the same row.
+# Adding an asset reuses the catalog row, a user who enters a different cost gets their own copy
+# (owner=user) so nobody else's numbers change. Retail urls come from users, so a part with one is always
+# the user's copy: refresh_prices (prices.py) only reprices those, never a catalog row everyone shares.
+# dedup_parts folds the per-user rows from before the catalog into it.
+#   GET /pages/api/parts/?q=da29&field=part|model&brand=GE   autocomplete (api.api_parts), catalog rows only
+# part_key/model_key are generated columns (upper case, no spaces or dashes), each indexed behind owner.
+# A prefix is looked up as the range [prefix, prefix with its last character bumped), which any btree
+# answers directly. LIKE 'abc%' can't use a plain index on SQLite or on Postgres without pattern_ops.
+
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 50
+KEY_FIELDS = {"part": "part_key", "model": "model_key"}
+# What a user can change about a consumable's part
+DETAIL_FIELDS = ("part_number", "estimated_cost", "retail_url")
+PART_FIELDS = ("id", "brand", "model_number", "part_number", "estimated_cost", "retail_url")
+
+
+def normalize_key(value):
+    # Same as models.search_key, which the database uses to fill part_key/model_key
+    return value.replace("-", "").replace(" ", "").upper()
+
+
+def prefix_range(prefix):
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def lookup_parts(query, field="part", brand="", limit=AUTOCOMPLETE_LIMIT):
+    key = normalize_key(query)
+    if not key:
+        return []
+    column = KEY_FIELDS[field]
+    low, high = prefix_range(key)
+    parts = ConsumableDetails.objects.filter(owner__isnull=True, **{f"{column}__gte": low, f"{column}__lt": high})
+    if brand:
+        parts = parts.filter(brand=brand)
+    return list(parts.order_by(column).values(*PART_FIELDS)[:limit])
+
+
+def matches(part, estimated_cost, retail_url):
+    # A user's url never goes on a catalog row, see above
+    return part.estimated_cost == estimated_cost and not retail_url
+
+
+def catalog_part(user, brand, model_number, part_number, estimated_cost=0, retail_url=""):
+    """The details row for a consumable: the catalog's row for the part if the cost agrees and there's
+    no url, otherwise the user's own copy. The catalog gets a row if it doesn't know the part yet."""
+    estimated_cost = estimated_cost or 0
+    if part_number:
+        part, created = ConsumableDetails.objects.get_or_create(
+            owner=None,
+            brand=brand,
+            model_number=model_number,
+            part_number=part_number,
+            defaults={"estimated_cost": estimated_cost},
+        )
+        if matches(part, estimated_cost, retail_url):
+            return part
+    values = {
+        "brand": brand,
+        "model_number": model_number,
+        "part_number": part_number,
+        "estimated_cost": estimated_cost,
+        "retail_url": retail_url,
+    }
+    copy = ConsumableDetails.objects.filter(owner=user, **values).first()
+    return copy or ConsumableDetails.objects.create(owner=user, **values)
+
+
+def change_part(user, consumable, asset, changes):
+    """The details row a consumable points at after its part number, cost or url change.
+    Shared rows are never edited, the user's own copy is when no other consumable uses it."""
+    current = consumable.details
+    if current is not None and current.owner_id == user.username:
+        if not current.consumables.exclude(pk=consumable.pk).exists():
+            if changes.get("retail_url", current.retail_url) != current.retail_url:
+                current.price_checked_at = None
+            for name, value in changes.items():
+                setattr(current, name, value)
+            current.brand, current.model_number = asset.brand, asset.model_number
+            current.estimated_cost = current.estimated_cost or 0
+            current.save()
+            return current
+    values = {name: getattr(current, name) for name in DETAIL_FIELDS} if current else {}
+    values |= changes
+    return catalog_part(
+        user,
+        asset.brand,
+        asset.model_number,
+        values.get("part_number", ""),
+        values.get("estimated_cost") or 0,
+        values.get("retail_url", ""),
+    )
+
+
+def queue_price_check(part):
+    """A user's part with a retail url nobody has read the price off yet gets a background lookup (jobs.py)."""
+    if part is not None and part.owner_id and part.retail_url and part.price_checked_at is None:
+        enqueue("refresh_part_price", details_id=part.pk)
+
+
+def catalog_parts(parts, user):
+    """catalog_part for many parts at once, for the bulk loaders.
+    parts are (brand, model_number, part_number, estimated_cost), returns {part: details row}.
+    A handful of queries per call however many parts, the catalog rows are bulk inserted."""
+    keys = {part[:3] for part in parts}
+
+    def load_catalog():
+        rows = ConsumableDetails.objects.filter(owner__isnull=True, part_number__in={key[2] for key in keys})
+        return {key: row for row in rows if (key := (row.brand, row.model_number, row.part_number)) in keys}
+
+    catalog = load_catalog()
+    missing = keys - catalog.keys()
+    if missing:
+        costs = {}
+        for brand, model_number, part_number, estimated_cost in parts:
+            costs.setdefault((brand, model_number, part_number), estimated_cost)
+        ConsumableDetails.objects.bulk_create(
+            [
+                ConsumableDetails(brand=key[0], model_number=key[1], part_number=key[2], estimated_cost=costs[key])
+                for key in missing
+            ],
+            ignore_conflicts=True,
+        )
+        # Inserted rows don't get their ids back with ignore_conflicts
+        catalog = load_catalog()
+
+    resolved = {}
+    copies = []
+    for part in set(parts):
+        shared = catalog[part[:3]]
+        if matches(shared, part[3], ""):
+            resolved[part] = shared
+        else:
+            copy = ConsumableDetails(
+                owner=user, brand=part[0], model_number=part[1], part_number=part[2], estimated_cost=part[3]
+            )
+            copies.append(copy)
+            resolved[part] = copy
+    ConsumableDetails.objects.bulk_create(copies)
+    return resolved
+
+
+# dedup_parts. Every step works through the table batch_size groups/rows at a time, one transaction
+# each, so it can run against a live site and be stopped and restarted at any point.
+DUPLICATE_FIELDS = ("brand", "model_number", "part_number", "estimated_cost", "retail_url")
+
+
+def prune_orphans(batch_size):
+    """Per-user rows no consumable points at anymore (their consumable was deleted or moved on)."""
+    orphans = ConsumableDetails.objects.filter(owner__isnull=False).filter(
+        ~Exists(Consumable.objects.filter(details=OuterRef("pk")))
+    )
+    deleted = 0
+    while True:
+        ids = list(orphans.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ConsumableDetails.objects.filter(pk__in=ids).delete()[0]
+
+
+def merge_duplicates(batch_size):
+    """Rows that are the same part at the same cost and url become one, the catalog's row if there is one.
+    Returns how many rows were merged away."""
+    groups = (
+        ConsumableDetails.objects.values(*DUPLICATE_FIELDS)
+        .annotate(rows=Count("pk"), catalog=Min("pk", filter=Q(owner__isnull=True)), first=Min("pk"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    merged = 0
+    while True:
+        batch = list(groups[:batch_size])
+        if not batch:
+            return merged
+        with transaction.atomic():
+            for group in batch:
+                keep = group["catalog"] or group["first"]
+                duplicates = ConsumableDetails.objects.filter(
+                    **{field: group[field] for field in DUPLICATE_FIELDS}
+                ).exclude(pk=keep)
+                Consumable.objects.filter(details__in=duplicates.values("pk")).update(details_id=keep)
+                merged += duplicates.delete()[0]
+
+
+def promote_to_catalog(batch_size):
+    """Parts only users have rows for join the catalog, the most used row of each part goes in.
+    Rows with a retail url stay the user's. Returns how many rows were promoted."""
+    in_catalog = ConsumableDetails.objects.filter(
+        owner__isnull=True,
+        brand=OuterRef("brand"),
+        model_number=OuterRef("model_number"),
+        part_number=OuterRef("part_number"),
+    )
+    candidates = (
+        ConsumableDetails.objects.filter(owner__isnull=False, retail_url="")
+        .exclude(part_number="")
+        .filter(~Exists(in_catalog))
+        .annotate(uses=Count("consumables"))
+        .order_by("brand", "model_number", "part_number", "-uses", "pk")
+    )
+    promoted = 0
+    while True:
+        # One row per part, the first (most used) of each
+        picks = {}
+        for row in candidates.values("pk", "brand", "model_number", "part_number")[: batch_size * 4]:
+            picks.setdefault((row["brand"], row["model_number"], row["part_number"]), row["pk"])
+            if len(picks) >= batch_size:
+                break
+        if not picks:
+            return promoted
+        promoted += ConsumableDetails.objects.filter(pk__in=picks.values()).update(owner=None)
+
+
+def dedup_parts(batch_size=500):
+    return {
+        "orphans_deleted": prune_orphans(batch_size),
+        "duplicates_merged": merge_duplicates(batch_size),
+        "promoted": promote_to_catalog(batch_size),
+    }
+
@@ -0,0 +1,120 @@
+from datetime import date, timedelta
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Count, F, Min, Q
+from django.shortcuts import redirect, render
+
+from .api import ApiError, api_user, api_view, conditional_json, page_size
+from .models import Asset, Home, Room, Task
+from .queries import keyset_query, keyset_result
+from .summary import SUMMARY_TIMEOUT, get_portfolio_version
+
+# Every home of the user on one page: totals across all of them, what's due next and what's most overdue
+# anywhere, and a table of the homes with their own counts.
+#   /pages/portfolio/                              html page
+#   GET /pages/api/portfolio/?cursor=&limit=       the same as JSON
+# The totals are a few GROUP BYs over all the user's homes at once (not a query per home) and are cached
+# per user under a portfolio version that any change to one of their homes bumps (summary.py).
+# The homes table is keyset paginated by name, its counts are three GROUP BYs over the homes on the page.
+
+DUE_SOON_DAYS = 7
+UPCOMING_LIMIT = 10
+
+
+def task_counts(today):
+    return {
+        "tasks": Count("pk"),
+        "overdue": Count("pk", filter=Q(next_due_date__lt=today)),
+        "due_soon": Count("pk", filter=Q(next_due_date__gte=today, next_due_date__lt=today + timedelta(days=DUE_SOON_DAYS))),
+        "next_due": Min("next_due_date", filter=Q(next_due_date__gte=today)),
+    }
+
+
+def task_list(tasks):
+    return list(
+        tasks.values("task_id", "name", "next_due_date", "home_id", home_name=F("home__name"))[:UPCOMING_LIMIT]
+    )
+
+
+def build_rollup(user, today):
+    tasks = Task.objects.filter(home__users=user)
+    return {
+        "homes": Home.objects.filter(users=user).count(),
+        "rooms": Room.objects.filter(home__users=user).count(),
+        "assets": Asset.objects.filter(room__home__users=user).count(),
+        **tasks.aggregate(**task_counts(today)),
+        "upcoming": task_list(tasks.filter(next_due_date__gte=today).order_by("next_due_date", "task_id")),
+        "most_overdue": task_list(tasks.filter(next_due_date__lt=today).order_by("next_due_date", "task_id")),
+    }
+
+
+def portfolio_rollup(user, today=None):
+    today = today or date.today()
+    # The day is in the key, overdue and due soon move on at midnight without anything changing
+    key = f"portfolio:{user.username}:{get_portfolio_version(user.username)}:{today.isoformat()}"
+    rollup = cache.get(key)
+    if rollup is None:
+        rollup = build_rollup(user, today)
+        cache.set(key, rollup, SUMMARY_TIMEOUT)
+    return rollup
+
+
+def grouped(queryset, home_field, **aggregates):
+    rows = queryset.values(home_field).annotate(**aggregates).order_by()
+    return {row.pop(home_field): row for row in rows}
+
+
+def home_page(user, cursor=None, limit=50, today=None):
+    """One page of the user's homes by name with their counts, and the cursor for the next page.
+    Raises ValueError for a bad cursor."""
+    today = today or date.today()
+    homes = Home.objects.filter(users=user).only("home_id", "name", "city", "state")
+    homes, next_cursor = keyset_result(list(keyset_query(homes, "name", "home_id", cursor, limit)), "name", "home_id", limit)
+    home_ids = [home.home_id for home in homes]
+    rooms = grouped(Room.objects.filter(home_id__in=home_ids), "home_id", rooms=Count("pk"))
+    assets = grouped(Asset.objects.filter(room__home_id__in=home_ids), "room__home_id", assets=Count("pk"))
+    tasks = grouped(Task.objects.filter(home_id__in=home_ids), "home_id", **task_counts(today))
+    no_tasks = {"tasks": 0, "overdue": 0, "due_soon": 0, "next_due": None}
+    rows = [
+        {
+            "home_id": home.home_id,
+            "name": home.name,
+            "city": home.city,
+            "state": home.state,
+            **rooms.get(home.home_id, {"rooms": 0}),
+            **assets.get(home.home_id, {"assets": 0}),
+            **tasks.get(home.home_id, no_tasks),
+        }
+        for home in homes
+    ]
+    return rows, next_cursor
+
+
+def portfolio_view(request):
+    user = request.current_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    rollup = portfolio_rollup(user)
+    if not rollup["homes"]:
+        messages.info(request, "Add a home to get started.")
+        return redirect("manage_homes")
+    try:
+        homes, next_cursor = home_page(user, request.GET.get("cursor"))
+    except ValueError:
+        homes, next_cursor = home_page(user)
+    return render(request, "portfolio.html", {"portfolio": rollup, "homes": homes, "next_cursor": next_cursor})
+
+
+@api_view
+def portfolio_api(request):
+    if request.method != "GET":
+        raise ApiError("Method not allowed.", status=405)
+    user = api_user(request)
+    limit = page_size(request)
+    try:
+        homes, next_cursor = home_page(user, request.GET.get("cursor"), limit)
+    except ValueError:
+        raise ApiError("Invalid cursor.")
+    return conditional_json(request, {"portfolio": portfolio_rollup(user), "results": homes, "next_cursor": next_cursor})
@@ -0,0 +1,124 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fake shops for the price refresh: local HTTP servers whose product pages show a price the way real
+# shops do (microdata, JSON-LD, OpenGraph meta tags or just an element with a price class).
+# benchmark_prices runs against them, and they're handy for trying refresh_prices without real shops
+# (with PRICE_FETCH_PRIVATE_HOSTS on, they listen on 127.0.0.1):
+#   with fixture_shops(hosts=2) as shops:
+#       part.retail_url = f"{shops[0].url}parts/17"
+# /parts/<n> costs fixture_price(n, shop.generation), bump generation to change every price.
+# With fail_every, every fail_every'th part answers its first request with a 503 (so retries get used),
+# latency delays every response and page_kb pads pages out to about the size of a real product page.
+# shop.moved maps a path to the url it redirects to.
+
+LAYOUTS = (
+    '<meta itemprop="price" content="{price}"><span class="price">${price}</span>',
+    '<script type="application/ld+json">{{"@context": "https://schema.org", "@type": "Product", '
+    '"name": "Part {number}", "offers": {{"@type": "Offer", "price": "{price}", "priceCurrency": "USD"}}}}</script>',
+    '<meta property="product:price:amount" content="{price}"><meta property="product:price:currency" content="USD">',
+    '<div class="product"><span class="was-price">${was}</span> <strong class="sale-price">${price}</strong></div>',
+)
+FILLER = '<div class="card"><a href="/parts/{n}">Related part {n}</a><p>Fits most models. Ships in 2 days.</p></div>\n'
+
+
+def fixture_price(number, generation=0):
+    return Decimal(500 + (number * 7919 + generation * 104729) % 20000) / 100
+
+
+def product_page(number, generation=0, page_kb=0):
+    price = fixture_price(number, generation)
+    body = LAYOUTS[number % len(LAYOUTS)].format(number=number, price=price, was=price + 10)
+    filler = "".join(FILLER.format(n=n) for n in range(page_kb * 1024 // len(FILLER)))
+    return (
+        f"<!DOCTYPE html><html><head><title>Part {number}</title></head>"
+        f"<body><h1>Replacement part {number}</h1>{body}\n{filler}</body></html>"
+    )
+
+
+class Shop:
+    def __init__(self, latency=0, fail_every=0, page_kb=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.page_kb = page_kb
+        self.generation = 0
+        self.url = ""
+        self.requests = 0
+        self.failed = set()
+        self.moved = {}
+        self.lock = threading.Lock()
+
+    def first_try(self, path):
+        with self.lock:
+            if path in self.failed:
+                return False
+            self.failed.add(path)
+            return True
+
+
+class ShopHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the fetcher's connection pooling counts
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        shop = self.server.shop
+        with shop.lock:
+            shop.requests += 1
+        if shop.latency:
+            time.sleep(shop.latency)
+        if self.path in shop.moved:
+            return self.reply(302, "<h1>Moved</h1>", location=shop.moved[self.path])
+        section, _, number = self.path.strip("/").partition("/")
+        if section != "parts" or not number.isdigit():
+            return self.reply(404, "<h1>Not found</h1>")
+        number = int(number)
+        if shop.fail_every and number % shop.fail_every == 0 and shop.first_try(self.path):
+            return self.reply(503, "<h1>Busy, try again</h1>")
+        self.reply(200, product_page(number, shop.generation, shop.page_kb))
+
+    def reply(self, status, html, location=None):
+        body = html.encode()
+        self.send_response(status)
+        if location:
+            self.send_header("Location", location)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ShopServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many clients connect at once
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # A client that timed out and hung up on a slow page isn't worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@contextmanager
+def fixture_shops(hosts=1, latency=0, fail_every=0, page_kb=0):
+    """Starts `hosts` shops on free local ports, yields their Shop objects and stops them afterwards.
+    Each shop is its own host:port, so PRICE_HOST_RATE applies to each separately."""
+    servers = []
+    try:
+        for _ in range(hosts):
+            server = ShopServer(("127.0.0.1", 0), ShopHandler)
+            server.shop = Shop(latency, fail_every, page_kb)
+            server.shop.url = f"http://127.0.0.1:{server.server_port}/"
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+        yield [server.shop for server in servers]
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,319 @@
+import asyncio
+import ipaddress
+import json
+import re
+import socket
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from bs4 import BeautifulSoup, SoupStrainer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .jobs import job
+from .models import ConsumableDetails
+
+# Part price refresh. Parts whose price is older than PRICE_REFRESH_DAYS get their retail_url fetched
+# again and the price on the page becomes the part's estimated_cost. Only users' own parts: a url is
+# whatever a user typed in, it must not set the cost of a catalog row everyone shares (parts.py).
+#   python manage.py refresh_prices
+# Pages are fetched concurrently on one event loop: at most PRICE_FETCH_CONCURRENCY requests in flight
+# over a pooled httpx client, requests to the same site spaced out to PRICE_HOST_RATE a second, and
+# timeouts, dropped connections, 429s and 5xx retried with backoff. Pages are parsed off the loop.
+# The database is read and written in batches on the caller's thread (sync_to_async under async_to_sync),
+# one bulk_update per batch, while the next batch is already being fetched.
+# PRICE_FETCHER picks the class that downloads pages: anything with async fetch(url) -> html and
+# aclose() works. pages/price_fixtures.py serves fake shop pages locally to try it against.
+# Urls are typed in by users, so HttpxFetcher only fetches http(s) from hosts that resolve to public
+# addresses, and follows redirects itself to check every hop the same way. Nothing on the server's own
+# network (loopback, private ranges, link-local cloud metadata) unless PRICE_FETCH_PRIVATE_HOSTS is on.
+
+CENT = Decimal("0.01")
+# estimated_cost is max_digits=9, decimal_places=2
+MAX_PRICE = Decimal("9999999.99")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Seconds before the first retry of a page, doubled for every retry after that
+RETRY_BACKOFF = 0.5
+USER_AGENT = "UpkeepPriceBot/1.0"
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    def __init__(self, message, retry=False):
+        super().__init__(message)
+        self.retry = retry
+
+
+def is_public(address):
+    address = ipaddress.ip_address(address.split("%")[0])
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+async def check_url(url):
+    """Raises FetchError unless url is http(s) on a host whose every address is public."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError(f"Not an http(s) url: {url}")
+    if settings.PRICE_FETCH_PRIVATE_HOSTS:
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as error:
+        raise FetchError(f"Can't resolve {parts.hostname}: {error}", retry=True) from error
+    if not all(is_public(address[4][0]) for address in addresses):
+        raise FetchError(f"{parts.hostname} is not a public address")
+
+
+class HttpxFetcher:
+    """Downloads pages with one httpx client, so connections to a site stay open between its pages."""
+
+    def __init__(self, concurrency=None, timeout=None):
+        concurrency = concurrency or settings.PRICE_FETCH_CONCURRENCY
+        self.client = httpx.AsyncClient(
+            timeout=timeout or settings.PRICE_FETCH_TIMEOUT,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            # Every hop is checked before it's requested, see fetch
+            follow_redirects=False,
+            headers={"User-Agent": USER_AGENT},
+        )
+
+    async def fetch(self, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            await check_url(url)
+            try:
+                response = await self.client.get(url)
+            except httpx.TransportError as error:
+                # Timeouts, refused and dropped connections
+                raise FetchError(str(error) or type(error).__name__, retry=True) from error
+            if not response.is_redirect:
+                break
+            url = urljoin(str(response.url), response.headers["Location"])
+        else:
+            raise FetchError(f"More than {MAX_REDIRECTS} redirects")
+        if response.status_code != 200:
+            raise FetchError(f"HTTP {response.status_code}", retry=response.status_code in RETRY_STATUSES)
+        return response.text
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class HostLimiter:
+    """Spaces out requests to each host so no site gets more than `rate` a second (0 = no limit).
+    Every caller books the next free slot for its host, then sleeps until it comes up."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# Parsing. Shops show prices in a handful of ways, tried from most to least reliable:
+# meta tags (microdata/OpenGraph), JSON-LD Product offers, itemprop="price" elements, then any element
+# with "price" in its class.
+PRICE_META = ({"itemprop": "price"}, {"property": "product:price:amount"}, {"property": "og:price:amount"})
+PRICE_NUMBER = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+# Crossed out prices sit next to the real one
+NOT_THE_PRICE = ("old", "was", "list", "regular", "strike", "compare")
+
+
+def to_price(value):
+    match = PRICE_NUMBER.search(str(value or ""))
+    if not match:
+        return None
+    try:
+        price = Decimal(match.group().replace(",", "")).quantize(CENT)
+    except InvalidOperation:
+        return None
+    return price if 0 < price <= MAX_PRICE else None
+
+
+def json_ld_prices(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from json_ld_prices(item)
+    elif isinstance(data, dict):
+        for key in ("price", "lowPrice"):
+            if key in data:
+                yield data[key]
+        for key in ("offers", "@graph", "priceSpecification"):
+            if key in data:
+                yield from json_ld_prices(data[key])
+
+
+def is_price_class(value):
+    value = (value or "").lower()
+    return "price" in value and not any(word in value for word in NOT_THE_PRICE)
+
+
+def may_hold_price(name, attrs):
+    if name in ("meta", "script") or attrs.get("itemprop") == "price":
+        return True
+    classes = attrs.get("class") or ""
+    return "price" in (classes if isinstance(classes, str) else " ".join(classes)).lower()
+
+
+# Only tags that can hold a price (and what's inside them) are built into the tree, the rest of the page
+# is just tokenized. About 3x faster than a full parse on a typical product page.
+PRICE_TAGS = SoupStrainer(may_hold_price)
+
+
+def price_candidates(soup):
+    for attrs in PRICE_META:
+        for tag in soup.find_all("meta", attrs=attrs):
+            yield tag.get("content")
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            yield from json_ld_prices(json.loads(script.string or ""))
+        except ValueError:
+            continue
+    for tag in soup.find_all(attrs={"itemprop": "price"}):
+        yield tag.get("content") or tag.get_text()
+    for tag in soup.find_all(class_=is_price_class):
+        yield tag.get_text()
+
+
+def parse_price(page):
+    """The price on a product page, or None if there isn't one we can read."""
+    soup = BeautifulSoup(page, "html.parser", parse_only=PRICE_TAGS)
+    return next(filter(None, map(to_price, price_candidates(soup))), None)
+
+
+def priced_parts():
+    return ConsumableDetails.objects.filter(owner__isnull=False).exclude(retail_url="")
+
+
+def due_parts(now=None):
+    stale = (now or timezone.now()) - timedelta(days=settings.PRICE_REFRESH_DAYS)
+    return priced_parts().filter(Q(price_checked_at__isnull=True) | Q(price_checked_at__lt=stale))
+
+
+class PriceRefresh:
+    """One run over the due parts (or `parts`, any ConsumableDetails queryset). Call refresh_prices()
+    from sync code, or await run() from async code."""
+
+    def __init__(self, parts=None, fetcher=None, batch_size=500, limit=None, concurrency=None, host_rate=None, retries=None):
+        self.parts = parts
+        self.fetcher = fetcher
+        self.batch_size = batch_size
+        self.limit = limit
+        self.concurrency = concurrency or settings.PRICE_FETCH_CONCURRENCY
+        self.hosts = HostLimiter(settings.PRICE_HOST_RATE if host_rate is None else host_rate)
+        self.retries = settings.PRICE_FETCH_RETRIES if retries is None else retries
+        self.queued = 0
+        self.stats = {"checked": 0, "updated": 0, "unchanged": 0, "no_price": 0, "failed": 0, "pages": 0, "retries": 0}
+
+    async def run(self):
+        started = time.perf_counter()
+        self.now = timezone.now()
+        if self.parts is None:
+            self.parts = due_parts(self.now)
+        fetcher = self.fetcher or import_string(settings.PRICE_FETCHER)(self.concurrency)
+        self.slots = asyncio.Semaphore(self.concurrency)
+        saving = None
+        try:
+            last_pk = 0
+            while batch := await sync_to_async(self.next_batch)(last_pk):
+                last_pk = batch[-1].pk
+                prices = await self.fetch_all(fetcher, {part.retail_url for part in batch})
+                # The previous batch was being written while this one was fetched
+                if saving:
+                    await saving
+                saving = asyncio.ensure_future(sync_to_async(self.save)(batch, prices))
+            if saving:
+                await saving
+        finally:
+            if not self.fetcher:
+                await fetcher.aclose()
+        elapsed = time.perf_counter() - started
+        self.stats["elapsed_s"] = round(elapsed, 3)
+        self.stats["pages_per_s"] = round(self.stats["pages"] / elapsed, 1) if elapsed else 0
+        return self.stats
+
+    def next_batch(self, after):
+        size = self.batch_size if self.limit is None else min(self.batch_size, self.limit - self.queued)
+        if size <= 0:
+            return []
+        batch = list(self.parts.filter(pk__gt=after).order_by("pk").only("pk", "retail_url", "estimated_cost")[:size])
+        self.queued += len(batch)
+        return batch
+
+    async def fetch_all(self, fetcher, urls):
+        urls = list(urls)
+        results = await asyncio.gather(*(self.fetch_price(fetcher, url) for url in urls))
+        return dict(zip(urls, results))
+
+    async def fetch_price(self, fetcher, url):
+        """The price on the page at url, None if the page has none, a FetchError if it couldn't be fetched."""
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            await self.hosts.wait(host)
+            async with self.slots:
+                try:
+                    page = await fetcher.fetch(url)
+                except FetchError as error:
+                    if error.retry and attempt < self.retries:
+                        continue
+                    return error
+            self.stats["pages"] += 1
+            # bs4 is pure Python, parsing in a thread keeps the loop free to start the next requests
+            return await asyncio.to_thread(parse_price, page)
+
+    def save(self, batch, prices):
+        changed = []
+        checked = []
+        for part in batch:
+            price = prices[part.retail_url]
+            if isinstance(price, FetchError):
+                # Not marked as checked, the next run tries again
+                self.stats["failed"] += 1
+                continue
+            self.stats["checked"] += 1
+            if price is None:
+                self.stats["no_price"] += 1
+                checked.append(part.pk)
+            elif price != part.estimated_cost:
+                self.stats["updated"] += 1
+                part.estimated_cost = price
+                # bulk_update skips auto_now, updated_at is what delta sync looks at
+                part.price_checked_at = part.updated_at = self.now
+                changed.append(part)
+            else:
+                self.stats["unchanged"] += 1
+                checked.append(part.pk)
+        with transaction.atomic():
+            ConsumableDetails.objects.bulk_update(changed, ["estimated_cost", "price_checked_at", "updated_at"])
+            ConsumableDetails.objects.filter(pk__in=checked).update(price_checked_at=self.now)
+
+
+def refresh_prices(**options):
+    """Refresh the due parts' prices, returns counts. Keyword arguments are PriceRefresh's."""
+    return async_to_sync(PriceRefresh(**options).run)()
+
+
+# A part that just got a retail url (parts.queue_price_check). With JOB_QUEUE off the nightly
+# refresh_prices gets to it instead.
+@job("refresh_part_price", priority=-10, timeout=120, inline=False)
+def refresh_part_price(details_id):
+    refresh_prices(parts=priced_parts().filter(pk=details_id))
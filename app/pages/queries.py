@@ -0,0 +1,179 @@
+import uuid
+from datetime import date
+from urllib.parse import urlencode
+
+from django.db.models import Count, F, Prefetch, Q
+
+from .cursors import cursor_values, decode_cursor, encode_cursor
+from .models import Asset, BRAND_CHOICES, CATEGORY_CHOICES, Consumable, Log, Room, Task
+
+DUE_SOON_LIMIT = 5
+# Rows per task/log panel page, the rest comes in through "load more"
+PANEL_PAGE_SIZE = 25
+
+# ONly surface the five closes task and never resue old occurrences
+# isnull=False (IS NOT NULL) matches the condition on task_home_due_idx so the partial index can be used
+def get_due_soon_tasks(tasks):
+    return tasks.filter(next_due_date__isnull=False).order_by("next_due_date")[:DUE_SOON_LIMIT]
+
+# Dashboard querysets. Everything dashboard.html touches (room asset counts, consumable names, asset rooms,
+# task locations and log task names) is annotated, joined or prefetched here so the number of queries per
+# page load stays the same no matter how many rooms, assets, tasks or logs the home has.
+def dashboard_rooms(home):
+    return Room.objects.filter(home=home).annotate(asset_count=Count("assets"))
+
+def dashboard_assets(assets):
+    consumables = Consumable.objects.select_related("details")
+    return assets.select_related("room").prefetch_related(Prefetch("consumables", queryset=consumables))
+
+def dashboard_tasks(tasks):
+    return tasks.select_related("asset", "room", "home")
+
+def dashboard_logs(tasks):
+    return Log.objects.filter(task__in=tasks).select_related("task")
+
+
+async def fetch(queryset):
+    # list(queryset) for async code, select_related/prefetch_related included
+    return [obj async for obj in queryset]
+
+
+def parse_uuid_param(value):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date_param(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DashboardFilters:
+    """The dashboard's GET parameters: ?room=&asset=&category=&brand=&overdue=1&from=&to=
+    Values that don't parse are dropped instead of erroring, it's just a filter form."""
+
+    CATEGORIES = {value.lower() for value, _ in CATEGORY_CHOICES}
+    BRANDS = {value for value, _ in BRAND_CHOICES}
+
+    def __init__(self, params):
+        self.room = parse_uuid_param(params.get("room"))
+        self.asset = parse_uuid_param(params.get("asset"))
+        category = params.get("category", "").lower()
+        self.category = category if category in self.CATEGORIES else ""
+        brand = params.get("brand", "")
+        self.brand = brand if brand in self.BRANDS else ""
+        self.overdue = params.get("overdue") == "1"
+        # Due dates for tasks, completion dates for logs
+        self.date_from = parse_date_param(params.get("from"))
+        self.date_to = parse_date_param(params.get("to"))
+
+    def params(self):
+        params = {
+            "room": self.room,
+            "asset": self.asset,
+            "category": self.category,
+            "brand": self.brand,
+            "overdue": "1" if self.overdue else "",
+            "from": self.date_from,
+            "to": self.date_to,
+        }
+        return {name: value for name, value in params.items() if value}
+
+    @property
+    def active(self):
+        return bool(self.params())
+
+    def querystring(self, **extra):
+        return urlencode({**self.params(), **extra})
+
+    def assets(self, home):
+        assets = Asset.objects.filter(room__home=home)
+        if self.room:
+            assets = assets.filter(room_id=self.room)
+        if self.asset:
+            assets = assets.filter(asset_id=self.asset)
+        if self.category:
+            assets = assets.filter(category=self.category)
+        if self.brand:
+            assets = assets.filter(brand=self.brand)
+        return assets
+
+    def tasks(self, home, today=None, due_dates=True):
+        tasks = Task.objects.filter(home=home)
+        if self.room:
+            tasks = tasks.filter(Q(room_id=self.room) | Q(asset__room_id=self.room))
+        if self.asset:
+            tasks = tasks.filter(asset_id=self.asset)
+        if self.category:
+            tasks = tasks.filter(asset__category=self.category)
+        if self.brand:
+            tasks = tasks.filter(asset__brand=self.brand)
+        if not due_dates:
+            return tasks
+        if self.overdue:
+            tasks = tasks.filter(next_due_date__lt=today or date.today())
+        if self.date_from:
+            tasks = tasks.filter(next_due_date__gte=self.date_from)
+        if self.date_to:
+            tasks = tasks.filter(next_due_date__lte=self.date_to)
+        return tasks
+
+    def logs(self, home):
+        # Overdue and the due date range are about a task's future, not its history
+        logs = dashboard_logs(self.tasks(home, due_dates=False))
+        if self.date_from:
+            logs = logs.filter(completion_date__gte=self.date_from)
+        if self.date_to:
+            logs = logs.filter(completion_date__lte=self.date_to)
+        return logs
+
+
+def keyset_query(queryset, field, pk, cursor=None, limit=PANEL_PAGE_SIZE, descending=False):
+    """The rows for one page ordered by a nullable field (nulls last), then the primary key, plus one
+    extra row that tells keyset_result there's another page. Raises ValueError for a bad cursor."""
+    after = "lt" if descending else "gt"
+    order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    queryset = queryset.order_by(order, f"-{pk}" if descending else pk)
+    if cursor:
+        value, last_pk = cursor_values(queryset.model, [field, pk], decode_cursor(cursor))
+        if last_pk is None:
+            raise ValueError("Cursor doesn't match this list.")
+        if value is None:
+            # Already into the rows without a value
+            queryset = queryset.filter(**{f"{field}__isnull": True, f"{pk}__{after}": last_pk})
+        else:
+            queryset = queryset.filter(
+                Q(**{f"{field}__{after}": value})
+                | Q(**{field: value, f"{pk}__{after}": last_pk})
+                | Q(**{f"{field}__isnull": True})
+            )
+    return queryset[: limit + 1]
+
+
+def keyset_result(rows, field, pk, limit=PANEL_PAGE_SIZE):
+    """The page and the cursor for the next one (None on the last page)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, field), getattr(last, pk)])
+
+
+# Soonest due first, tasks without a due date at the end
+def task_page_query(tasks, cursor=None):
+    return keyset_query(dashboard_tasks(tasks), "next_due_date", "task_id", cursor)
+
+# Most recent first, pending logs (no completion date) at the end
+def log_page_query(logs, cursor=None):
+    return keyset_query(logs, "completion_date", "log_id", cursor, descending=True)
+
+
+def task_page(tasks, cursor=None):
+    return keyset_result(list(task_page_query(tasks, cursor)), "next_due_date", "task_id")
+
+def log_page(logs, cursor=None):
+    return keyset_result(list(log_page_query(logs, cursor)), "completion_date", "log_id")
@@ -0,0 +1,143 @@
+import calendar
+from datetime import date, timedelta
+
+from django.db.models import F
+
+from .jobs import job
+from .models import Task, TaskOccurrence
+
+# Calendar correct task recurrence + the materialized TaskOccurrence table.
+# Monthly/quarterly/yearly step in real months (Jan 31 -> Feb 28 -> Mar 31), everything else steps in days.
+# Upcoming occurrences are written to TaskOccurrence so calendar/reminder queries are plain range scans.
+
+# How far ahead occurrences are materialized
+OCCURRENCE_WINDOW_DAYS = 365
+
+MONTH_STEPS = {
+    "monthly": 1,
+    "quarterly": 3,
+    "yearly": 12,
+}
+DAY_STEPS = {
+    "daily": 1,
+    "weekly": 7,
+    "every_n_days": 1,
+    "every_n_weeks": 7,
+}
+
+
+def add_months(start_date, months):
+    month_index = start_date.month - 1 + months
+    year = start_date.year + month_index // 12
+    month = month_index % 12 + 1
+    # Clamp to the end of shorter months
+    day = min(start_date.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def nth_occurrence(interval, anchor, n, every=1):
+    """The nth occurrence after anchor. Always computed from the anchor so month ends don't drift."""
+    every = max(1, every or 1)
+    if interval in MONTH_STEPS:
+        return add_months(anchor, MONTH_STEPS[interval] * every * n)
+    if interval in DAY_STEPS:
+        return anchor + timedelta(days=DAY_STEPS[interval] * every * n)
+    # One time task
+    return anchor
+
+
+def next_occurrence(interval, start_date, every=1):
+    return nth_occurrence(interval, start_date, 1, every)
+
+
+def occurrence_dates(interval, first_due, until, every=1):
+    """Due dates from first_due (inclusive) up to until (inclusive)."""
+    if not first_due or first_due > until:
+        return []
+    if interval not in MONTH_STEPS and interval not in DAY_STEPS:
+        return [first_due]
+    dates = []
+    n = 0
+    current = first_due
+    while current <= until:
+        dates.append(current)
+        n += 1
+        current = nth_occurrence(interval, first_due, n, every)
+    return dates
+
+
+def window_end(today=None):
+    return (today or date.today()) + timedelta(days=OCCURRENCE_WINDOW_DAYS)
+
+
+def build_occurrences(task, until):
+    return [
+        TaskOccurrence(task_id=task.task_id, home_id=task.home_id, due_date=due_date)
+        for due_date in occurrence_dates(task.interval, task.next_due_date, until, task.interval_count)
+    ]
+
+
+def roll_forward(task, until=None):
+    """Bring one task's occurrences in line with its next_due_date, e.g. after a Log is recorded.
+    Only rows that are no longer on the schedule get deleted, the rest are left alone."""
+    until = until or window_end()
+    occurrences = build_occurrences(task, until)
+    due_dates = [occurrence.due_date for occurrence in occurrences]
+    TaskOccurrence.objects.filter(task_id=task.task_id).exclude(due_date__in=due_dates).delete()
+    TaskOccurrence.objects.bulk_create(occurrences, ignore_conflicts=True)
+    return len(occurrences)
+
+
+@job("roll_forward", priority=10)
+def roll_forward_job(task_id):
+    task = Task.objects.filter(task_id=task_id).first()
+    if task:
+        roll_forward(task)
+
+
+def roll_forward_many(tasks, until=None, chunk_size=500):
+    """roll_forward for a batch of tasks (e.g. completed together, see completion.py) in a few queries
+    per chunk instead of two per task."""
+    until = until or window_end()
+    tasks = list(tasks)
+    for start in range(0, len(tasks), chunk_size):
+        chunk = tasks[start : start + chunk_size]
+        wanted = [occurrence for task in chunk for occurrence in build_occurrences(task, until)]
+        keep = {(occurrence.task_id, occurrence.due_date) for occurrence in wanted}
+        existing = TaskOccurrence.objects.filter(task_id__in=[task.task_id for task in chunk]).values_list("pk", "task_id", "due_date")
+        stale = [pk for pk, task_id, due_date in existing if (task_id, due_date) not in keep]
+        if stale:
+            TaskOccurrence.objects.filter(pk__in=stale).delete()
+        TaskOccurrence.objects.bulk_create(wanted, batch_size=chunk_size, ignore_conflicts=True)
+
+
+@job("roll_forward_many", priority=10)
+def roll_forward_many_job(task_ids):
+    roll_forward_many(
+        Task.objects.filter(task_id__in=task_ids).only("task_id", "home_id", "interval", "interval_count", "next_due_date")
+    )
+
+
+def materialize(tasks=None, until=None, chunk_size=2000):
+    """Bulk (re)build occurrences for many tasks. Safe to re-run, existing rows are kept."""
+    until = until or window_end()
+    if tasks is None:
+        tasks = Task.objects.all()
+    tasks = tasks.filter(next_due_date__isnull=False).only("task_id", "home_id", "interval", "interval_count", "next_due_date")
+
+    # Occurrences before a task's next due date have been completed (or skipped)
+    TaskOccurrence.objects.filter(task__in=tasks.values("task_id"), due_date__lt=F("task__next_due_date")).delete()
+
+    # Existing rows are skipped by the (task, due_date) unique constraint
+    written = 0
+    batch = []
+    for task in tasks.iterator(chunk_size=chunk_size):
+        batch.extend(build_occurrences(task, until))
+        if len(batch) >= chunk_size:
+            TaskOccurrence.objects.bulk_create(batch, batch_size=chunk_size, ignore_conflicts=True)
+            written += len(batch)
+            batch = []
+    if batch:
+        TaskOccurrence.objects.bulk_create(batch, batch_size=chunk_size, ignore_conflicts=True)
+        written += len(batch)
+    return written
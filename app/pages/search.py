@@ -0,0 +1,350 @@
+import re
+
+from django.contrib import messages
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.shortcuts import redirect, render
+
+from .api import ApiError, api_user, api_view, conditional_json, page_size, parse_choice
+from .cursors import decode_cursor, encode_cursor
+from .models import Asset, Consumable, HomeUserConnection, Log, SearchEntry, Task
+from .summary import home_id_for
+
+# Full-text search over everything in the user's homes: asset names, brands and model numbers, consumable
+# names and part numbers, task names and log notes.
+#   /pages/search/?q=water+heater+anode                        html page
+#   GET /pages/api/search/?q=&kind=&cursor=&limit=50           the same as JSON, kind is asset/consumable/task/log
+# Every object has a SearchEntry row (models.py) with its text, and the database indexes that table
+# (migration 0010): a GIN indexed tsvector on Postgres, an FTS5 table on SQLite, LIKE anywhere else.
+# signals.py keeps the entries current as objects are saved, deletes cascade to them. The bulk writers
+# (importer.py, completion.py) index what they create with index_objects, deletion.py moves and purges
+# them with the rest of a home. rebuild_search fills the table for data that was there before.
+# Every word has to match, stemmed ("filters" finds filter). No prefix matching, a prefix of a common word
+# has to read every entry it matches. Results are ranked (names count more than notes) and keyset
+# paginated on (rank, id), the cursor holds the rank of the last row.
+
+SEARCH_PAGE_SIZE = 25
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+# Up to this many homes an FTS5 search is narrowed to them inside the index, see ranked_ids
+MAX_MATCH_HOMES = 100
+NAME_WEIGHT = 4.0
+CONTEXT_WEIGHT = 2.0
+TEXT_LENGTH = 200
+KIND_FIELDS = {
+    SearchEntry.ASSET: "asset_id",
+    SearchEntry.CONSUMABLE: "consumable_id",
+    SearchEntry.TASK: "task_id",
+    SearchEntry.LOG: "log_id",
+}
+
+
+def part_key(value):
+    # Same as models.search_key, so "da2900020b" finds "DA29-00020B"
+    return value.upper().replace("-", "").replace(" ", "")
+
+
+def words(*values):
+    return " ".join(value for value in values if value)
+
+
+def asset_document(name, brand, model_number):
+    key = part_key(model_number)
+    return name, words(brand, model_number, key if key != model_number else "")
+
+
+def consumable_document(name, part_number, brand, model_number):
+    part_number = part_number or ""
+    key = part_key(part_number)
+    return name, words(part_number, key if key != part_number else "", brand, model_number)
+
+
+def entry_for(instance):
+    """The unsaved SearchEntry of an asset, consumable, task or log, None when it has nothing to find it by."""
+    if isinstance(instance, Log) and not instance.notes:
+        return None
+    home_id = home_id_for(instance)
+    if home_id is None:
+        return None
+    if isinstance(instance, Asset):
+        title, body = asset_document(instance.name, instance.brand, instance.model_number)
+        return SearchEntry(home_id=home_id, kind=SearchEntry.ASSET, asset=instance, title=title, body=body)
+    if isinstance(instance, Consumable):
+        details = instance.details
+        title, body = consumable_document(
+            instance.name, *((details.part_number, details.brand, details.model_number) if details else ("", "", ""))
+        )
+        return SearchEntry(
+            home_id=home_id, kind=SearchEntry.CONSUMABLE, consumable=instance, asset_id=instance.asset_id,
+            title=title, context=instance.asset.name, body=body,
+        )
+    if isinstance(instance, Task):
+        return SearchEntry(
+            home_id=home_id, kind=SearchEntry.TASK, task=instance, asset_id=instance.asset_id,
+            title=instance.name, context=instance.asset.name if instance.asset_id else "",
+        )
+    if isinstance(instance, Log):
+        return SearchEntry(
+            home_id=home_id, kind=SearchEntry.LOG, log=instance, task_id=instance.task_id,
+            context=instance.task.name, body=instance.notes,
+        )
+    return None
+
+
+def index_object(instance, created=False):
+    """Brings the entry of a saved object up to date (post_save, signals.py)."""
+    kind = type(instance)._meta.model_name
+    field = KIND_FIELDS[kind]
+    # Logs without notes are most of them, a new one has nothing to look up
+    if kind == SearchEntry.LOG and created and not instance.notes:
+        return
+    entry = entry_for(instance)
+    if created:
+        if entry is not None:
+            entry.save()
+        return
+    entries = SearchEntry.objects.filter(kind=kind, **{field: instance.pk})
+    if entry is None:
+        entries.delete()
+        return
+    # The entries under a renamed or moved asset or task follow it
+    if kind == SearchEntry.ASSET:
+        consumables = SearchEntry.objects.filter(kind=SearchEntry.CONSUMABLE, asset_id=instance.pk)
+        consumables.filter(~Q(home_id=entry.home_id) | ~Q(context=instance.name)).update(home_id=entry.home_id, context=instance.name)
+        SearchEntry.objects.filter(kind=SearchEntry.TASK, asset_id=instance.pk).exclude(context=instance.name).update(context=instance.name)
+    elif kind == SearchEntry.TASK:
+        logs = SearchEntry.objects.filter(kind=SearchEntry.LOG, task_id=instance.pk)
+        logs.filter(~Q(home_id=entry.home_id) | ~Q(context=instance.name)).update(home_id=entry.home_id, context=instance.name)
+    changed = entries.update(
+        home_id=entry.home_id, asset_id=entry.asset_id, task_id=entry.task_id,
+        title=entry.title, context=entry.context, body=entry.body,
+    )
+    if not changed:
+        entry.save()
+
+
+def index_objects(objects, batch_size=500):
+    """Entries for objects just written with bulk_create, which sends no post_save. Their relations
+    should be loaded (as they are when they were built in Python), or every one is a query."""
+    entries = [entry for entry in map(entry_for, objects) if entry is not None]
+    SearchEntry.objects.bulk_create(entries, batch_size=batch_size)
+    return len(entries)
+
+
+def index_consumables(details):
+    """A part's number changed, every consumable that uses it shows up under the new one."""
+    for consumable in Consumable.objects.filter(details=details).select_related("details", "asset__room"):
+        index_object(consumable)
+
+
+def rebuild_search_index(home_ids=None, batch_size=2000):
+    """Throw away and recreate the entries, for every home or just these. Returns the entries written."""
+    sources = [
+        (
+            Asset.objects.values("asset_id", "name", "brand", "model_number", entry_home=F("room__home_id")),
+            lambda row: SearchEntry(
+                kind=SearchEntry.ASSET, asset_id=row["asset_id"],
+                **dict(zip(("title", "body"), asset_document(row["name"], row["brand"], row["model_number"]))),
+            ),
+        ),
+        (
+            Consumable.objects.values(
+                "consumable_id", "asset_id", "name", "asset__name",
+                "details__part_number", "details__brand", "details__model_number",
+                entry_home=F("asset__room__home_id"),
+            ),
+            lambda row: SearchEntry(
+                kind=SearchEntry.CONSUMABLE, consumable_id=row["consumable_id"], asset_id=row["asset_id"],
+                context=row["asset__name"],
+                **dict(zip(("title", "body"), consumable_document(
+                    row["name"], row["details__part_number"], row["details__brand"], row["details__model_number"]
+                ))),
+            ),
+        ),
+        (
+            Task.objects.values("task_id", "asset_id", "name", "asset__name", entry_home=Coalesce("home_id", "room__home_id")),
+            lambda row: SearchEntry(
+                kind=SearchEntry.TASK, task_id=row["task_id"], asset_id=row["asset_id"],
+                title=row["name"], context=row["asset__name"] or "",
+            ),
+        ),
+        (
+            Log.objects.exclude(notes="").values(
+                "log_id", "task_id", "notes", "task__name", entry_home=Coalesce("task__home_id", "task__room__home_id")
+            ),
+            lambda row: SearchEntry(
+                kind=SearchEntry.LOG, log_id=row["log_id"], task_id=row["task_id"], context=row["task__name"], body=row["notes"]
+            ),
+        ),
+    ]
+    entries = SearchEntry.objects.all()
+    if home_ids is not None:
+        entries = entries.filter(home_id__in=home_ids)
+    written = 0
+    with transaction.atomic():
+        entries.delete()
+        for rows, build in sources:
+            rows = rows.filter(entry_home__isnull=False)
+            if home_ids is not None:
+                rows = rows.filter(entry_home__in=home_ids)
+            batch = []
+            for row in rows.order_by().iterator(chunk_size=batch_size):
+                entry = build(row)
+                entry.home_id = row["entry_home"]
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    SearchEntry.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            SearchEntry.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def search_terms(text):
+    """The words of a query, lower cased. Punctuation only separates words, so nothing the user types
+    reaches the query syntax of the index."""
+    return [term.lower() for term in re.findall(r"[^\W_]+", (text or "")[:MAX_QUERY_LENGTH])][:MAX_TERMS]
+
+
+def ranked_ids(terms, home_ids, kind, after, limit):
+    """(entry id, rank) of the best matches, best first, starting after the (rank, id) of a cursor."""
+    params = []
+    scoped = False
+    if connection.vendor == "postgresql":
+        ranked = (
+            # float8, so the rank in a cursor compares equal to the one in the database
+            "SELECT e.id, ts_rank(e.document, q)::float8 AS score FROM pages_searchentry e, to_tsquery('english', %s) q "
+            "WHERE e.document @@ q"
+        )
+        params.append(" & ".join(terms))
+    elif connection.vendor == "sqlite":
+        match = " AND ".join(f'{{title context body}} : "{term}"' for term in terms)
+        # bm25 is lower for better matches, flipped so rank is higher is better like ts_rank
+        score = f"-bm25(pages_searchentry_fts, 0.0, {NAME_WEIGHT}, {CONTEXT_WEIGHT}, 1.0)"
+        # Only the entries of these homes are read from the index, not every entry of a common word in the
+        # database. Past a hundred homes the OR costs more than it saves and the join below does it alone.
+        if len(home_ids) <= MAX_MATCH_HOMES:
+            match = "home_id : (" + " OR ".join(f'"{home_id.hex}"' for home_id in home_ids) + f") AND {match}"
+            scoped = not kind
+        if scoped:
+            # No join needed, search() checks the homes of the page again (the home tokens are stemmed too)
+            ranked = f"SELECT rowid AS id, {score} AS score FROM pages_searchentry_fts WHERE pages_searchentry_fts MATCH %s"
+        else:
+            ranked = (
+                f"SELECT e.id, {score} AS score "
+                "FROM pages_searchentry_fts JOIN pages_searchentry e ON e.id = pages_searchentry_fts.rowid "
+                "WHERE pages_searchentry_fts MATCH %s"
+            )
+        params.append(match)
+    else:
+        return like_ids(terms, home_ids, kind, after, limit)
+
+    if not scoped:
+        home_field = SearchEntry._meta.get_field("home").target_field
+        ranked += f" AND e.home_id IN ({', '.join(['%s'] * len(home_ids))})"
+        params += [home_field.get_db_prep_value(home_id, connection) for home_id in home_ids]
+    if kind:
+        ranked += " AND e.kind = %s"
+        params.append(kind)
+    sql = f"SELECT id, score FROM ({ranked}) ranked"
+    if after:
+        sql += " WHERE score < %s OR (score = %s AND id > %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY score DESC, id LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def like_ids(terms, home_ids, kind, after, limit):
+    # No full-text index on this database: every word somewhere in the text, unranked
+    entries = SearchEntry.objects.filter(home_id__in=home_ids)
+    for term in terms:
+        entries = entries.filter(Q(title__icontains=term) | Q(context__icontains=term) | Q(body__icontains=term))
+    if kind:
+        entries = entries.filter(kind=kind)
+    if after:
+        entries = entries.filter(pk__gt=after[1])
+    return [(pk, 0.0) for pk in entries.order_by("pk").values_list("pk", flat=True)[:limit]]
+
+
+def search(user, text, kind="", cursor=None, limit=SEARCH_PAGE_SIZE):
+    """One page of results for the user's homes and the cursor of the next one (None on the last page).
+    Raises ValueError for a bad cursor."""
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if len(after) != 2 or not all(isinstance(value, (int, float)) for value in after):
+            raise ValueError("Cursor doesn't match this list.")
+    terms = search_terms(text)
+    if not terms:
+        return [], None
+    home_ids = list(HomeUserConnection.objects.filter(user=user).values_list("home_id", flat=True))
+    if not home_ids:
+        return [], None
+    ranked = ranked_ids(terms, home_ids, kind, after, limit + 1)
+    next_cursor = None
+    if len(ranked) > limit:
+        ranked = ranked[:limit]
+        last_pk, last_score = ranked[-1]
+        next_cursor = encode_cursor([last_score, last_pk])
+    entries = SearchEntry.objects.select_related("home", "log").in_bulk([pk for pk, _ in ranked])
+    home_ids = set(home_ids)
+    return [result(entries[pk]) for pk, _ in ranked if pk in entries and entries[pk].home_id in home_ids], next_cursor
+
+
+def result(entry):
+    row = {
+        "kind": entry.kind,
+        "id": getattr(entry, KIND_FIELDS[entry.kind]),
+        # A log is shown under its task, a consumable without a name by its part number
+        "name": entry.title or (entry.context if entry.kind == SearchEntry.LOG else entry.body[:TEXT_LENGTH]),
+        "context": entry.context,
+        "text": entry.body[:TEXT_LENGTH],
+        "home_id": entry.home_id,
+        "home_name": entry.home.name,
+        "task_id": entry.task_id,
+        "completion_date": None,
+    }
+    if entry.kind == SearchEntry.LOG:
+        row["completion_date"] = entry.log.completion_date
+    return row
+
+
+def search_view(request):
+    user = request.current_user()
+    if user is None:
+        messages.error(request, "Please log in to continue.")
+        return redirect("login")
+    query = request.GET.get("q", "").strip()[:MAX_QUERY_LENGTH]
+    kind = request.GET.get("kind", "")
+    if kind not in KIND_FIELDS:
+        kind = ""
+    try:
+        results, next_cursor = search(user, query, kind, request.GET.get("cursor"))
+    except ValueError:
+        results, next_cursor = search(user, query, kind)
+    return render(
+        request,
+        "search.html",
+        {"query": query, "kind": kind, "kinds": SearchEntry.KIND_CHOICES, "results": results, "next_cursor": next_cursor},
+    )
+
+
+@api_view
+def search_api(request):
+    if request.method != "GET":
+        raise ApiError("Method not allowed.", status=405)
+    user = api_user(request)
+    query = request.GET.get("q", "")
+    if not search_terms(query):
+        raise ApiError("q is required.")
+    kind = parse_choice(SearchEntry.KIND_CHOICES)(request.GET.get("kind"), "kind")
+    try:
+        results, next_cursor = search(user, query, kind, request.GET.get("cursor"), page_size(request))
+    except ValueError:
+        raise ApiError("Invalid cursor.")
+    return conditional_json(request, {"results": results, "next_cursor": next_cursor})
@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .current import forget_home, forget_user
+from .jobs import enqueue
+from .models import AppUser, Asset, Consumable, ConsumableDetails, Home, HomeUserConnection, Log, Room, Task, Tombstone
+from .search import index_consumables, index_object
+from .summary import bump_portfolio_version, bump_version, home_id_for
+
+# Keep the cached home summaries (summary.py) honest. Anything that changes a home bumps its version.
+# Deletes also leave a Tombstone behind for the delta sync (sync.py).
+# The cached request user/home (current.py) are dropped when the user, the home or who may see it changes.
+# A user's portfolio (portfolio.py) moves with any of their homes, and with homes joining or leaving it.
+# Saved assets, consumables, tasks and logs update their search entry (search.py), deletes cascade to it.
+
+SUMMARY_MODELS = (Room, Asset, Task, Consumable, Log)
+
+
+def invalidate_home_summary(instance):
+    home_id = home_id_for(instance)
+    if home_id:
+        # After the commit, a summary built before it would otherwise be cached under the new version
+        transaction.on_commit(lambda: bump_version(home_id))
+
+
+def summary_post_save(sender, instance, **kwargs):
+    invalidate_home_summary(instance)
+
+
+def summary_post_delete(sender, instance, origin=None, **kwargs):
+    # Rows removed by a cascade (e.g. every log of a deleted room) are covered by the object that
+    # started the delete (or their home is gone), so don't look up a home for each one of them
+    if isinstance(origin, models.Model) and origin is not instance:
+        return
+    home_id = home_id_for(instance)
+    if home_id:
+        transaction.on_commit(lambda: bump_version(home_id))
+        Tombstone.objects.create(home_id=home_id, model=sender._meta.model_name, object_id=instance.pk)
+
+
+# Connected per model on purpose. A receiver without a sender counts as a listener for every model
+# and stops Django from fast deleting anything.
+for model in SUMMARY_MODELS:
+    post_save.connect(summary_post_save, sender=model, dispatch_uid=f"summary_post_save_{model.__name__}")
+    post_delete.connect(summary_post_delete, sender=model, dispatch_uid=f"summary_post_delete_{model.__name__}")
+
+
+def current_user_changed(sender, instance, **kwargs):
+    forget_user(instance.username)
+
+
+def current_home_changed(sender, instance, **kwargs):
+    forget_home(instance.home_id)
+
+
+def portfolio_home_changed(sender, instance, **kwargs):
+    # A renamed home, or a new one (its connection bumps its user)
+    transaction.on_commit(lambda: bump_version(instance.home_id))
+
+
+def portfolio_homes_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_portfolio_version(instance.user_id))
+
+
+post_save.connect(portfolio_home_changed, sender=Home, dispatch_uid="portfolio_post_save_Home")
+post_save.connect(portfolio_homes_changed, sender=HomeUserConnection, dispatch_uid="portfolio_post_save_HomeUserConnection")
+post_delete.connect(portfolio_homes_changed, sender=HomeUserConnection, dispatch_uid="portfolio_post_delete_HomeUserConnection")
+
+
+for model, receiver in ((AppUser, current_user_changed), (Home, current_home_changed), (HomeUserConnection, current_home_changed)):
+    post_save.connect(receiver, sender=model, dispatch_uid=f"current_post_save_{model.__name__}")
+    post_delete.connect(receiver, sender=model, dispatch_uid=f"current_post_delete_{model.__name__}")
+
+
+# The analytics rollup (MonthlySpend, see analytics.py) when ANALYTICS_ROLLUP is on. An edited log
+# might have moved to another task or month, so the month it used to be in is recomputed as well.
+# The recompute is a background job (jobs.py), it reads whatever the logs are by the time it runs.
+def queue_spend_refresh(task_id, day, home_id=None):
+    enqueue(
+        "refresh_monthly_spend",
+        task_id=str(task_id),
+        months=[day.isoformat() if day else None],
+        home_id=str(home_id) if home_id else None,
+    )
+
+
+def spend_pre_save(sender, instance, **kwargs):
+    if not settings.ANALYTICS_ROLLUP or instance._state.adding:
+        return
+    instance._spend_before = Log.objects.filter(pk=instance.pk).values_list("task_id", "completion_date").first()
+
+
+def spend_post_save(sender, instance, **kwargs):
+    if not settings.ANALYTICS_ROLLUP:
+        return
+    before = getattr(instance, "_spend_before", None)
+    if before and before != (instance.task_id, instance.completion_date):
+        queue_spend_refresh(*before)
+    queue_spend_refresh(instance.task_id, instance.completion_date, home_id_for(instance))
+
+
+def spend_post_delete(sender, instance, origin=None, **kwargs):
+    # A deleted task or room takes its rollup rows with it
+    if not settings.ANALYTICS_ROLLUP or (isinstance(origin, models.Model) and origin is not instance):
+        return
+    queue_spend_refresh(instance.task_id, instance.completion_date, home_id_for(instance))
+
+
+pre_save.connect(spend_pre_save, sender=Log, dispatch_uid="spend_pre_save_Log")
+post_save.connect(spend_post_save, sender=Log, dispatch_uid="spend_post_save_Log")
+post_delete.connect(spend_post_delete, sender=Log, dispatch_uid="spend_post_delete_Log")
+
+
+def search_post_save(sender, instance, created=False, **kwargs):
+    index_object(instance, created)
+
+
+def search_part_changed(sender, instance, created=False, **kwargs):
+    # A new part has no consumables yet, they're saved (and indexed) when they start using it
+    if not created:
+        index_consumables(instance)
+
+
+for model in (Asset, Consumable, Task, Log):
+    post_save.connect(search_post_save, sender=model, dispatch_uid=f"search_post_save_{model.__name__}")
+post_save.connect(search_part_changed, sender=ConsumableDetails, dispatch_uid="search_post_save_ConsumableDetails")
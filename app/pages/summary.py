@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+from django.core.cache import cache
+
+from .current import load_home
+from .models import Asset, Consumable, Log, Room, Task
+from .queries import dashboard_tasks, fetch, get_due_soon_tasks
+
+# Per-home dashboard summary (room/asset/task counts + the due soon panel) kept in Django's cache.
+# Every home has a version number in the cache and the summary is stored under the current version.
+# signals.py bumps the version whenever a Room, Asset, Task, Consumable or Log of that home changes,
+# so a stale summary is never read again and just expires on its own.
+
+SUMMARY_TIMEOUT = 60 * 60 * 24
+
+
+def version_key(home_id):
+    return f"home-summary-version:{home_id}"
+
+
+def summary_key(home_id, version):
+    return f"home-summary:{home_id}:{version}"
+
+
+def new_version():
+    # If the version key gets evicted we can't restart at 1, older summaries might still be around
+    return time.time_ns()
+
+
+def portfolio_version_key(username):
+    return f"portfolio-version:{username}"
+
+
+def read_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        # add() so two requests racing here agree on a single version
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Nothing cached under this key yet
+        cache.set(key, new_version(), timeout=None)
+
+
+def get_version(home_id):
+    return read_version(version_key(home_id))
+
+
+# A user's portfolio (portfolio.py) covers all their homes, any of them changing bumps it too
+def get_portfolio_version(username):
+    return read_version(portfolio_version_key(username))
+
+
+def bump_portfolio_version(username):
+    bump(portfolio_version_key(username))
+
+
+def bump_version(home_id):
+    bump(version_key(home_id))
+    for username in load_home(home_id)[1]:
+        bump_portfolio_version(username)
+
+
+def build_summary(rooms, assets, tasks):
+    return {
+        "room_count": rooms.count(),
+        "asset_count": assets.count(),
+        "task_count": tasks.count(),
+        "due_soon_tasks": list(get_due_soon_tasks(dashboard_tasks(tasks))),
+    }
+
+
+def get_home_summary(home):
+    key = summary_key(home.home_id, get_version(home.home_id))
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(
+            Room.objects.filter(home=home),
+            Asset.objects.filter(room__home=home),
+            Task.objects.filter(home=home),
+        )
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+# Async twins for async_views.py. The counts and the due soon list don't depend on each other, so they're
+# sent together instead of one after another
+async def aget_version(home_id):
+    version = await cache.aget(version_key(home_id))
+    if version is None:
+        version = new_version()
+        if not await cache.aadd(version_key(home_id), version, timeout=None):
+            version = await cache.aget(version_key(home_id), version)
+    return version
+
+
+async def abuild_summary(rooms, assets, tasks):
+    room_count, asset_count, task_count, due_soon_tasks = await asyncio.gather(
+        rooms.acount(),
+        assets.acount(),
+        tasks.acount(),
+        fetch(get_due_soon_tasks(dashboard_tasks(tasks))),
+    )
+    return {
+        "room_count": room_count,
+        "asset_count": asset_count,
+        "task_count": task_count,
+        "due_soon_tasks": due_soon_tasks,
+    }
+
+
+async def aget_home_summary(home):
+    key = summary_key(home.home_id, await aget_version(home.home_id))
+    summary = await cache.aget(key)
+    if summary is None:
+        summary = await abuild_summary(
+            Room.objects.filter(home=home),
+            Asset.objects.filter(room__home=home),
+            Task.objects.filter(home=home),
+        )
+        await cache.aset(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def home_id_for(instance):
+    """Work out which home a changed row belongs to, reusing loaded relations where we can."""
+    if isinstance(instance, Room):
+        return instance.home_id
+    if isinstance(instance, Task):
+        if instance.home_id:
+            return instance.home_id
+        if instance.room_id:
+            return Room.objects.filter(pk=instance.room_id).values_list("home_id", flat=True).first()
+        return None
+    if isinstance(instance, Asset):
+        if Asset.room.is_cached(instance):
+            return instance.room.home_id
+        return Room.objects.filter(pk=instance.room_id).values_list("home_id", flat=True).first()
+    if isinstance(instance, Consumable):
+        if Consumable.asset.is_cached(instance):
+            return home_id_for(instance.asset)
+        return Room.objects.filter(assets=instance.asset_id).values_list("home_id", flat=True).first()
+    if isinstance(instance, Log):
+        if Log.task.is_cached(instance):
+            return home_id_for(instance.task)
+        return Task.objects.filter(pk=instance.task_id).values_list("home_id", flat=True).first()
+    return None
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .api import RESOURCES, ApiError, api_user, api_view, decode_cursor, encode_cursor
+from .models import Home, Tombstone
+
+# Delta sync for the mobile client, one home at a time.
+#   GET /pages/api/homes/<home_id>/sync/?since=<token>
+# The response is NDJSON (one JSON object per line), streamed so a full sync of a big home never sits in memory:
+#   {"type": "upsert", "resource": "tasks", "data": {...same fields as the api...}}
+#   {"type": "delete", "resource": "tasks", "id": "..."}   only the deleted row itself, the client cascades
+#                                                          to its children like the database did
+#   {"type": "sync", "token": "..."}    always the last line, send it back as ?since= next time
+# Without ?since= every row of the home is sent (a full snapshot). Upserts are idempotent so the
+# client can safely apply a row twice, which is what the overlap below relies on.
+
+# auto_now stamps updated_at before the transaction commits, so a slow write can become visible after
+# a sync that started later than its timestamp. Re-reading a short window each time catches those.
+SYNC_OVERLAP = timedelta(seconds=60)
+SYNC_CHUNK_SIZE = 500
+
+# Order matters, parents go first so the client never sees a row before the row it points at
+SYNC_RESOURCES = ("homes", "rooms", "assets", "consumables", "tasks", "logs")
+
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, "SYNC_TOMBSTONE_DAYS", 90))
+
+
+def encode_token(moment):
+    return encode_cursor([moment.isoformat()])
+
+
+def decode_token(token):
+    values = decode_cursor(token)
+    try:
+        moment = datetime.fromisoformat(values[0])
+    except (IndexError, TypeError, ValueError):
+        raise ApiError("Invalid sync token.")
+    if timezone.is_naive(moment):
+        raise ApiError("Invalid sync token.")
+    # Tombstones older than this have been pruned, deletes since then can't be replayed
+    if moment < timezone.now() - tombstone_retention():
+        raise ApiError("Sync token has expired, do a full sync.", status=410)
+    return moment
+
+
+def changed_rows(name, home_id, since):
+    resource = RESOURCES[name]
+    queryset = resource.model.objects.all()
+    home_lookup = resource.filters.get("home", resource.pk)
+    queryset = queryset.filter(**{home_lookup: home_id})
+    if since is not None:
+        changed = Q(updated_at__gt=since)
+        if name == "consumables":
+            # Part number/cost/url live on ConsumableDetails
+            changed |= Q(details__updated_at__gt=since)
+        queryset = queryset.filter(changed)
+    queryset = resource.values(queryset.order_by(resource.pk), list(resource.fields))
+    return queryset.iterator(chunk_size=SYNC_CHUNK_SIZE)
+
+
+def sync_lines(home_id, since, token):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for name in SYNC_RESOURCES:
+        for row in changed_rows(name, home_id, since):
+            yield encoder.encode({"type": "upsert", "resource": name, "data": row}) + "\n"
+
+    # A full snapshot has nothing to delete on the client
+    if since is not None:
+        resource_names = {RESOURCES[name].model._meta.model_name: name for name in SYNC_RESOURCES}
+        tombstones = (
+            Tombstone.objects.filter(home_id=home_id, deleted_at__gt=since)
+            .order_by("deleted_at")
+            .values_list("model", "object_id")
+        )
+        for model, object_id in tombstones.iterator(chunk_size=SYNC_CHUNK_SIZE):
+            yield encoder.encode({"type": "delete", "resource": resource_names.get(model, model), "id": object_id}) + "\n"
+
+    yield encoder.encode({"type": "sync", "token": token}) + "\n"
+
+
+@api_view
+def home_sync(request, home_id):
+    if request.method != "GET":
+        raise ApiError("Method not allowed.", status=405)
+    user = api_user(request)
+    if not Home.objects.filter(pk=home_id, users=user).exists():
+        raise ApiError("Not found.", status=404)
+
+    since = None
+    if request.GET.get("since"):
+        since = decode_token(request.GET["since"]) - SYNC_OVERLAP
+    # Taken before reading anything, so whatever changes while we stream shows up next time
+    token = encode_token(timezone.now())
+
+    response = StreamingHttpResponse(sync_lines(home_id, since, token), content_type="application/x-ndjson")
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def prune_tombstones(now=None):
+    cutoff = (now or timezone.now()) - tombstone_retention()
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,1210 @@
+import csv
+import importlib
+import json
+import re
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+from . import async_views, urls
+from .analytics import month_start, rebuild_monthly_spend
+from .current import current_home, current_user
+from .cursors import encode_cursor
+from .deletion import PURGE_HOME_NAME, TASK_BATCH_SIZE, delete_home, delete_room, delete_task
+from .feeds import fold, new_feed, recurrence_rule
+from .importer import AssetImporter
+from .jobs import JOBS, claim, enqueue, job, retry_failed, run
+from .logins import authenticate, hash_password
+from .models import (
+    AppUser,
+    Asset,
+    CalendarFeed,
+    Consumable,
+    ConsumableDetails,
+    Home,
+    HomeUserConnection,
+    Job,
+    Log,
+    MonthlySpend,
+    ReminderDelivery,
+    Room,
+    SearchEntry,
+    Task,
+    TaskOccurrence,
+    Tombstone,
+)
+from .parts import catalog_part
+from .price_fixtures import fixture_price, fixture_shops
+from .prices import due_parts, refresh_prices
+from .recurrence import add_months, materialize, next_occurrence, nth_occurrence, occurrence_dates, roll_forward
+from .summary import get_home_summary, get_version
+from .sync import encode_token
+
+# Run with: python manage.py test (from app/, any DATABASE_URL, the test database is made from it)
+
+# A dashboard with a cold cache: session, user, home + its users, the homes menu, rooms, assets, their
+# consumables, a page of tasks, a page of logs, and the summary (three counts and the due soon tasks)
+DASHBOARD_QUERIES = 14
+
+
+def make_home(user, name, rooms=1, assets=1, logs=1):
+    """A home of user's with rooms * assets assets, each with a part, a task and logs logs."""
+    home = Home.objects.create(name=name)
+    HomeUserConnection.objects.create(home=home, user=user)
+    today = date.today()
+    for room_number in range(rooms):
+        room = Room.objects.create(home=home, name=f"Room {room_number}")
+        for asset_number in range(assets):
+            asset = Asset.objects.create(room=room, name=f"Asset {asset_number}", brand="GE", model_number=f"M{asset_number}")
+            details = ConsumableDetails.objects.create(part_number=f"{name}-{room_number}-{asset_number}", estimated_cost=5)
+            consumable = Consumable.objects.create(asset=asset, details=details)
+            task = Task.objects.create(
+                home=home, room=room, asset=asset, consumable=consumable, name="Check it", interval="monthly",
+                next_due_date=today + timedelta(days=asset_number),
+            )
+            Log.objects.bulk_create(
+                Log(task=task, completion_date=today - timedelta(days=30 * number), cost=5, notes="Done") for number in range(logs)
+            )
+    return home
+
+
+def make_large_home(user, name, rooms, assets, logs):
+    """make_home in a handful of bulk_creates, for homes with thousands of tasks and logs.
+    bulk_create sends no signals, so nothing is indexed for search."""
+    home = Home.objects.create(name=name)
+    HomeUserConnection.objects.create(home=home, user=user)
+    today = date.today()
+    room_rows = Room.objects.bulk_create(Room(home=home, name=f"Room {number}") for number in range(rooms))
+    asset_rows = Asset.objects.bulk_create(
+        Asset(room=room, name=f"Asset {number}", brand="GE", model_number=f"M{number}")
+        for room in room_rows for number in range(assets)
+    )
+    parts = ConsumableDetails.objects.bulk_create(
+        ConsumableDetails(part_number=f"{name}-{number}", estimated_cost=5) for number in range(len(asset_rows))
+    )
+    consumables = Consumable.objects.bulk_create(
+        Consumable(asset=asset, details=part) for asset, part in zip(asset_rows, parts)
+    )
+    tasks = Task.objects.bulk_create(
+        Task(
+            home=home, room=consumable.asset.room, asset=consumable.asset, consumable=consumable, name="Check it",
+            interval="monthly", next_due_date=today + timedelta(days=number % 60),
+        )
+        for number, consumable in enumerate(consumables)
+    )
+    Log.objects.bulk_create(
+        (Log(task=task, completion_date=today - timedelta(days=30 * number), cost=5, notes="Done")
+         for task in tasks for number in range(logs)),
+        batch_size=2000,
+    )
+    return home
+
+class AppTestCase(TestCase):
+    def setUp(self):
+        # Summaries, versions and the current user/home live in the cache, none of it may leak between tests
+        cache.clear()
+        self.user = AppUser.objects.create(username="tester", email="tester@example.com", password="unused")
+
+    def log_in(self, home=None):
+        session = self.client.session
+        session["username"] = self.user.username
+        if home is not None:
+            session["home_id"] = str(home.home_id)
+        session.save()
+
+
+# Rendering a few thousand assets takes a while, that's not what these are about
+@override_settings(REQUEST_METRICS_SLOW_MS=60000)
+class DashboardQueryTests(AppTestCase):
+    # Everything the dashboard shows is joined, annotated or prefetched (queries.py), so the number of
+    # queries doesn't grow with the home
+    def dashboard_queries(self, home):
+        cache.clear()
+        self.log_in(home)
+        self.client.get(reverse("dashboard"))  # let the session settle on its home
+        cache.clear()
+        with self.assertNumQueries(DASHBOARD_QUERIES):
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_the_home(self):
+        small = make_home(self.user, "Small", rooms=1, assets=1, logs=1)
+        # 2,000 tasks and 10,000 logs, an N+1 anywhere would show up in the thousands
+        large = make_large_home(self.user, "Large", rooms=20, assets=100, logs=5)
+        self.assertEqual(Log.objects.filter(task__home=large).count(), 10000)
+        self.dashboard_queries(small)
+        response = self.dashboard_queries(large)
+        self.assertContains(response, "Asset 99")
+
+    def test_panel_pages_cost_the_same_all_the_way_down(self):
+        home = make_large_home(self.user, "Deep", rooms=10, assets=50, logs=4)
+        self.log_in(home)
+        self.client.get(reverse("dashboard"))  # the session's user and home are cached from here on
+        for name, panel in (("dashboard_tasks", "tasks"), ("dashboard_logs", "logs")):
+            url = reverse(name)
+            counts = []
+            for _ in range(5):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+                url = response.context[f"{panel}_more_url"]
+            self.assertEqual(len(set(counts)), 1, (name, counts))
+
+
+class DashboardPanelTests(AppTestCase):
+    def test_panels_page_and_refuse_bad_cursors(self):
+        home = make_home(self.user, "Panels", rooms=3, assets=10, logs=1)
+        self.log_in(home)
+        seen = []
+        url = reverse("dashboard_tasks")
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += re.findall(r"Asset \d+", response.content.decode())
+            url = response.context["tasks_more_url"]
+        self.assertEqual(len(seen), 30)
+        for name, cursor in (
+            ("dashboard_tasks", encode_cursor(["notadate", "x"])),
+            ("dashboard_tasks", encode_cursor([None, None])),
+            ("dashboard_logs", encode_cursor(["2026-01-01", "x"])),
+            ("dashboard_logs", "not base64 at all"),
+        ):
+            response = self.client.get(reverse(name), {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+def server_timing_queries(response):
+    return int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response["Server-Timing"]).group(1))
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000, REQUEST_METRICS_SAMPLE_RATE=1.0, REQUEST_METRICS_HEADER=True)
+class RequestMetricsTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.password = hash_password("password")
+        self.user.save()
+        self.home = make_home(self.user, "Metrics", rooms=2, assets=2, logs=2)
+
+    def assertCountsQueries(self, request):
+        # The header reports exactly what went to the database
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(server_timing_queries(response), len(queries))
+        return response
+
+    def test_header_counts_queries(self):
+        self.assertCountsQueries(lambda: self.client.get(reverse("login")))
+        response = self.assertCountsQueries(
+            lambda: self.client.post(reverse("login"), {"username": "tester", "password": "password"})
+        )
+        self.assertEqual(response.status_code, 302)
+        # The first page after logging in also saves the current home into the session
+        self.assertCountsQueries(lambda: self.client.get(reverse("dashboard")))
+        cache.clear()
+        response = self.assertCountsQueries(lambda: self.client.get(reverse("dashboard")))
+        self.assertEqual(server_timing_queries(response), DASHBOARD_QUERIES)
+        response = self.assertCountsQueries(lambda: self.client.get(reverse("manage_homes")))
+        self.assertEqual(response.status_code, 200)
+
+    def test_sample_rate_zero_measures_nothing(self):
+        self.log_in(self.home)
+        with override_settings(REQUEST_METRICS_SAMPLE_RATE=0, REQUEST_METRICS_SLOW_MS=0):
+            client = Client()
+            client.cookies = self.client.cookies
+            with self.assertNoLogs("pages.metrics"):
+                response = client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_slow_requests_are_logged_but_not_logins(self):
+        with override_settings(REQUEST_METRICS_SLOW_MS=0, REQUEST_METRICS_LOGIN_SLOW_MS=60000):
+            client = Client()
+            with self.assertNoLogs("pages.metrics"):
+                client.post(reverse("login"), {"username": "tester", "password": "password"})
+            with self.assertLogs("pages.metrics", "WARNING") as logs:
+                client.get(reverse("dashboard"))
+        self.assertIn("Slow request GET /pages/dashboard/", logs.output[0])
+
+
+class SummaryVersionTests(AppTestCase):
+    # Writes bump the home's version after the commit, whatever was cached under the old one is never read again
+    def setUp(self):
+        super().setUp()
+        self.home = make_home(self.user, "Versions")
+
+    def add_task(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(home=self.home, name="New task", interval="yearly", next_due_date=date.today())
+
+    def test_summary_follows_writes(self):
+        self.assertEqual(get_home_summary(self.home)["task_count"], 1)
+        self.add_task()
+        self.assertEqual(get_home_summary(self.home)["task_count"], 2)
+
+    def test_calendar_feed_etag_follows_writes(self):
+        url = reverse("calendar_feed", args=[new_feed(self.user, self.home).token])
+        response = self.client.get(url)
+        self.assertEqual(b"".join(response.streaming_content).count(b"BEGIN:VEVENT"), 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.add_task()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        self.assertEqual(b"".join(changed.streaming_content).count(b"BEGIN:VEVENT"), 2)
+
+
+class ApiWriteTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.home = make_home(self.user, "Api")
+        self.other = make_home(self.user, "Other")
+        self.task = Task.objects.get(home=self.home)
+        self.log_in(self.home)
+
+    def post(self, resource, data):
+        return self.client.post(reverse("api_collection", args=[resource]), data, content_type="application/json")
+
+    def patch(self, resource, pk, data):
+        return self.client.patch(reverse("api_detail", args=[resource, pk]), data, content_type="application/json")
+
+    def test_costs_must_fit_the_column(self):
+        for cost in ("1e20", "NaN", "Infinity", "-1e8", "12.345.6", True):
+            response = self.post("logs", {"task_id": str(self.task.task_id), "cost": cost})
+            self.assertEqual(response.status_code, 400, cost)
+        self.assertEqual(self.post("consumables", {"asset_id": str(self.task.asset_id), "estimated_cost": "1e20"}).status_code, 400)
+        response = self.post("logs", {"task_id": str(self.task.task_id), "cost": "9999999.99"})
+        self.assertEqual(response.status_code, 201)
+        response = self.post("logs", {"task_id": str(self.task.task_id), "cost": 12.345})
+        self.assertEqual(Log.objects.get(log_id=response.json()["log_id"]).cost, Decimal("12.35"))
+
+    def test_list_pages_and_bad_cursors(self):
+        url = reverse("api_collection", args=["tasks"])
+        first = self.client.get(url, {"limit": 1, "order": "next_due_date"}).json()
+        self.assertEqual(len(first["results"]), 1)
+        second = self.client.get(url, {"limit": 1, "order": "next_due_date", "cursor": first["next_cursor"]}).json()
+        self.assertNotEqual(second["results"][0]["task_id"], first["results"][0]["task_id"])
+        for resource, params in (
+            ("tasks", {"cursor": encode_cursor(["zzz"])}),
+            ("logs", {"order": "completion_date", "cursor": encode_cursor(["notadate", "x"])}),
+            ("logs", {"order": "completion_date", "cursor": encode_cursor([None, str(self.task.task_id)])}),
+        ):
+            response = self.client.get(reverse("api_collection", args=[resource]), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json()["errors"], ["Invalid cursor."])
+
+    def test_rooms_and_assets_stay_in_their_home(self):
+        room = self.task.room
+        response = self.patch("rooms", room.room_id, {"home_id": str(self.other.home_id)})
+        self.assertEqual(response.status_code, 400)
+        elsewhere = Room.objects.get(home=self.other)
+        response = self.patch("assets", self.task.asset_id, {"room_id": str(elsewhere.room_id)})
+        self.assertEqual(response.status_code, 400)
+        # Within the home is fine, and the task can still be edited afterwards
+        second = Room.objects.create(home=self.home, name="Garage")
+        self.assertEqual(self.patch("assets", self.task.asset_id, {"room_id": str(second.room_id)}).status_code, 200)
+        self.assertEqual(self.patch("rooms", room.room_id, {"home_id": str(self.home.home_id), "name": "Den"}).status_code, 200)
+        self.assertEqual(self.patch("tasks", self.task.task_id, {"name": "Still mine"}).status_code, 200)
+
+    def test_complete_tasks_needs_an_object(self):
+        for body in ([str(self.task.task_id)], '"x"', "1"):
+            response = self.client.post(reverse("api_complete_tasks"), body, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["errors"], ["Request body must be a JSON object."])
+
+    @override_settings(JOB_QUEUE=False)
+    def test_complete_tasks(self):
+        yearly = Task.objects.create(home=self.home, name="Flush it", interval="yearly", next_due_date=date(2026, 1, 1))
+        other = Task.objects.get(home=self.other)
+        task_ids = [str(self.task.task_id), str(yearly.task_id), str(other.task_id)]
+        body = {"task_ids": task_ids, "completion_date": "2026-01-31", "cost": "12.50", "notes": "Swapped the filters"}
+        versions = [get_version(self.home.home_id), get_version(self.other.home_id)]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("api_complete_tasks"), body, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        due = {str(self.task.task_id): "2026-02-28", str(yearly.task_id): "2027-01-31", str(other.task_id): "2026-02-28"}
+        self.assertEqual(
+            {row["task_id"]: (row["next_due_date"], row["last_completed_date"]) for row in data["tasks"]},
+            {task_id: (next_due, "2026-01-31") for task_id, next_due in due.items()},
+        )
+        logs = Log.objects.filter(task_id__in=task_ids, completion_date=date(2026, 1, 31))
+        self.assertEqual(
+            {(str(log.log_id), str(log.task_id)) for log in logs}, {(row["log_id"], row["task_id"]) for row in data["logs"]}
+        )
+        self.assertEqual({(log.cost, log.notes) for log in logs}, {(Decimal("12.50"), "Swapped the filters")})
+        for task in Task.objects.filter(task_id__in=task_ids):
+            self.assertEqual(task.next_due_date.isoformat(), due[str(task.task_id)])
+            self.assertEqual(task.last_completed_date, date(2026, 1, 31))
+            self.assertEqual(TaskOccurrence.objects.filter(task=task).order_by("due_date").first().due_date, task.next_due_date)
+        # What signals.py would have done for single saves
+        self.assertEqual(SearchEntry.objects.filter(kind=SearchEntry.LOG, body="Swapped the filters").count(), 3)
+        for home, version in zip((self.home, self.other), versions):
+            self.assertNotEqual(get_version(home.home_id), version)
+
+        # All or nothing when a task isn't the user's
+        stranger = AppUser.objects.create(username="stranger", email="stranger@example.com", password="unused")
+        theirs = Task.objects.get(home=make_home(stranger, "Theirs"))
+        body["task_ids"] = [str(self.task.task_id), str(theirs.task_id)]
+        response = self.client.post(reverse("api_complete_tasks"), body, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Log.objects.filter(task__in=[self.task, theirs], completion_date=date(2026, 1, 31)).count(), 1)
+
+    def test_editing_a_log_moves_its_task(self):
+        response = self.post("logs", {"task_id": str(self.task.task_id), "completion_date": "2026-01-10"})
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.last_completed_date, self.task.next_due_date), (date(2026, 1, 10), date(2026, 2, 10)))
+        response = self.patch("logs", response.json()["log_id"], {"completion_date": "2026-03-05"})
+        self.assertEqual(response.status_code, 200)
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.last_completed_date, self.task.next_due_date), (date(2026, 3, 5), date(2026, 4, 5)))
+
+    def test_task_asset_must_be_in_its_home(self):
+        elsewhere = Asset.objects.get(room__home=self.other)
+        response = self.post("tasks", {"home_id": str(self.home.home_id), "name": "Wrong", "asset_id": str(elsewhere.asset_id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"], ["asset_id is not in that home."])
+        response = self.patch("tasks", self.task.task_id, {"asset_id": str(elsewhere.asset_id)})
+        self.assertEqual(response.status_code, 400)
+        response = self.patch("tasks", self.task.task_id, {"room_id": str(elsewhere.room_id)})
+        self.assertEqual(response.status_code, 400)
+        self.task.refresh_from_db()
+        self.assertNotEqual(self.task.asset_id, elsewhere.asset_id)
+
+
+class ImportCostTests(AppTestCase):
+    def test_costs_that_do_not_fit_are_row_errors(self):
+        home = make_home(self.user, "Import")
+        row = {"room": "Kitchen", "asset_category": "appliance", "asset_brand": "GE", "consumable_name": "Filter",
+               "consumable_part_number": "F-1", "consumable_interval": "monthly"}
+        costs = ["1e20", "NaN", "Infinity", "12.50"]
+        importer = AssetImporter(self.user, home=home)
+        importer.run((line, dict(row, asset_name=f"Fridge {line}", consumable_cost=cost)) for line, cost in enumerate(costs, 2))
+        self.assertEqual([line for line, _ in importer.errors], [2, 3, 4])
+        self.assertEqual(importer.imported, 1)
+        self.assertEqual(Consumable.objects.get(asset__name="Fridge 5").details.estimated_cost, Decimal("12.50"))
+
+
+class AnalyticsTests(AppTestCase):
+    def test_home_without_scheduled_tasks(self):
+        home = Home.objects.create(name="Empty")
+        HomeUserConnection.objects.create(home=home, user=self.user)
+        self.log_in(home)
+        response = self.client.get(reverse("api_analytics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["overdue"]["overall"], {"tasks": 0, "overdue": 0, "rate": 0})
+        self.assertEqual(self.client.get(reverse("analytics")).status_code, 200)
+
+    def test_overdue_rate(self):
+        home = make_home(self.user, "Late", assets=2)
+        Task.objects.filter(home=home, asset__name="Asset 0").update(next_due_date=date.today() - timedelta(days=1))
+        self.log_in(home)
+        overdue = self.client.get(reverse("api_analytics")).json()["overdue"]
+        self.assertEqual(overdue["overall"], {"tasks": 2, "overdue": 1, "rate": 0.5})
+
+    @override_settings(JOB_QUEUE=False, ANALYTICS_ROLLUP=True)
+    def test_monthly_spend_rollup_follows_the_logs(self):
+        home = make_home(self.user, "Spend", logs=0)
+        task = Task.objects.get(home=home)
+        this_month = month_start(date.today())
+        last_month = add_months(this_month, -1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Log.objects.create(task=task, completion_date=this_month, cost=Decimal("10.25"))
+            moved = Log.objects.create(task=task, completion_date=this_month, cost=Decimal("4.75"))
+            Log.objects.create(task=task, completion_date=last_month, cost=Decimal("3.00"))
+            Log.objects.create(task=task, completion_date=last_month)
+
+        def rollup():
+            return set(MonthlySpend.objects.values_list("month", "total", "log_count"))
+
+        self.assertEqual(rollup(), {(this_month, Decimal("15.00"), 2), (last_month, Decimal("3.00"), 1)})
+
+        # A log that moves month is taken off the old one too
+        moved.completion_date = last_month
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.save()
+        self.assertEqual(rollup(), {(this_month, Decimal("10.25"), 1), (last_month, Decimal("7.75"), 2)})
+        with self.captureOnCommitCallbacks(execute=True):
+            Log.objects.filter(completion_date=this_month).get().delete()
+        self.assertEqual(rollup(), {(last_month, Decimal("7.75"), 2)})
+
+        # Read from the rollup or the logs, the numbers are the same
+        self.log_in(home)
+        from_rollup = self.client.get(reverse("api_analytics"), {"months": 3}).json()
+        with self.settings(ANALYTICS_ROLLUP=False):
+            from_logs = self.client.get(reverse("api_analytics"), {"months": 3}).json()
+        self.assertEqual(from_rollup["months"], from_logs["months"])
+        self.assertEqual((from_rollup["spend"], from_rollup["by_home"]), (from_logs["spend"], from_logs["by_home"]))
+        self.assertEqual(Decimal(from_rollup["spend"]), Decimal("7.75"))
+        self.assertEqual(rebuild_monthly_spend(), 1)
+        self.assertEqual(rollup(), {(last_month, Decimal("7.75"), 2)})
+
+
+@override_settings(JOB_QUEUE=False)
+class DeleteHomeTests(AppTestCase):
+    def test_purge_is_queued_and_batched(self):
+        # More tasks than one purge chunk, and more logs than a delete batch
+        home = make_home(self.user, "Gone", rooms=11, assets=10, logs=20)
+        self.assertGreater(Task.objects.filter(home=home).count(), TASK_BATCH_SIZE)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_home(home)
+        # Only hidden, the purge waits for run_jobs even with JOB_QUEUE off
+        self.assertFalse(HomeUserConnection.objects.filter(home=home).exists())
+        self.assertTrue(Log.objects.filter(task__home=home).exists())
+        [job] = claim("test", names=["purge_home"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(run(job))
+        # It was the only home
+        for model in (Home, HomeUserConnection, Room, Asset, Consumable, Task, Log, TaskOccurrence, SearchEntry, Job):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        # Ids are only ever read a batch at a time
+        selects = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertIn("LIMIT", sql)
+        log_deletes = [query for query in queries.captured_queries if query["sql"].startswith('DELETE FROM "pages_log"')]
+        self.assertGreater(len(log_deletes), 1)
+
+    def test_hidden_room_is_purged_with_its_holding_home(self):
+        home = make_home(self.user, "Kept", rooms=2, assets=2, logs=3)
+        room = Room.objects.get(home=home, name="Room 0")
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_room(room)
+        self.assertEqual(Task.objects.filter(home=home).count(), 2)
+        self.assertTrue(Home.objects.filter(name=PURGE_HOME_NAME).exists())
+        [job] = claim("test", names=["purge_home"])
+        self.assertTrue(run(job))
+        self.assertFalse(Home.objects.filter(name=PURGE_HOME_NAME).exists())
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(Room.objects.filter(pk=room.pk).exists())
+        self.assertEqual(Log.objects.count(), 6)
+        self.assertEqual(list(Home.objects.all()), [home])
+
+    def test_task_is_deleted_right_away(self):
+        home = make_home(self.user, "Tasks", assets=2, logs=5)
+        task = Task.objects.filter(home=home).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_task(task)
+        self.assertFalse(Task.objects.filter(pk=task.pk).exists())
+        self.assertFalse(Log.objects.filter(task_id=task.pk).exists())
+        self.assertFalse(SearchEntry.objects.filter(task_id=task.pk).exists())
+        self.assertEqual(Log.objects.count(), 5)
+        self.assertTrue(Tombstone.objects.filter(home_id=home.home_id, model="task", object_id=task.pk).exists())
+        # No holding home, nothing left for a worker
+        self.assertEqual(list(Home.objects.all()), [home])
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(get_home_summary(home)["task_count"], 1)
+
+
+class CatalogUrlTests(AppTestCase):
+    def test_user_urls_stay_off_the_catalog(self):
+        other = AppUser.objects.create(username="other", email="other@example.com", password="unused")
+        mine = catalog_part(self.user, "GE", "M1", "DA29", Decimal("10.00"), "https://shop.example.com/da29")
+        shared = catalog_part(other, "GE", "M1", "DA29", Decimal("10.00"))
+        self.assertEqual(mine.owner_id, self.user.username)
+        self.assertIsNone(shared.owner_id)
+        self.assertEqual(shared.retail_url, "")
+        # Only the user's copy is ever repriced
+        self.assertEqual(list(due_parts()), [mine])
+        ConsumableDetails.objects.filter(pk=shared.pk).update(retail_url="https://shop.example.com/old")
+        self.assertEqual(list(due_parts()), [mine])
+
+
+class PartLookupTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.filter = catalog_part(self.user, "GE", "GFE28-GYNFS", "DA29-00020B", Decimal("45.00"))
+        self.hose = catalog_part(self.user, "LG", "WM-4000", "DA29 00003G", Decimal("12.00"))
+        catalog_part(self.user, "GE", "GFE28-GYNFS", "WR55X10025", Decimal("30.00"))
+        self.log_in()
+
+    def parts(self, **params):
+        response = self.client.get(reverse("api_parts"), params)
+        self.assertEqual(response.status_code, 200)
+        return [row["part_number"] for row in response.json()["results"]]
+
+    def test_part_numbers_are_matched_without_dashes_or_spaces(self):
+        for query in ("da29", "DA-29 00", "da2900"):
+            self.assertEqual(self.parts(q=query), ["DA29 00003G", "DA29-00020B"], query)
+        self.assertEqual(self.parts(q="da-29-00020"), ["DA29-00020B"])
+        self.assertEqual(self.parts(q="da29", brand="GE"), ["DA29-00020B"])
+        self.assertEqual(self.parts(q="gfe 28", field="model"), ["DA29-00020B", "WR55X10025"])
+        self.assertEqual(self.parts(q="da29", limit=1), ["DA29 00003G"])
+        self.assertEqual(self.parts(q=" - "), [])
+        for params in ({"q": "da29", "field": "name"}, {"q": "da29", "limit": "many"}, {"q": "da29", "brand": "Acme"}):
+            self.assertEqual(self.client.get(reverse("api_parts"), params).status_code, 400, params)
+
+    def test_only_catalog_parts_are_suggested(self):
+        # Copies with a user's own cost or shop link are theirs, the catalog row stays as it was
+        stranger = AppUser.objects.create(username="stranger", email="stranger@example.com", password="unused")
+        theirs = catalog_part(stranger, "GE", "GFE28-GYNFS", "DA29-00020B", Decimal("99.00"))
+        mine = catalog_part(self.user, "GE", "X1", "DA29-77777", 5, "https://shop.example.com/da29")
+        self.assertEqual((theirs.owner_id, mine.owner_id), ("stranger", "tester"))
+        rows = self.client.get(reverse("api_parts"), {"q": "da29"}).json()["results"]
+        self.assertEqual(
+            [(row["part_number"], row["estimated_cost"], row["retail_url"]) for row in rows],
+            [("DA29 00003G", "12.00", ""), ("DA29-00020B", "45.00", ""), ("DA29-77777", "5.00", "")],
+        )
+        self.assertNotIn(theirs.pk, [row["id"] for row in rows])
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api_parts"), {"q": "da29"}).status_code, 401)
+
+
+@override_settings(PRICE_FETCH_PRIVATE_HOSTS=True, PRICE_HOST_RATE=0, PRICE_FETCH_RETRIES=1, PRICE_FETCH_TIMEOUT=2)
+class PriceRefreshTests(AppTestCase):
+    def part(self, url):
+        return ConsumableDetails.objects.create(owner=self.user, part_number="P1", estimated_cost=1, retail_url=url)
+
+    def refresh(self, part):
+        stats = refresh_prices(parts=ConsumableDetails.objects.filter(pk=part.pk))
+        part.refresh_from_db()
+        return stats
+
+    def test_price_is_read_off_the_page(self):
+        with fixture_shops() as [shop]:
+            part = self.part(f"{shop.url}parts/17")
+            stats = self.refresh(part)
+        self.assertEqual(stats["updated"], 1)
+        self.assertEqual(part.estimated_cost, fixture_price(17))
+        self.assertIsNotNone(part.price_checked_at)
+
+    def test_busy_page_is_retried(self):
+        with fixture_shops(fail_every=1) as [shop]:
+            part = self.part(f"{shop.url}parts/5")
+            stats = self.refresh(part)
+            self.assertEqual(shop.requests, 2)
+        self.assertEqual((stats["retries"], stats["updated"]), (1, 1))
+        self.assertEqual(part.estimated_cost, fixture_price(5))
+
+    def test_missing_page_is_not_retried(self):
+        with fixture_shops() as [shop]:
+            part = self.part(f"{shop.url}nothing-here")
+            stats = self.refresh(part)
+            self.assertEqual(shop.requests, 1)
+        self.assertEqual((stats["failed"], stats["retries"]), (1, 0))
+        # Still due, the next run tries again
+        self.assertIsNone(part.price_checked_at)
+
+    @override_settings(PRICE_FETCH_TIMEOUT=0.1, PRICE_FETCH_RETRIES=0)
+    def test_timeout_leaves_the_part_due(self):
+        with fixture_shops(latency=0.5) as [shop]:
+            part = self.part(f"{shop.url}parts/3")
+            stats = self.refresh(part)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(part.estimated_cost, 1)
+        self.assertIsNone(part.price_checked_at)
+
+    def test_private_hosts_are_not_fetched(self):
+        with fixture_shops() as [shop], override_settings(PRICE_FETCH_PRIVATE_HOSTS=False):
+            for url in (f"{shop.url}parts/1", "http://169.254.169.254/latest/meta-data/", "http://[::1]/"):
+                stats = self.refresh(self.part(url))
+                self.assertEqual(stats["failed"], 1, url)
+            self.assertEqual(shop.requests, 0)
+
+    def test_every_redirect_hop_is_checked(self):
+        with fixture_shops() as [shop]:
+            shop.moved["/go/ok"] = "/parts/9"
+            shop.moved["/go/file"] = "file:///etc/passwd"
+            moved = self.part(f"{shop.url}go/ok")
+            self.assertEqual(self.refresh(moved)["updated"], 1)
+            self.assertEqual(self.refresh(self.part(f"{shop.url}go/file"))["failed"], 1)
+        self.assertEqual(moved.estimated_cost, fixture_price(9))
+
+    def test_retail_url_must_be_http(self):
+        asset = Asset.objects.get(room__home=make_home(self.user, "Urls"))
+        self.log_in()
+        for url in ("file:///etc/passwd", "gopher://example.com/", "not a url"):
+            response = self.client.post(
+                reverse("api_collection", args=["consumables"]),
+                {"asset_id": str(asset.asset_id), "part_number": "U1", "retail_url": url},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400, url)
+
+
+class PortfolioTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alpha = make_home(self.user, "Alpha", rooms=2, assets=2)
+        self.bravo = make_home(self.user, "Bravo")
+        self.charlie = Home.objects.create(name="Charlie")
+        HomeUserConnection.objects.create(home=self.charlie, user=self.user)
+        Task.objects.filter(home=self.alpha, room__name="Room 0", asset__name="Asset 0").update(
+            next_due_date=date.today() - timedelta(days=3)
+        )
+        # Someone else's home never counts
+        stranger = AppUser.objects.create(username="stranger", email="stranger@example.com", password="unused")
+        make_home(stranger, "Aardvark")
+        self.log_in(self.alpha)
+
+    def test_rollup_and_home_counts(self):
+        data = self.client.get(reverse("api_portfolio")).json()
+        rollup = data["portfolio"]
+        self.assertEqual(
+            {key: rollup[key] for key in ("homes", "rooms", "assets", "tasks", "overdue", "due_soon")},
+            {"homes": 3, "rooms": 3, "assets": 5, "tasks": 5, "overdue": 1, "due_soon": 4},
+        )
+        self.assertEqual([task["home_id"] for task in rollup["most_overdue"]], [str(self.alpha.home_id)])
+        homes = {row["name"]: row for row in data["results"]}
+        self.assertEqual(list(homes), ["Alpha", "Bravo", "Charlie"])
+        self.assertEqual(
+            {key: homes["Alpha"][key] for key in ("rooms", "assets", "tasks", "overdue", "due_soon")},
+            {"rooms": 2, "assets": 4, "tasks": 4, "overdue": 1, "due_soon": 3},
+        )
+        self.assertEqual((homes["Charlie"]["rooms"], homes["Charlie"]["tasks"], homes["Charlie"]["next_due"]), (0, 0, None))
+
+    def test_rollup_follows_writes(self):
+        self.assertEqual(self.client.get(reverse("api_portfolio")).json()["portfolio"]["tasks"], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(home=self.charlie, name="New", interval="yearly", next_due_date=date.today())
+        self.assertEqual(self.client.get(reverse("api_portfolio")).json()["portfolio"]["tasks"], 6)
+
+    def test_homes_are_paged_by_name(self):
+        first = self.client.get(reverse("api_portfolio"), {"limit": 2}).json()
+        self.assertEqual([row["name"] for row in first["results"]], ["Alpha", "Bravo"])
+        second = self.client.get(reverse("api_portfolio"), {"limit": 2, "cursor": first["next_cursor"]}).json()
+        self.assertEqual([row["name"] for row in second["results"]], ["Charlie"])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_bad_cursor(self):
+        for cursor in (encode_cursor(["zzz", "x"]), encode_cursor(["Alpha"]), "%%%"):
+            response = self.client.get(reverse("api_portfolio"), {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            # The page starts over from the first home
+            response = self.client.get(reverse("portfolio"), {"cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([row["name"] for row in response.context["homes"]], ["Alpha", "Bravo", "Charlie"])
+
+
+class RecurrenceTests(AppTestCase):
+    def test_months_clamp_without_drifting(self):
+        anchor = date(2026, 1, 31)
+        self.assertEqual(
+            [nth_occurrence("monthly", anchor, n) for n in range(1, 4)], [date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)]
+        )
+        self.assertEqual(next_occurrence("yearly", date(2024, 2, 29)), date(2025, 2, 28))
+        self.assertEqual(next_occurrence("quarterly", date(2026, 11, 30)), date(2027, 2, 28))
+        self.assertEqual(next_occurrence("every_n_weeks", anchor, every=2), date(2026, 2, 14))
+        self.assertEqual(next_occurrence("every_n_days", anchor, every=10), date(2026, 2, 10))
+        # One time tasks don't come around again
+        self.assertEqual(next_occurrence("", anchor), anchor)
+        self.assertEqual(occurrence_dates("", anchor, date(2027, 1, 1)), [anchor])
+
+    def test_occurrences_follow_the_due_date(self):
+        home = make_home(self.user, "Schedule")
+        task = Task.objects.get(home=home)
+        task.next_due_date = date(2026, 1, 31)
+        until = date(2026, 6, 30)
+        self.assertEqual(roll_forward(task, until), 6)
+        # Completing the first two moves the window on, only the stale rows go
+        kept = TaskOccurrence.objects.get(task=task, due_date=date(2026, 4, 30)).pk
+        task.next_due_date = date(2026, 3, 31)
+        self.assertEqual(roll_forward(task, until), 4)
+        self.assertEqual(
+            list(TaskOccurrence.objects.filter(task=task).order_by("due_date").values_list("due_date", flat=True)),
+            [date(2026, 3, 31), date(2026, 4, 30), date(2026, 5, 31), date(2026, 6, 30)],
+        )
+        self.assertTrue(TaskOccurrence.objects.filter(pk=kept).exists())
+        # materialize is safe to re-run
+        Task.objects.filter(pk=task.pk).update(next_due_date=task.next_due_date)
+        materialize(Task.objects.filter(pk=task.pk), until)
+        self.assertEqual(TaskOccurrence.objects.filter(task=task).count(), 4)
+
+    @override_settings(JOB_QUEUE=False)
+    def test_logging_a_completion_rolls_the_task_forward(self):
+        home = make_home(self.user, "Logged")
+        task = Task.objects.get(home=home)
+        self.log_in(home)
+        completed = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("api_collection", args=["logs"]),
+                {"task_id": str(task.task_id), "completion_date": completed.isoformat()},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 201)
+        first = TaskOccurrence.objects.filter(task=task).order_by("due_date").first()
+        self.assertEqual(first.due_date, next_occurrence("monthly", completed))
+        self.assertEqual(first.home_id, home.home_id)
+
+
+class ReminderTests(AppTestCase):
+    def remind(self, *args):
+        out = StringIO()
+        call_command("send_reminders", *args, stdout=out)
+        return out.getvalue()
+
+    def test_digest_is_sent_once_per_due_date(self):
+        home = make_home(self.user, "Reminded", assets=3)
+        Task.objects.create(home=home, name="Later", interval="yearly", next_due_date=date.today() + timedelta(days=30))
+        self.assertIn("Would send 1 digests", self.remind("--dry-run"))
+        self.assertEqual((len(mail.outbox), ReminderDelivery.objects.count()), (0, 0))
+
+        self.assertIn("Sent 1 digests", self.remind())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["tester@example.com"])
+        self.assertEqual(mail.outbox[0].subject, "Upkeep: 3 tasks due soon")
+        self.assertNotIn("Later", mail.outbox[0].body)
+        self.assertEqual(ReminderDelivery.objects.filter(user=self.user).count(), 3)
+
+        # A second run has nothing new to say
+        self.assertIn("Sent 0 digests. Scanned 3 due tasks (3 already reminded)", self.remind())
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Once a task is due again it's mailed again, on its own
+        Task.objects.filter(home=home, asset__name="Asset 0").update(next_due_date=date.today() - timedelta(days=2))
+        self.remind()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].subject, "Upkeep: 1 task due soon")
+        self.assertIn("2 days overdue", mail.outbox[1].body)
+
+
+class SyncTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.home = make_home(self.user, "Synced", assets=2, logs=2)
+        self.log_in(self.home)
+
+    def sync(self, since=None):
+        params = {"since": since} if since else {}
+        response = self.client.get(reverse("api_home_sync", args=[self.home.home_id]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    def test_full_sync_then_delta(self):
+        lines = self.sync()
+        resources = [line["resource"] for line in lines if line["type"] == "upsert"]
+        # Parents before children
+        self.assertEqual(resources, ["homes", "rooms"] + ["assets"] * 2 + ["consumables"] * 2 + ["tasks"] * 2 + ["logs"] * 4)
+        self.assertEqual(lines[-1]["type"], "sync")
+
+        # Everything so far is older than the token and its overlap
+        long_ago = timezone.now() - timedelta(days=2)
+        for model in (Home, Room, Asset, Consumable, ConsumableDetails, Task, Log):
+            model.objects.update(updated_at=long_ago)
+        token = encode_token(timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.sync(token)[:-1], [])
+
+        task = Task.objects.get(asset__name="Asset 0")
+        task.name = "Renamed"
+        task.save()
+        log = Log.objects.filter(task__asset__name="Asset 1").first()
+        log_id = log.pk
+        log.delete()
+        lines = self.sync(token)
+        self.assertEqual(
+            [(line["type"], line["resource"]) for line in lines[:-1]], [("upsert", "tasks"), ("delete", "logs")]
+        )
+        self.assertEqual(lines[0]["data"]["name"], "Renamed")
+        self.assertEqual(lines[1]["id"], str(log_id))
+        # Only the deleted row leaves a tombstone
+        self.assertEqual(Tombstone.objects.filter(home_id=self.home.home_id).count(), 1)
+
+    def test_bad_tokens(self):
+        url = reverse("api_home_sync", args=[self.home.home_id])
+        for token in ("%%%", encode_cursor(["yesterday"]), encode_cursor([datetime(2026, 1, 1).isoformat()])):
+            self.assertEqual(self.client.get(url, {"since": token}).status_code, 400, token)
+        # Tombstones that old are gone, the client has to start over
+        expired = encode_token(timezone.now() - timedelta(days=91))
+        response = self.client.get(url, {"since": expired})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()["errors"], ["Sync token has expired, do a full sync."])
+
+    def test_only_your_own_homes(self):
+        stranger = AppUser.objects.create(username="stranger", email="stranger@example.com", password="unused")
+        other = make_home(stranger, "Theirs")
+        self.assertEqual(self.client.get(reverse("api_home_sync", args=[other.home_id])).status_code, 404)
+
+
+class ExportTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.home = make_home(self.user, "Exported Home", assets=2, logs=2)
+        make_home(self.user, "Not This One")
+        self.log_in(self.home)
+
+    def export(self, **params):
+        response = self.client.get(reverse("export_home"), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_section(self):
+        response, body = self.export(format="csv", section="logs")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(f'filename="exported-home-logs-{date.today().isoformat()}.csv"', response["Content-Disposition"])
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual(rows[0], ["log_id", "task_id", "task", "room", "asset", "completion_date", "cost", "notes"])
+        # Only the current home's four logs
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({(row[3], row[6], row[7]) for row in rows[1:]}, {("Room 0", "5.00", "Done")})
+
+    def test_jsonl_and_zip(self):
+        _, body = self.export(format="jsonl")
+        types = [json.loads(line)["type"] for line in body.decode().splitlines()]
+        # Parents before children
+        self.assertEqual(types, ["room"] + ["asset"] * 2 + ["consumable"] * 2 + ["task"] * 2 + ["log"] * 4)
+
+        _, body = self.export(format="zip")
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            self.assertEqual(
+                archive.namelist(), ["rooms.csv", "assets.csv", "consumables.csv", "tasks.csv", "logs.csv", "history.jsonl"]
+            )
+            self.assertEqual(archive.read("history.jsonl"), self.export(format="jsonl")[1])
+            self.assertEqual(len(archive.read("tasks.csv").decode().splitlines()), 3)
+
+    def test_bad_format_or_section(self):
+        for params in ({"format": "xml"}, {"format": "csv", "section": "users"}):
+            self.assertEqual(self.client.get(reverse("export_home"), params).status_code, 400, params)
+
+
+class ActionTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.home = make_home(self.user, "Acting")
+        self.log_in(self.home)
+
+    def test_three_ways_to_answer(self):
+        url = reverse("add_room")
+        response = self.client.post(url, {"room_name": "Attic"}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        attic = Room.objects.get(home=self.home, name="Attic")
+        data = response.json()
+        self.assertEqual(data["messages"], [{"level": "success", "text": "Room added for you to organize."}])
+        self.assertEqual(data["options"], [{"list": "rooms", "value": str(attic.room_id), "label": "Attic"}])
+        self.assertIn(f'value="{attic.room_id}"', data["html"])
+
+        # A fetch gets just the fragment
+        response = self.client.post(url, {"room_name": "Cellar"}, HTTP_X_REQUESTED_WITH="fetch")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode().strip().count("<option"), 1)
+
+        # A plain form post is redirected back with a flash message
+        response = self.client.post(url, {"room_name": "Garage"})
+        self.assertRedirects(response, reverse("manage_homes"), fetch_redirect_response=False)
+        self.assertTrue(Room.objects.filter(home=self.home, name="Garage").exists())
+
+    def test_errors(self):
+        response = self.client.post(reverse("add_room"), {"room_name": " "}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["messages"], [{"level": "error", "text": "Room name is required."}])
+
+        # Someone else's task is as good as missing, and stays put
+        stranger = AppUser.objects.create(username="stranger", email="stranger@example.com", password="unused")
+        theirs = Task.objects.get(home=make_home(stranger, "Theirs"))
+        response = self.client.post(reverse("delete_task"), {"task_id": theirs.task_id}, HTTP_X_REQUESTED_WITH="fetch")
+        self.assertEqual((response.status_code, response.content), (404, b"Task was not found"))
+        self.assertTrue(Task.objects.filter(pk=theirs.pk).exists())
+
+        self.assertEqual(self.client.get(reverse("add_room")).status_code, 405)
+        self.client.logout()
+        response = self.client.post(reverse("add_room"), {"room_name": "Den"}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(reverse("add_room"), {"room_name": "Den"})
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+        self.assertFalse(Room.objects.filter(name="Den").exists())
+
+
+# A cheap hash, the point is which hash, not how slow it is
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000, LOGIN_USERNAME_LIMIT=3, LOGIN_IP_LIMIT=4)
+class LoginTests(AppTestCase):
+    def log_in_with(self, password, username="tester", **extra):
+        return self.client.post(reverse("login"), {"username": username, "password": password}, **extra)
+
+    def test_old_passwords_are_hashed_on_login(self):
+        # A row from before passwords were hashed
+        AppUser.objects.filter(pk=self.user.pk).update(password="hunter22")
+        self.assertEqual(self.log_in_with("wrong").status_code, 200)
+        self.assertEqual(AppUser.objects.get(pk=self.user.pk).password, "hunter22")
+        self.assertRedirects(self.log_in_with("hunter22"), reverse("dashboard"), fetch_redirect_response=False)
+        stored = AppUser.objects.get(pk=self.user.pk).password
+        self.assertTrue(stored.startswith("pbkdf2_sha256$1000$"))
+        self.assertEqual(authenticate("tester", "hunter22"), self.user)
+
+        # Raising the cost upgrades the hash on the next login
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(authenticate("tester", "hunter22"), self.user)
+        self.assertTrue(AppUser.objects.get(pk=self.user.pk).password.startswith("pbkdf2_sha256$2000$"))
+        self.assertIsNone(authenticate("nobody", "hunter22"))
+
+    def test_login_storms_are_turned_away(self):
+        AppUser.objects.filter(pk=self.user.pk).update(password=hash_password("hunter22"))
+        for _ in range(3):
+            self.assertEqual(self.log_in_with("wrong").status_code, 200)
+        # Even the right password, it's not checked at all
+        response = self.log_in_with("hunter22")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "300")
+        self.assertNotIn("username", self.client.session)
+
+        # Other usernames from the same address run into the per address limit
+        self.assertEqual(self.log_in_with("wrong", username="someone").status_code, 200)
+        self.assertEqual(self.log_in_with("wrong", username="someone").status_code, 429)
+        # Another address isn't held up
+        self.assertEqual(self.log_in_with("wrong", username="someone", REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+
+class CurrentHomeTests(AppTestCase):
+    def request(self, home=None):
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        request.session["username"] = self.user.username
+        if home is not None:
+            request.session["home_id"] = str(home.home_id)
+        return request
+
+    def test_user_is_cached_until_it_changes(self):
+        self.assertEqual(current_user(self.request()).email, "tester@example.com")
+        with self.assertNumQueries(0):
+            self.assertEqual(current_user(self.request()).email, "tester@example.com")
+        self.user.email = "new@example.com"
+        self.user.save()
+        self.assertEqual(current_user(self.request()).email, "new@example.com")
+
+    def test_session_home_needs_a_membership(self):
+        first = make_home(self.user, "A First")
+        second = make_home(self.user, "B Second")
+        self.assertEqual(current_home(self.request(second)), second)
+        with self.assertNumQueries(0):
+            self.assertEqual(current_home(self.request(second)), second)
+
+        # Taken off the home, they're back on their first one and the session says so
+        HomeUserConnection.objects.filter(home=second, user=self.user).delete()
+        request = self.request(second)
+        self.assertEqual(current_home(request), first)
+        self.assertEqual(request.session["home_id"], str(first.home_id))
+
+        HomeUserConnection.objects.filter(user=self.user).delete()
+        request = self.request(first)
+        self.assertIsNone(current_home(request))
+        self.assertNotIn("home_id", request.session)
+
+        request = self.request()
+        request.session.flush()
+        self.assertIsNone(current_user(request))
+        self.assertIsNone(current_home(request))
+
+
+@override_settings(JOB_QUEUE=True, JOB_RETRY_BACKOFF=5)
+class JobQueueTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        job("test_job", max_attempts=2)(self.work)
+        job("test_urgent", priority=5)(self.work)
+        self.addCleanup(JOBS.pop, "test_job")
+        self.addCleanup(JOBS.pop, "test_urgent")
+
+    def work(self, value, fail=False):
+        self.calls.append(value)
+        if fail:
+            raise RuntimeError("Nope")
+
+    def test_claim_and_run(self):
+        enqueue("test_job", value="later")
+        queued = enqueue("test_urgent", value="first")
+        self.assertEqual((queued.priority, queued.max_attempts), (5, 3))
+        jobs = claim("one", limit=1)
+        self.assertEqual([row.name for row in jobs], ["test_urgent"])
+        # Nobody else gets a claimed job
+        self.assertEqual([row.name for row in claim("two")], ["test_job"])
+        self.assertEqual(claim("three"), [])
+        self.assertTrue(run(jobs[0]))
+        self.assertEqual(self.calls, ["first"])
+        self.assertEqual(list(Job.objects.values_list("name", flat=True)), ["test_job"])
+
+    def test_failures_back_off_then_fail(self):
+        queued = enqueue("test_job", value="x", fail=True)
+        with self.assertLogs("pages.jobs", "ERROR"):
+            self.assertFalse(run(claim("one")[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.QUEUED, 1))
+        self.assertIn("RuntimeError: Nope", queued.last_error)
+        self.assertGreater(queued.available_at, timezone.now() + timedelta(seconds=4))
+        self.assertEqual(claim("one"), [])
+
+        Job.objects.update(available_at=timezone.now())
+        with self.assertLogs("pages.jobs", "ERROR"):
+            self.assertFalse(run(claim("one")[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 2))
+        self.assertEqual(claim("one"), [])
+
+        self.assertEqual(retry_failed(["test_job"]), 1)
+        Job.objects.update(payload={"value": "y"})
+        self.assertTrue(run(claim("one")[0]))
+        self.assertEqual(self.calls, ["x", "x", "y"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_without_the_queue_jobs_run_after_commit(self):
+        with self.settings(JOB_QUEUE=False), self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(enqueue("test_job", value="inline"))
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, ["inline"])
+        self.assertFalse(Job.objects.exists())
+
+
+class SearchTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.home = make_home(self.user, "Searched", logs=0)
+        self.asset = Asset.objects.create(
+            room=Room.objects.get(home=self.home), name="Water Heater", brand="Rheem", model_number="XE-40"
+        )
+        self.task = Task.objects.create(
+            home=self.home, asset=self.asset, name="Replace anode", interval="yearly", next_due_date=date.today()
+        )
+        self.log = Log.objects.create(task=self.task, completion_date=date.today(), notes="Swapped the anode rod")
+        # The same words in someone else's home
+        stranger = AppUser.objects.create(username="stranger", email="stranger@example.com", password="unused")
+        theirs = make_home(stranger, "Theirs", logs=0)
+        asset = Asset.objects.create(room=Room.objects.get(home=theirs), name="Water Heater", model_number="XE-40")
+        Task.objects.create(home=theirs, asset=asset, name="Replace anode", interval="yearly", next_due_date=date.today())
+        self.log_in(self.home)
+
+    def search(self, **params):
+        response = self.client.get(reverse("api_search"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_finds_only_your_own(self):
+        results = self.search(q="anode")["results"]
+        self.assertEqual(
+            {(row["kind"], row["id"]) for row in results}, {("task", str(self.task.task_id)), ("log", str(self.log.log_id))}
+        )
+        self.assertEqual({row["home_id"] for row in results}, {str(self.home.home_id)})
+        log = self.search(q="rod", kind="log")["results"]
+        self.assertEqual(
+            [(row["name"], row["text"], row["completion_date"]) for row in log],
+            [("Replace anode", "Swapped the anode rod", date.today().isoformat())],
+        )
+        # Stemmed words, and part numbers without their dashes
+        for query in ("heaters", "xe40", "RHEEM xe-40"):
+            results = self.search(q=query, kind="asset")["results"]
+            self.assertEqual([row["id"] for row in results], [str(self.asset.asset_id)], query)
+        self.assertEqual(self.search(q="anode", kind="consumable")["results"], [])
+
+    def test_pages_and_bad_queries(self):
+        first = self.search(q="anode", limit=1)
+        second = self.search(q="anode", limit=1, cursor=first["next_cursor"])
+        self.assertEqual(len(first["results"] + second["results"]), 2)
+        self.assertNotEqual(first["results"], second["results"])
+        self.assertIsNone(second["next_cursor"])
+
+        for params in ({"q": "anode", "cursor": encode_cursor(["x", "y"])}, {"q": "anode", "cursor": "%%%"}, {"q": " -- "}):
+            self.assertEqual(self.client.get(reverse("api_search"), params).status_code, 400, params)
+        # The page just starts over
+        response = self.client.get(reverse("search"), {"q": "anode", "cursor": "%%%"})
+        self.assertEqual(len(response.context["results"]), 2)
+
+
+class CalendarFeedTests(AppTestCase):
+    def test_rules_match_the_recurrence_engine(self):
+        self.assertEqual(recurrence_rule("monthly", 1, date(2026, 1, 15)), "FREQ=MONTHLY;INTERVAL=1")
+        self.assertEqual(
+            recurrence_rule("monthly", 1, date(2026, 1, 31)), "FREQ=MONTHLY;INTERVAL=1;BYMONTHDAY=28,29,30,31;BYSETPOS=-1"
+        )
+        self.assertEqual(recurrence_rule("quarterly", 4, date(2026, 1, 1)), "FREQ=YEARLY;INTERVAL=1")
+        self.assertEqual(
+            recurrence_rule("yearly", 1, date(2028, 2, 29)), "FREQ=YEARLY;INTERVAL=1;BYMONTH=2;BYMONTHDAY=28,29;BYSETPOS=-1"
+        )
+        self.assertEqual(recurrence_rule("every_n_days", 14, date(2026, 1, 1)), "FREQ=WEEKLY;INTERVAL=2")
+        self.assertEqual(recurrence_rule("every_n_days", 10, date(2026, 1, 1)), "FREQ=DAILY;INTERVAL=10")
+        self.assertIsNone(recurrence_rule("", 1, date(2026, 1, 1)))
+
+    def test_long_lines_fold_between_characters(self):
+        line = "SUMMARY:" + "Entkalkung der Kaffeemaschine, Wasserhärte prüfen ☕ " * 4
+        folded = fold(line)
+        self.assertTrue(folded.endswith("\r\n"))
+        parts = folded[:-2].split("\r\n")
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(len(part.encode()) <= 75 for part in parts))
+        self.assertTrue(all(part.startswith(" ") for part in parts[1:]))
+        self.assertEqual(parts[0] + "".join(part[1:] for part in parts[1:]), line)
+        self.assertEqual(fold("SUMMARY:Short"), "SUMMARY:Short\r\n")
+
+    def test_feed_and_conditional_gets(self):
+        home = make_home(self.user, "Calendar; Home", assets=2)
+        Task.objects.filter(home=home, asset__name="Asset 1").update(interval="", name="Once, only")
+        url = reverse("calendar_feed", args=[new_feed(self.user, home).token])
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        body = b"".join(response.streaming_content).decode()
+        self.assertTrue(body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n"))
+        self.assertEqual(body.count("BEGIN:VEVENT"), 2)
+        self.assertEqual(body.count("RRULE:FREQ=MONTHLY;INTERVAL=1\r\n"), 1)
+        self.assertIn("SUMMARY:Once\\, only (Asset 1)\r\n", body)
+        self.assertIn("LOCATION:Calendar\\; Home\\, Room 0\r\n", body)
+
+        # Unchanged, the tasks aren't read at all
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+        # The link stops working when its user leaves the home, and when it's replaced
+        new_feed(self.user, home)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse("calendar_feed", args=[CalendarFeed.objects.get(home=home).token])
+        HomeUserConnection.objects.filter(home=home).delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AsyncViewTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        # urls.py picks the views when it's imported
+        with self.settings(ASYNC_VIEWS=True):
+            self.route_views()
+        self.addCleanup(self.route_views)
+        self.home = make_home(self.user, "Async", assets=3, logs=2)
+        self.log_in(self.home)
+
+    def route_views(self):
+        # The project urls hold on to the resolver of the old pages urls
+        importlib.reload(urls)
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def test_pages_match_the_sync_ones(self):
+        self.assertIs(resolve(reverse("dashboard")).func, async_views.dashboard_view)
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["tasks"]), 3)
+        self.assertEqual(len(response.context["logs"]), 6)
+        self.assertEqual(response.context["summary"], get_home_summary(self.home))
+        self.assertEqual(self.client.get(reverse("manage_homes")).status_code, 200)
+
+        self.assertEqual(self.client.get(reverse("dashboard_logs")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("dashboard_tasks"), {"cursor": "%%%"}).status_code, 400)
+        self.client.logout()
+        self.assertRedirects(self.client.get(reverse("dashboard")), reverse("login"), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse("dashboard_logs")).status_code, 401)
+
+    def test_api(self):
+        self.assertTrue(iscoroutinefunction(resolve(reverse("api_collection", args=["tasks"])).func))
+        rows = self.client.get(reverse("api_collection", args=["tasks"])).json()["results"]
+        self.assertEqual(len(rows), 3)
+        task = self.client.get(reverse("api_detail", args=["tasks", rows[0]["task_id"]])).json()
+        self.assertEqual(task["name"], "Check it")
+        self.assertEqual(self.client.get(reverse("api_collection", args=["tasks"]), {"cursor": "%%%"}).status_code, 400)
+        # Writes go through the sync code
+        response = self.client.patch(
+            reverse("api_detail", args=["tasks", rows[0]["task_id"]]), {"name": "Checked"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects.get(pk=rows[0]["task_id"]).name, "Checked")
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api_collection", args=["tasks"])).status_code, 401)
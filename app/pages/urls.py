@@ -1,12 +1,50 @@
+from django.conf import settings
 from django.urls import path
-from . import views, ui_views
+from . import actions, analytics, api, async_views, completion, export, feeds, importer, portfolio, search, sync, views, ui_views
+
+# The read heavy pages and the JSON API have sync and async versions, see async_views.py
+pages = async_views if settings.ASYNC_VIEWS else views
+api_views = async_views if settings.ASYNC_VIEWS else api
 
 urlpatterns = [
     path("login/", views.login_view, name="login"),
     path("register/", views.register_view, name="register"),
-    path("dashboard/", views.dashboard_view, name="dashboard"),
-    path("manage-homes/", views.manage_homes_view, name="manage_homes"),
+    path("dashboard/", pages.dashboard_view, name="dashboard"),
+    path("dashboard/tasks/", pages.dashboard_panel_view, {"panel": "tasks"}, name="dashboard_tasks"),
+    path("dashboard/logs/", pages.dashboard_panel_view, {"panel": "logs"}, name="dashboard_logs"),
+    path("manage-homes/", pages.manage_homes_view, name="manage_homes"),
+    path("manage-homes/import/", importer.import_assets_view, name="import_assets"),
+    path("export/", export.export_home_view, name="export_home"),
+    path("analytics/", analytics.analytics_view, name="analytics"),
+    path("portfolio/", portfolio.portfolio_view, name="portfolio"),
+    path("search/", search.search_view, name="search"),
+    path("calendar/", feeds.calendar_view, name="calendar"),
+    path("calendar/<str:token>.ics", feeds.calendar_feed, name="calendar_feed"),
     path("logout/", views.logout_view, name="logout"),
+
+    # One endpoint per form action, see actions.py
+    path("actions/switch-home/", actions.switch_home, name="switch_home"),
+    path("actions/delete-task/", actions.delete_task, name="delete_task"),
+    path("actions/delete-room/", actions.delete_room, name="delete_room"),
+    path("actions/delete-asset/", actions.delete_asset, name="delete_asset"),
+    path("actions/update-home/", actions.update_home, name="update_home"),
+    path("actions/add-home/", actions.add_home, name="add_home"),
+    path("actions/add-room/", actions.add_room, name="add_room"),
+    path("actions/add-asset/", actions.add_asset, name="add_asset"),
+    path("actions/add-task/", actions.add_task, name="add_task"),
+    path("actions/add-log/", actions.add_log, name="add_log"),
+    path("actions/complete-tasks/", actions.complete_tasks, name="complete_tasks"),
+    path("actions/calendar-link/", actions.calendar_link, name="calendar_link"),
+
+    # JSON API, see api.py
+    path("api/analytics/", analytics.analytics_api, name="api_analytics"),
+    path("api/portfolio/", portfolio.portfolio_api, name="api_portfolio"),
+    path("api/parts/", api.api_parts, name="api_parts"),
+    path("api/search/", search.search_api, name="api_search"),
+    path("api/tasks/complete/", completion.complete_tasks_api, name="api_complete_tasks"),
+    path("api/homes/<uuid:home_id>/sync/", sync.home_sync, name="api_home_sync"),
+    path("api/<str:resource>/", api_views.api_collection, name="api_collection"),
+    path("api/<str:resource>/<uuid:pk>/", api_views.api_detail, name="api_detail"),
     
     # UI Prototypes
     path("ui/dashboard/", ui_views.ui_dashboard, name="ui_dashboard"),